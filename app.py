@@ -1,27 +1,44 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, g, Response
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 import logging
-import traceback
 from datetime import datetime
 import hashlib
 import hmac
 import base64
 import time
 import json # Added for Power BI Desktop friendly endpoints
+import atexit
+from contextlib import contextmanager
+from functools import wraps
 
-# Import enhanced models
-from models.enhanced_ai_models import (
-    SecurityManager,
-    AutoErrorRecovery,
-    EnhancedDAXGenerator,
-    EnhancedChartRecommender,
-    EnhancedInsightGenerator,
-    EnhancedAnomalyDetector,
-    EnhancedForecastingModel,
-    EnhancedSQLGenerator
-)
+from services.anomaly import AnomalyOptionsError, parse_options as parse_anomaly_options
+from services.anomaly import detect_anomalies as score_anomalies
+from services.columnar import ingest_dataset
+from services.datasets import DatasetStoreError, create_dataset_store
+from services.result_cache import create_result_cache, make_key
+from services.semantic_cache import create_semantic_cache
+from services.series_state import SeriesStateError, create_series_store
+from services.single_flight import SingleFlight
+from services.sketches import ProfileModeError, choose_profile_mode, sketch_profile
+from services.batch import run_batch
+from services.errors import ErrorLog
+from services.http_cache import choose_encoding, compress, etag_matches, input_etag
+from services.executor import create_model_backend
+from services.forecast import ForecastOptionsError, forecast_ensemble
+from services.forecast import parse_options as parse_forecast_options
+from services.jobs import QueueFullError, create_job_manager
+from services.llm_client import CircuitOpenError, ClientBusyError, create_upstream_guard
+from services.metrics import MetricsStore, render_prometheus
+from services.query_engine import DEFAULT_PREVIEW_ROWS, QueryError, execute_query, generated_query_text
+from services.rate_limit import classify_path, create_rate_limiter
+from services.registry import ModelRegistry
+from services.rollup import RollupError, create_rollup_cache
+from services.rollup import parse_options as parse_rollup_options
+from services.streaming import StreamingError, is_streaming_upload, read_streaming_dataset
+from services.wire import PACKAGES, encode_payload, format_available, negotiate, read_binary_payload
+from services.wire import unacceptable, wire_format
 
 # Load environment variables
 load_dotenv()
@@ -33,64 +50,141 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'powerbi-tools-secret-2024')
 API_KEY = os.getenv('PBI_DESKTOP_API_KEY', 'dev-key')
+COMPRESS_RESPONSES = os.getenv('COMPRESS_RESPONSES', 'true').lower() in ('1', 'true', 'yes')
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+ETAG_SALT = os.getenv('ETAG_SALT', '')
 
 # Enable CORS with enhanced security
 CORS(app, resources={
     r"/api/*": {
         "origins": ["*"],
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "x-api-key"]
+        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "x-api-key", "X-Client-Id"]
     }
 })
 
-# Initialize enhanced components
-security_manager = SecurityManager()
-error_recovery = AutoErrorRecovery()
+# Security, error recovery and AI models, each imported and built on first use
+model_registry = ModelRegistry()
 
-# Initialize enhanced AI models
-enhanced_dax_generator = EnhancedDAXGenerator()
-enhanced_chart_recommender = EnhancedChartRecommender()
-enhanced_insight_generator = EnhancedInsightGenerator()
-enhanced_anomaly_detector = EnhancedAnomalyDetector()
-enhanced_forecasting_model = EnhancedForecastingModel()
-enhanced_sql_generator = EnhancedSQLGenerator()
+# Execution backend for the CPU-bound dataset models (inline or process pool)
+model_backend = create_model_backend(model_registry)
+
+# Background jobs for long-running forecasts and anomaly detection
+job_manager = create_job_manager()
+
+# Per-user token-bucket rate limiting
+rate_limiter = create_rate_limiter()
+
+# Result cache in front of the dataset analytics models
+result_cache = create_result_cache()
+
+# Time-bucket rollups of forecast/insight inputs, keyed by dataset hash and granularity
+rollup_cache = create_rollup_cache()
+
+# Coalesces identical in-flight model calls (e.g. a shared report refreshing for many viewers)
+request_coalescer = SingleFlight()
+
+# Semantic cache for near-duplicate DAX/SQL requirements
+semantic_cache = create_semantic_cache()
+atexit.register(semantic_cache.save)
+
+# Concurrency cap and circuit breaker around the generators' upstream LLM calls
+llm_guard = create_upstream_guard()
+
+# Upload-once datasets (memory-mapped columnar files) referenced by dataset_id
+dataset_store = create_dataset_store()
+
+# Append-only anomaly/forecast state for registered series
+series_store = create_series_store()
+atexit.register(series_store.save)
 
 # Global performance monitoring
-performance_metrics = {}
-error_log = []
+performance_metrics = MetricsStore()
+request_metrics = MetricsStore()  # keyed by (route, method, status) for /metrics
+stage_metrics = MetricsStore()    # keyed by (endpoint, stage) for /metrics
+error_log = ErrorLog()
 
 def log_performance(endpoint: str, execution_time: float, success: bool, error: str = None):
     """Log performance metrics for monitoring"""
-    if endpoint not in performance_metrics:
-        performance_metrics[endpoint] = []
-    
-    performance_metrics[endpoint].append({
-        'timestamp': datetime.now(),
-        'execution_time': execution_time,
-        'success': success,
-        'error': error
+    performance_metrics.record(endpoint, execution_time, success, error)
+
+@contextmanager
+def timed_stage(endpoint: str, stage: str):
+    """Time one stage of a request (parse, validate, ingest, model, serialize, recovery)"""
+    stage_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_metrics.record((endpoint, stage), time.perf_counter() - stage_start, True)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.before_request
+def enforce_rate_limit():
+    """Reject over-limit clients before the request body is parsed"""
+    endpoint_class = classify_path(request.path, request.method)
+    if endpoint_class is None or request.method == 'OPTIONS':
+        return None
+    allowed, retry_after = rate_limiter.acquire(rate_limit_key(request), endpoint_class)
+    if allowed:
+        return None
+    response = jsonify({
+        'success': False,
+        'error': 'Rate limit exceeded',
+        'retry_after': round(retry_after, 2)
     })
-    
-    # Keep only last 1000 entries
-    if len(performance_metrics[endpoint]) > 1000:
-        performance_metrics[endpoint] = performance_metrics[endpoint][-1000:]
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+@app.before_request
+def check_wire_formats():
+    """415 for an Arrow/MessagePack body, 406 for an Accept of only those, when their library is not installed"""
+    fmt = wire_format(request.mimetype)
+    if fmt is not None and not format_available(fmt):
+        return jsonify({'success': False,
+                        'error': f"This server cannot read {fmt} bodies ({PACKAGES[fmt]} is not installed); send JSON"}), 415
+    fmt = unacceptable(request.headers.get('Accept', ''))
+    if fmt is not None and request.path.startswith('/api/'):
+        return jsonify({'success': False,
+                        'error': f"This server cannot answer in {fmt} ({PACKAGES[fmt]} is not installed); "
+                                 f"accept application/json"}), 406
+    return None
+
+@app.after_request
+def compress_response(response):
+    """gzip/brotli for large buffered bodies, per Accept-Encoding"""
+    if (not COMPRESS_RESPONSES or response.direct_passthrough or response.status_code < 200
+            or response.status_code in (204, 206, 304) or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None or response.calculate_content_length() < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        # A strong ETag names one exact byte sequence, so each coding gets its own
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_metrics.record((route, request.method, str(response.status_code)),
+                               time.perf_counter() - start, response.status_code < 500)
+    return response
 
 def log_error(error: Exception, context: dict = None):
     """Log errors for monitoring and debugging"""
-    error_entry = {
-        'timestamp': datetime.now(),
-        'error_type': type(error).__name__,
-        'error_message': str(error),
-        'traceback': traceback.format_exc(),
-        'context': context or {}
-    }
-    error_log.append(error_entry)
-    
-    # Keep only last 1000 errors
-    if len(error_log) > 1000:
-        error_log.pop(0)
-    
-    logger.error(f"Error logged: {error_entry}")
+    group = error_log.capture(error, context)
+    logger.error(f"Error logged: {group.error_type}: {group.message} "
+                 f"(fingerprint {group.fingerprint}, seen {group.count}x)")
 
 def validate_request(request_data: dict) -> tuple[bool, str]:
     """Validate incoming request data"""
@@ -106,6 +200,151 @@ def validate_request(request_data: dict) -> tuple[bool, str]:
     
     return True, ""
 
+def read_dataset_payload(**json_kwargs):
+    """Read the JSON body, or stream an NDJSON/CSV upload or decode an Arrow/MessagePack body into columns"""
+    if is_streaming_upload(request.mimetype):
+        # Streamed bodies carry only rows; other parameters come from the query string
+        data = request.args.to_dict()
+        data['dataset'] = read_streaming_dataset(request.stream, request.mimetype)
+        return data
+    if wire_format(request.mimetype):
+        data = request.args.to_dict()
+        data.update(read_binary_payload(request.get_data(), request.mimetype))
+        return data
+    return request.get_json(**json_kwargs)
+
+def respond(payload):
+    """JSON response, or Arrow IPC / MessagePack when the client asks for (or sent) one"""
+    fmt = negotiate(request.headers.get('Accept', ''), request.mimetype)
+    if fmt is None:
+        return jsonify(payload)
+    body, mimetype = encode_payload(payload, fmt)
+    return Response(body, mimetype=mimetype)
+
+def load_dataset(data, dataset=None):
+    """Frame for a request: a leased `dataset_id` from the dataset store, or the inline dataset"""
+    dataset_id = data.get('dataset_id')
+    if not dataset_id:
+        return ingest_dataset(data.get('dataset', []) if dataset is None else dataset)
+    frame = dataset_store.acquire(str(dataset_id))
+    g.setdefault('dataset_leases', []).append(str(dataset_id))
+    return frame
+
+@app.teardown_request
+def release_dataset_leases(error=None):
+    for dataset_id in g.pop('dataset_leases', []):
+        dataset_store.release(dataset_id)
+
+def lease_job_dataset(data):
+    """Frame for a background job and the callback that gives its dataset store lease back when the job ends"""
+    dataset_id = data.get('dataset_id')
+    if not dataset_id:
+        return ingest_dataset(data.get('dataset', [])), None
+    frame = dataset_store.acquire(str(dataset_id))
+    return frame, lambda: dataset_store.release(str(dataset_id))
+
+def cached_model_call(endpoint: str, dataset, compute, **params):
+    """Run a model call through the content-addressed result cache"""
+    key = make_key(endpoint, dataset, params)
+    found, result = result_cache.get(key)
+    if found:
+        return result
+    # Identical requests already in flight wait for that computation instead of repeating it
+    return request_coalescer.do(key, lambda: result_cache.put_result(key, compute()))
+
+def with_rollup(dataset, rollup_options, run, on_stage=None):
+    """Roll the dataset up to per-period series (when requested) before `run`, and report the rollup"""
+    if on_stage is not None:
+        on_stage('rollup')
+    dataset, summary = rollup_cache.get_or_build(dataset, rollup_options)
+    if on_stage is not None:
+        on_stage('model')
+    result = run(dataset)
+    if summary is None or not isinstance(result, dict):
+        return result
+    return {**result, 'rollup': summary}
+
+def run_profiled_model(endpoint: str, model_name: str, dataset, profile_mode, *args, rollup=None, profile=None):
+    """Profile-driven models: full data unless the client opts into sketch profiling (auto or sketch)
+
+    `profile` is the dataset's exact column profile when the caller already has one (analyze-batch);
+    sketch mode then only draws the row sample.
+    """
+    if rollup is not None:
+        return with_rollup(dataset, rollup, lambda frame: run_profiled_model(endpoint, model_name, frame,
+                                                                             profile_mode, *args))
+    if choose_profile_mode(profile_mode, len(dataset)) == 'exact':
+        return cached_model_call(endpoint, dataset, lambda: model_backend.call(model_name, 'analyze', dataset, *args))
+    def compute():
+        sketch, sample = sketch_profile(dataset, column_profile=profile)
+        result = model_backend.call(model_name, 'analyze', sample, *args)
+        if isinstance(result, dict):
+            # The model only saw the sample; exact counts, sums and extremes are in the sketch profile
+            result = {**result, 'profile_mode': 'sketch', 'sampled': True, 'sample_rows': sketch['sample_rows'],
+                      'total_rows': sketch['rows'], 'sketch_profile': sketch}
+        return result
+    return cached_model_call(endpoint, dataset, compute, profile_mode='sketch')
+
+def run_anomaly_detection(dataset, options, *args, cancel_event=None, profile=None):
+    """Model detector, or the vectorized engine (which reuses `profile` when given) for columns/methods"""
+    if options is None:
+        return cached_model_call('detect-anomalies', dataset,
+                                 lambda: model_backend.call('anomaly_detector', 'detect', dataset, *args,
+                                                            cancel_event=cancel_event))
+    return cached_model_call('detect-anomalies', dataset, lambda: score_anomalies(dataset, profile=profile, **options),
+                             engine='vectorized', **options)
+
+def run_forecast(dataset, horizon, options, *args, cancel_event=None, rollup=None, on_stage=None, profile=None):
+    """Model forecaster, or the parallel ensemble (which reuses `profile` when given) for grouped series"""
+    if rollup is not None:
+        return with_rollup(dataset, rollup, lambda frame: run_forecast(frame, horizon, options, *args,
+                                                                       cancel_event=cancel_event),
+                           on_stage=on_stage)
+    if on_stage is not None:
+        on_stage('model')
+    if options is None:
+        return cached_model_call('forecast', dataset,
+                                 lambda: model_backend.call('forecasting_model', 'predict', dataset, horizon, *args,
+                                                            cancel_event=cancel_event),
+                                 horizon=horizon)
+    return cached_model_call('forecast', dataset, lambda: forecast_ensemble(dataset, horizon, profile=profile, **options),
+                             horizon=horizon, engine='ensemble', **options)
+
+def run_series_update(series_id, dataset, data, horizon=None):
+    """Stateful mode: fold only the new rows into the client's series state (registering it on first use)"""
+    if horizon is not None and int(horizon) < 1:
+        raise SeriesStateError("horizon must be at least 1")
+    owner = series_owner(data)
+    reset = str(data.get('reset', '')).lower() in ('1', 'true', 'yes')
+    update = series_store.append(owner, series_id, dataset, data, reset=reset)
+    if horizon is None:
+        return {'success': True, **update}
+    return {'success': True, **update, **series_store.forecast(owner, series_id, int(horizon))}
+
+def guarded_generation(kind: str, requirement: str, generate):
+    """Semantic cache, then the generator behind the upstream concurrency cap and circuit breaker"""
+    try:
+        return semantic_cache.get_or_generate(kind, requirement, lambda: llm_guard.call(generate))
+    except (CircuitOpenError, ClientBusyError) as e:
+        # Fail fast to the recovery fallbacks while the upstream is unhealthy or saturated (and keep them out of the cache)
+        return model_registry['error_recovery'].auto_recover(e, {'requirement': requirement})
+
+def with_query_preview(data, result, language: str):
+    """Run the generated query against the request's dataset (if any) and attach the rows as `preview`"""
+    if not (data.get('dataset') or data.get('dataset_id')) or not isinstance(result, dict):
+        return result
+    query = generated_query_text(result)
+    if not query:
+        return result
+    try:
+        preview = execute_query(load_dataset(data), query, language,
+                                limit=data.get('preview_rows', DEFAULT_PREVIEW_ROWS))
+    except (ValueError, TypeError) as e:
+        # A query the local engine cannot run is still a valid generation
+        preview = {'success': False, 'error': str(e)}
+    # The generator result may be shared through the semantic cache, so it is copied rather than updated
+    return {**result, 'preview': preview}
+
 def generate_user_id(request) -> str:
     """Generate a unique user ID for rate limiting"""
     # Use IP address and user agent for identification
@@ -113,6 +352,29 @@ def generate_user_id(request) -> str:
     user_agent = request.headers.get('User-Agent', '')
     return hashlib.md5(f"{ip}:{user_agent}".encode()).hexdigest()
 
+def rate_limit_key(request) -> str:
+    """Rate limit bucket: the X-Client-Id header or the Authorization credential when sent, else IP and User-Agent
+
+    x-api-key is not used: PBI_DESKTOP_API_KEY is one key shared by every client.
+    """
+    client_id = request.headers.get('X-Client-Id')
+    if client_id:
+        return f"client:{client_id}"
+    authorization = request.headers.get('Authorization')
+    if authorization:
+        return 'auth:' + hashlib.sha256(authorization.encode()).hexdigest()
+    return generate_user_id(request)
+
+def series_owner(data=None) -> str:
+    """Scope of a request's series state: the client's X-Client-Id header or client_id parameter,
+    else (for clients that send neither) its IP and User-Agent"""
+    client_id = request.headers.get('X-Client-Id') or request.args.get('client_id')
+    if not client_id and isinstance(data, dict):
+        client_id = data.get('client_id')
+    if client_id:
+        return f"client:{client_id}"
+    return generate_user_id(request)
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -126,6 +388,28 @@ def _check_api_key() -> bool:
     key = request.headers.get('x-api-key') or request.args.get('api_key')
     return (API_KEY and key == API_KEY)
 
+def conditional_get(view):
+    """Strong ETag from the query string for deterministic GETs; If-None-Match hits skip the view entirely"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Registered series are stateful, so their responses are never validated
+        if request.method != 'GET' or request.args.get('series_id') or not _check_api_key():
+            return view(*args, **kwargs)
+        variant = negotiate(request.headers.get('Accept', ''))
+        etag = input_etag(request.path, request.args.items(multi=True), variant, ETAG_SALT)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            response = Response(status=304)
+        else:
+            response = app.make_response(view(*args, **kwargs))
+            payload = response.get_json(silent=True) if response.is_json else None
+            if response.status_code != 200 or (payload is not None and not payload.get('success')):
+                return response
+        response.set_etag(etag.strip('"'))
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.update(('Accept', 'Accept-Encoding', 'x-api-key'))
+        return response
+    return wrapper
+
 @app.route('/api/powerbi/generate-dax', methods=['GET', 'POST'])
 def pbi_generate_dax():
     if not _check_api_key():
@@ -136,87 +420,114 @@ def pbi_generate_dax():
             requirement = data.get('requirement', '')
         else:
             requirement = request.args.get('requirement', '')
-        result = enhanced_dax_generator.generate(requirement)
+        result = guarded_generation('dax', requirement, lambda: model_registry['dax_generator'].generate(requirement))
         return jsonify({'success': True, 'result': result})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/powerbi/recommend-chart', methods=['GET', 'POST'])
+@conditional_get
 def pbi_recommend_chart():
     if not _check_api_key():
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     try:
         if request.method == 'POST':
-            data = request.get_json(force=True, silent=True) or {}
+            data = read_dataset_payload(force=True, silent=True) or {}
             dataset = data.get('dataset', [])
         else:
+            data = request.args
             # For GET, allow dataset as JSON string
             dataset_str = request.args.get('dataset', '[]')
             try:
                 dataset = json.loads(dataset_str)
             except Exception:
                 dataset = []
-        result = enhanced_chart_recommender.analyze(dataset)
-        return jsonify({'success': True, 'result': result})
+        dataset = load_dataset(data, dataset)
+        result = run_profiled_model('recommend-chart', 'chart_recommender', dataset, data.get('profile_mode'))
+        return respond({'success': True, 'result': result})
+    except (StreamingError, ProfileModeError, DatasetStoreError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/powerbi/generate-insights', methods=['GET', 'POST'])
+@conditional_get
 def pbi_generate_insights():
     if not _check_api_key():
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     try:
         if request.method == 'POST':
-            data = request.get_json(force=True, silent=True) or {}
+            data = read_dataset_payload(force=True, silent=True) or {}
             dataset = data.get('dataset', [])
         else:
+            data = request.args
             dataset_str = request.args.get('dataset', '[]')
             try:
                 dataset = json.loads(dataset_str)
             except Exception:
                 dataset = []
-        result = enhanced_insight_generator.analyze(dataset)
-        return jsonify({'success': True, 'result': result})
+        dataset = load_dataset(data, dataset)
+        result = run_profiled_model('generate-insights', 'insight_generator', dataset, data.get('profile_mode'),
+                                    rollup=parse_rollup_options(data))
+        return respond({'success': True, 'result': result})
+    except (StreamingError, ProfileModeError, DatasetStoreError, RollupError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/powerbi/detect-anomalies', methods=['GET', 'POST'])
+@conditional_get
 def pbi_detect_anomalies():
     if not _check_api_key():
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     try:
         if request.method == 'POST':
-            data = request.get_json(force=True, silent=True) or {}
+            data = read_dataset_payload(force=True, silent=True) or {}
             dataset = data.get('dataset', [])
         else:
+            data = request.args
             dataset_str = request.args.get('dataset', '[]')
             try:
                 dataset = json.loads(dataset_str)
             except Exception:
                 dataset = []
-        result = enhanced_anomaly_detector.detect(dataset)
-        return jsonify({'success': True, 'result': result})
+        dataset = load_dataset(data, dataset)
+        if data.get('series_id'):
+            result = run_series_update(data['series_id'], dataset, data)
+        else:
+            result = run_anomaly_detection(dataset, parse_anomaly_options(data))
+        return respond({'success': True, 'result': result})
+    except (StreamingError, AnomalyOptionsError, SeriesStateError, DatasetStoreError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/powerbi/forecast', methods=['GET', 'POST'])
+@conditional_get
 def pbi_forecast():
     if not _check_api_key():
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     try:
         if request.method == 'POST':
-            data = request.get_json(force=True, silent=True) or {}
+            data = read_dataset_payload(force=True, silent=True) or {}
             dataset = data.get('dataset', [])
             horizon = int(data.get('horizon', 30))
         else:
+            data = request.args
             dataset_str = request.args.get('dataset', '[]')
             try:
                 dataset = json.loads(dataset_str)
             except Exception:
                 dataset = []
             horizon = int(request.args.get('horizon', 30))
-        result = enhanced_forecasting_model.predict(dataset, horizon)
-        return jsonify({'success': True, 'result': result})
+        dataset = load_dataset(data, dataset)
+        if data.get('series_id'):
+            result = run_series_update(data['series_id'], dataset, data, horizon)
+        else:
+            result = run_forecast(dataset, horizon, parse_forecast_options(data), rollup=parse_rollup_options(data))
+        return respond({'success': True, 'result': result})
+    except (StreamingError, SeriesStateError, ForecastOptionsError, DatasetStoreError, RollupError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -230,7 +541,7 @@ def pbi_generate_sql():
             requirement = data.get('requirement', '')
         else:
             requirement = request.args.get('requirement', '')
-        result = enhanced_sql_generator.generate(requirement)
+        result = guarded_generation('sql', requirement, lambda: model_registry['sql_generator'].generate(requirement))
         return jsonify({'success': True, 'result': result})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -246,8 +557,10 @@ def generate_dax():
     user_id = generate_user_id(request)
     
     try:
-        data = request.get_json()
-        is_valid, error_msg = validate_request(data)
+        with timed_stage('generate-dax', 'parse'):
+            data = request.get_json()
+        with timed_stage('generate-dax', 'validate'):
+            is_valid, error_msg = validate_request(data)
         
         if not is_valid:
             return jsonify({'success': False, 'error': error_msg}), 400
@@ -255,12 +568,18 @@ def generate_dax():
         requirement = data.get('requirement', '').strip()
         
         # Use enhanced DAX generator
-        result = enhanced_dax_generator.generate(requirement, user_id)
+        with timed_stage('generate-dax', 'model'):
+            result = guarded_generation('dax', requirement,
+                                        lambda: model_registry['dax_generator'].generate(requirement, user_id))
+        
+        with timed_stage('generate-dax', 'preview'):
+            result = with_query_preview(data, result, 'dax')
         
         execution_time = time.time() - start_time
         log_performance('generate-dax', execution_time, True)
         
-        return jsonify(result)
+        with timed_stage('generate-dax', 'serialize'):
+            return jsonify(result)
         
     except Exception as e:
         execution_time = time.time() - start_time
@@ -268,7 +587,8 @@ def generate_dax():
         log_error(e, {'endpoint': 'generate-dax', 'data': data})
         
         # Auto-error recovery
-        recovered_result = error_recovery.auto_recover(e, {'requirement': data.get('requirement', '')})
+        with timed_stage('generate-dax', 'recovery'):
+            recovered_result = model_registry['error_recovery'].auto_recover(e, {'requirement': data.get('requirement', '')})
         return jsonify(recovered_result)
 
 @app.route('/api/recommend-chart', methods=['POST'])
@@ -278,21 +598,31 @@ def recommend_chart():
     user_id = generate_user_id(request)
     
     try:
-        data = request.get_json()
-        is_valid, error_msg = validate_request(data)
+        with timed_stage('recommend-chart', 'parse'):
+            data = read_dataset_payload()
+        with timed_stage('recommend-chart', 'validate'):
+            is_valid, error_msg = validate_request(data)
         
         if not is_valid:
             return jsonify({'success': False, 'error': error_msg}), 400
         
-        dataset = data.get('dataset', [])
+        with timed_stage('recommend-chart', 'ingest'):
+            dataset = load_dataset(data)
         
         # Use enhanced chart recommender
-        result = enhanced_chart_recommender.analyze(dataset, user_id)
+        with timed_stage('recommend-chart', 'model'):
+            result = run_profiled_model('recommend-chart', 'chart_recommender', dataset,
+                                        data.get('profile_mode'), user_id)
         
         execution_time = time.time() - start_time
         log_performance('recommend-chart', execution_time, True)
         
-        return jsonify(result)
+        with timed_stage('recommend-chart', 'serialize'):
+            return respond(result)
+        
+    except (StreamingError, ProfileModeError, DatasetStoreError) as e:
+        log_performance('recommend-chart', time.time() - start_time, False, str(e))
+        return jsonify({'success': False, 'error': str(e)}), 400
         
     except Exception as e:
         execution_time = time.time() - start_time
@@ -300,7 +630,8 @@ def recommend_chart():
         log_error(e, {'endpoint': 'recommend-chart', 'data': data})
         
         # Auto-error recovery
-        recovered_result = error_recovery.auto_recover(e, {'dataset': data.get('dataset', [])})
+        with timed_stage('recommend-chart', 'recovery'):
+            recovered_result = model_registry['error_recovery'].auto_recover(e, {'dataset': data.get('dataset', [])})
         return jsonify(recovered_result)
 
 @app.route('/api/generate-insights', methods=['POST'])
@@ -310,21 +641,31 @@ def generate_insights():
     user_id = generate_user_id(request)
     
     try:
-        data = request.get_json()
-        is_valid, error_msg = validate_request(data)
+        with timed_stage('generate-insights', 'parse'):
+            data = read_dataset_payload()
+        with timed_stage('generate-insights', 'validate'):
+            is_valid, error_msg = validate_request(data)
         
         if not is_valid:
             return jsonify({'success': False, 'error': error_msg}), 400
         
-        dataset = data.get('dataset', [])
+        with timed_stage('generate-insights', 'ingest'):
+            dataset = load_dataset(data)
         
         # Use enhanced insight generator
-        result = enhanced_insight_generator.analyze(dataset, user_id)
+        with timed_stage('generate-insights', 'model'):
+            result = run_profiled_model('generate-insights', 'insight_generator', dataset,
+                                        data.get('profile_mode'), user_id, rollup=parse_rollup_options(data))
         
         execution_time = time.time() - start_time
         log_performance('generate-insights', execution_time, True)
         
-        return jsonify(result)
+        with timed_stage('generate-insights', 'serialize'):
+            return respond(result)
+        
+    except (StreamingError, ProfileModeError, DatasetStoreError, RollupError) as e:
+        log_performance('generate-insights', time.time() - start_time, False, str(e))
+        return jsonify({'success': False, 'error': str(e)}), 400
         
     except Exception as e:
         execution_time = time.time() - start_time
@@ -332,7 +673,8 @@ def generate_insights():
         log_error(e, {'endpoint': 'generate-insights', 'data': data})
         
         # Auto-error recovery
-        recovered_result = error_recovery.auto_recover(e, {'dataset': data.get('dataset', [])})
+        with timed_stage('generate-insights', 'recovery'):
+            recovered_result = model_registry['error_recovery'].auto_recover(e, {'dataset': data.get('dataset', [])})
         return jsonify(recovered_result)
 
 @app.route('/api/detect-anomalies', methods=['POST'])
@@ -342,21 +684,33 @@ def detect_anomalies():
     user_id = generate_user_id(request)
     
     try:
-        data = request.get_json()
-        is_valid, error_msg = validate_request(data)
+        with timed_stage('detect-anomalies', 'parse'):
+            data = read_dataset_payload()
+        with timed_stage('detect-anomalies', 'validate'):
+            is_valid, error_msg = validate_request(data)
         
         if not is_valid:
             return jsonify({'success': False, 'error': error_msg}), 400
         
-        dataset = data.get('dataset', [])
+        with timed_stage('detect-anomalies', 'ingest'):
+            dataset = load_dataset(data)
         
-        # Use enhanced anomaly detector
-        result = enhanced_anomaly_detector.detect(dataset, user_id)
+        # Use enhanced anomaly detector (or the vectorized engine for column/method selections)
+        with timed_stage('detect-anomalies', 'model'):
+            if data.get('series_id'):
+                result = run_series_update(data['series_id'], dataset, data)
+            else:
+                result = run_anomaly_detection(dataset, parse_anomaly_options(data), user_id)
         
         execution_time = time.time() - start_time
         log_performance('detect-anomalies', execution_time, True)
         
-        return jsonify(result)
+        with timed_stage('detect-anomalies', 'serialize'):
+            return respond(result)
+        
+    except (StreamingError, AnomalyOptionsError, SeriesStateError, DatasetStoreError) as e:
+        log_performance('detect-anomalies', time.time() - start_time, False, str(e))
+        return jsonify({'success': False, 'error': str(e)}), 400
         
     except Exception as e:
         execution_time = time.time() - start_time
@@ -364,7 +718,8 @@ def detect_anomalies():
         log_error(e, {'endpoint': 'detect-anomalies', 'data': data})
         
         # Auto-error recovery
-        recovered_result = error_recovery.auto_recover(e, {'dataset': data.get('dataset', [])})
+        with timed_stage('detect-anomalies', 'recovery'):
+            recovered_result = model_registry['error_recovery'].auto_recover(e, {'dataset': data.get('dataset', [])})
         return jsonify(recovered_result)
 
 @app.route('/api/forecast', methods=['POST'])
@@ -374,22 +729,35 @@ def forecast():
     user_id = generate_user_id(request)
     
     try:
-        data = request.get_json()
-        is_valid, error_msg = validate_request(data)
+        with timed_stage('forecast', 'parse'):
+            data = read_dataset_payload()
+        with timed_stage('forecast', 'validate'):
+            is_valid, error_msg = validate_request(data)
         
         if not is_valid:
             return jsonify({'success': False, 'error': error_msg}), 400
         
-        dataset = data.get('dataset', [])
-        horizon = data.get('horizon', 30)
+        with timed_stage('forecast', 'ingest'):
+            dataset = load_dataset(data)
+        horizon = int(data.get('horizon', 30))
         
-        # Use enhanced forecasting model
-        result = enhanced_forecasting_model.predict(dataset, horizon, user_id)
+        # Use enhanced forecasting model (or the incremental state of a registered series)
+        with timed_stage('forecast', 'model'):
+            if data.get('series_id'):
+                result = run_series_update(data['series_id'], dataset, data, horizon)
+            else:
+                result = run_forecast(dataset, horizon, parse_forecast_options(data), user_id,
+                                      rollup=parse_rollup_options(data))
         
         execution_time = time.time() - start_time
         log_performance('forecast', execution_time, True)
         
-        return jsonify(result)
+        with timed_stage('forecast', 'serialize'):
+            return respond(result)
+        
+    except (StreamingError, SeriesStateError, ForecastOptionsError, DatasetStoreError, RollupError) as e:
+        log_performance('forecast', time.time() - start_time, False, str(e))
+        return jsonify({'success': False, 'error': str(e)}), 400
         
     except Exception as e:
         execution_time = time.time() - start_time
@@ -397,10 +765,11 @@ def forecast():
         log_error(e, {'endpoint': 'forecast', 'data': data})
         
         # Auto-error recovery
-        recovered_result = error_recovery.auto_recover(e, {
-            'dataset': data.get('dataset', []),
-            'horizon': data.get('horizon', 30)
-        })
+        with timed_stage('forecast', 'recovery'):
+            recovered_result = model_registry['error_recovery'].auto_recover(e, {
+                'dataset': data.get('dataset', []),
+                'horizon': data.get('horizon', 30)
+            })
         return jsonify(recovered_result)
 
 @app.route('/api/generate-sql', methods=['POST'])
@@ -410,8 +779,10 @@ def generate_sql():
     user_id = generate_user_id(request)
     
     try:
-        data = request.get_json()
-        is_valid, error_msg = validate_request(data)
+        with timed_stage('generate-sql', 'parse'):
+            data = request.get_json()
+        with timed_stage('generate-sql', 'validate'):
+            is_valid, error_msg = validate_request(data)
         
         if not is_valid:
             return jsonify({'success': False, 'error': error_msg}), 400
@@ -419,12 +790,18 @@ def generate_sql():
         requirement = data.get('requirement', '').strip()
         
         # Use enhanced SQL generator
-        result = enhanced_sql_generator.generate(requirement, user_id)
+        with timed_stage('generate-sql', 'model'):
+            result = guarded_generation('sql', requirement,
+                                        lambda: model_registry['sql_generator'].generate(requirement, user_id))
+        
+        with timed_stage('generate-sql', 'preview'):
+            result = with_query_preview(data, result, 'sql')
         
         execution_time = time.time() - start_time
         log_performance('generate-sql', execution_time, True)
         
-        return jsonify(result)
+        with timed_stage('generate-sql', 'serialize'):
+            return jsonify(result)
         
     except Exception as e:
         execution_time = time.time() - start_time
@@ -432,9 +809,216 @@ def generate_sql():
         log_error(e, {'endpoint': 'generate-sql', 'data': data})
         
         # Auto-error recovery
-        recovered_result = error_recovery.auto_recover(e, {'requirement': data.get('requirement', '')})
+        with timed_stage('generate-sql', 'recovery'):
+            recovered_result = model_registry['error_recovery'].auto_recover(e, {'requirement': data.get('requirement', '')})
         return jsonify(recovered_result)
 
+@app.route('/api/execute-query', methods=['POST'])
+def execute_query_endpoint():
+    """Run SQL or DAX against an inline or stored dataset and return the first rows with stage timings"""
+    start_time = time.time()
+    
+    try:
+        data = read_dataset_payload(force=True, silent=True) or {}
+        query = str(data.get('query') or '').strip()
+        if not query:
+            return jsonify({'success': False, 'error': 'No query provided'}), 400
+        if not (data.get('dataset') or data.get('dataset_id')):
+            return jsonify({'success': False, 'error': 'No dataset provided'}), 400
+        
+        with timed_stage('execute-query', 'ingest'):
+            dataset = load_dataset(data)
+        with timed_stage('execute-query', 'execute'):
+            result = execute_query(dataset, query, data.get('language'),
+                                   limit=data.get('limit', DEFAULT_PREVIEW_ROWS))
+        
+        log_performance('execute-query', time.time() - start_time, True)
+        return respond(result)
+        
+    except (QueryError, StreamingError, DatasetStoreError, TypeError, ValueError) as e:
+        log_performance('execute-query', time.time() - start_time, False, str(e))
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/analyze-batch', methods=['POST'])
+def analyze_batch():
+    """Run several analyses over one dataset, parsed and profiled once"""
+    start_time = time.time()
+    user_id = generate_user_id(request)
+    
+    try:
+        data = read_dataset_payload()
+        is_valid, error_msg = validate_request(data)
+        
+        if not is_valid:
+            return jsonify({'success': False, 'error': error_msg}), 400
+        
+        analyses = data.get('analyses')
+        if analyses in (None, '', []):
+            analyses = ['recommend-chart', 'generate-insights', 'detect-anomalies', 'forecast']
+        elif isinstance(analyses, str):
+            analyses = [name.strip() for name in analyses.split(',') if name.strip()]
+        horizon = int(data.get('horizon', 30))
+        anomaly_options = parse_anomaly_options(data)
+        forecast_options = parse_forecast_options(data)
+        rollup_options = parse_rollup_options(data)
+        profile_mode = data.get('profile_mode')
+        dataset = load_dataset(data)
+        
+        # Each runner gets the frame and its profile, computed once by run_batch
+        runners = {
+            'recommend-chart': lambda frame, profile: run_profiled_model(
+                'recommend-chart', 'chart_recommender', frame, profile_mode, user_id, profile=profile),
+            'generate-insights': lambda frame, profile: run_profiled_model(
+                'generate-insights', 'insight_generator', frame, profile_mode, user_id, rollup=rollup_options,
+                profile=profile),
+            'detect-anomalies': lambda frame, profile: run_anomaly_detection(
+                frame, anomaly_options, user_id, profile=profile),
+            'forecast': lambda frame, profile: run_forecast(
+                frame, horizon, forecast_options, user_id, rollup=rollup_options, profile=profile)
+        }
+        result = run_batch(dataset, analyses, runners)
+        
+        execution_time = time.time() - start_time
+        log_performance('analyze-batch', execution_time, result['success'])
+        
+        return respond(result)
+        
+    except (StreamingError, ValueError) as e:
+        log_performance('analyze-batch', time.time() - start_time, False, str(e))
+        return jsonify({'success': False, 'error': str(e)}), 400
+        
+    except Exception as e:
+        execution_time = time.time() - start_time
+        log_performance('analyze-batch', execution_time, False, str(e))
+        log_error(e, {'endpoint': 'analyze-batch'})
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a forecast or anomaly detection run and return its job id immediately"""
+    user_id = generate_user_id(request)
+    
+    try:
+        data = read_dataset_payload()
+        is_valid, error_msg = validate_request(data)
+        
+        if not is_valid:
+            return jsonify({'success': False, 'error': error_msg}), 400
+        
+        job_type = data.get('type', 'forecast')
+        priority = int(data.get('priority', 5))
+        
+        if job_type == 'forecast':
+            horizon = int(data.get('horizon', 30))
+            forecast_options = parse_forecast_options(data)
+            rollup_options = parse_rollup_options(data)
+            def run(cancel_event, set_stage):
+                return run_forecast(dataset, horizon, forecast_options, user_id, cancel_event=cancel_event,
+                                    rollup=rollup_options, on_stage=set_stage)
+        elif job_type == 'detect-anomalies':
+            anomaly_options = parse_anomaly_options(data)
+            def run(cancel_event, set_stage):
+                set_stage('model')
+                return run_anomaly_detection(dataset, anomaly_options, user_id, cancel_event=cancel_event)
+        else:
+            return jsonify({'success': False, 'error': f"Unsupported job type: {job_type}"}), 400
+        
+        # A stored dataset stays leased from submit until the job finishes, even while it is queued
+        dataset, release = lease_job_dataset(data)
+        try:
+            job = job_manager.submit(job_type, run, priority, on_finish=release)
+        except QueueFullError:
+            if release is not None:
+                release()
+            raise
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/api/jobs/{job.id}'
+        }), 202
+        
+    except QueueFullError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+        
+    except (StreamingError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report job status and current stage, with the result once it has finished"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found or expired'}), 404
+    
+    status = job.to_dict()
+    status['success'] = True
+    status['queue_position'] = job_manager.queue_position(job)
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found or expired'}), 404
+    
+    status = job.to_dict(include_result=False)
+    status['success'] = True
+    return jsonify(status)
+
+@app.route('/api/datasets', methods=['PUT'])
+def put_dataset():
+    """Store a dataset once; analytics requests then pass the returned dataset_id instead of the rows"""
+    try:
+        data = read_dataset_payload(force=True, silent=True) or {}
+        if data.get('dataset') is None:
+            return jsonify({'success': False, 'error': 'No dataset provided'}), 400
+        stored = dataset_store.put(ingest_dataset(data['dataset']))
+        return jsonify({'success': True, **stored}), 201 if stored['created'] else 200
+    except (StreamingError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/datasets/<dataset_id>', methods=['GET'])
+def get_dataset(dataset_id):
+    """Metadata of a stored dataset"""
+    try:
+        return jsonify({'success': True, **dataset_store.describe(dataset_id)})
+    except DatasetStoreError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+
+@app.route('/api/datasets/<dataset_id>', methods=['DELETE'])
+def delete_dataset(dataset_id):
+    """Remove a stored dataset that no request is using"""
+    try:
+        if not dataset_store.delete(dataset_id):
+            return jsonify({'success': False, 'error': f'Unknown dataset_id: {dataset_id}'}), 404
+    except DatasetStoreError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    return jsonify({'success': True, 'dataset_id': dataset_id})
+
+@app.route('/api/series/<series_id>', methods=['GET'])
+def get_series(series_id):
+    """Running state of one of the client's series, with a forecast from it"""
+    owner = series_owner()
+    try:
+        horizon = int(request.args.get('horizon', 30))
+        state = series_store.get(owner, series_id)
+        return jsonify({'success': True, **state.summary(), **series_store.forecast(owner, series_id, horizon)})
+    except SeriesStateError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/series/<series_id>', methods=['DELETE'])
+def delete_series(series_id):
+    """Forget one of the client's series"""
+    if not series_store.delete(series_owner(), series_id):
+        return jsonify({'success': False, 'error': f'Unknown series: {series_id}'}), 404
+    return jsonify({'success': True, 'series_id': series_id})
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Enhanced health check with system status"""
@@ -461,14 +1045,7 @@ def health_check():
         
         # Add performance metrics summary
         if performance_metrics:
-            system_status['performance_summary'] = {
-                endpoint: {
-                    'total_requests': len(metrics),
-                    'success_rate': sum(1 for m in metrics if m['success']) / len(metrics),
-                    'avg_execution_time': sum(m['execution_time'] for m in metrics) / len(metrics)
-                }
-                for endpoint, metrics in performance_metrics.items()
-            }
+            system_status['performance_summary'] = performance_metrics.summaries()
         
         return jsonify(system_status)
         
@@ -485,21 +1062,37 @@ def system_status():
     """Get detailed system status and metrics"""
     try:
         status = {
-            'performance_metrics': performance_metrics,
-            'recent_errors': error_log[-10:] if error_log else [],
+            'performance_metrics': {
+                endpoint: {
+                    **performance_metrics.summary(endpoint),
+                    'recent': performance_metrics.recent(endpoint)
+                }
+                for endpoint in performance_metrics.endpoints()
+            },
+            'recent_errors': error_log.recent(10, include_traceback=True),
+            'error_groups': error_log.groups(),
+            'total_errors': error_log.total,
+            'result_cache': result_cache.stats(),
+            'semantic_cache': semantic_cache.stats(),
+            'llm_upstream': llm_guard.stats(),
+            'request_coalescing': request_coalescer.stats(),
+            'execution_backend': model_backend.stats(),
+            'jobs': job_manager.stats(),
+            'rate_limiter': rate_limiter.stats(),
+            'series_state': series_store.stats(),
+            'dataset_store': dataset_store.stats(),
+            'rollup_cache': rollup_cache.stats(),
             'security_status': {
                 'encryption_active': True,
-                'rate_limiting_active': True,
+                'rate_limiting_active': rate_limiter.enabled,
                 'token_validation_active': True
             },
             'ai_models_status': {
-                'dax_generator': 'active',
-                'chart_recommender': 'active',
-                'insight_generator': 'active',
-                'anomaly_detector': 'active',
-                'forecasting_model': 'active',
-                'sql_generator': 'active'
+                name: 'active' if model_registry.loaded(name) else 'not loaded'
+                for name in ('dax_generator', 'chart_recommender', 'insight_generator',
+                             'anomaly_detector', 'forecasting_model', 'sql_generator')
             },
+            'model_registry': model_registry.stats(),
             'timestamp': datetime.now().isoformat()
         }
         
@@ -509,6 +1102,20 @@ def system_status():
         log_error(e, {'endpoint': 'system-status'})
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request counters and latency histograms in Prometheus text exposition format"""
+    body = render_prometheus([
+        ('pbi_http_request_duration_seconds', 'HTTP request latency by route, method and status',
+         request_metrics, ('route', 'method', 'status')),
+        ('pbi_stage_duration_seconds', 'Time spent in each stage of the analytics endpoints',
+         stage_metrics, ('endpoint', 'stage'))
+    ], counters=[
+        ('pbi_http_requests_total', 'HTTP requests by route, method and status',
+         request_metrics, ('route', 'method', 'status'))
+    ])
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 @app.route('/static/<path:path>')
 def serve_static(path):
     return send_from_directory('static', path)
@@ -0,0 +1,136 @@
+"""
+Minifier benchmark
+
+Runs the build minifiers (minify.py) over every CSS, JS and HTML file under
+static/ and templates/ (or the given paths) and reports per asset:
+- bytes / minified: raw size before and after
+- saved: bytes saved and percentage
+- gzip / gzip_min: gzip -9 size before and after
+- ms: median minify time over --runs, plus throughput
+
+Exits non-zero when a file cannot be tokenized, when minifying the output
+again changes it (the minifier must be idempotent), or, with --verify, when
+`node --check` accepts a source script but rejects its minified output.
+
+    python bench_minify.py                       # all site assets
+    python bench_minify.py static/js --verify    # one folder, syntax-checked with node
+    python bench_minify.py --json                # machine-readable report
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from minify import MINIFIERS, MinifyError
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATHS = ('static', 'templates')
+
+
+def collect(paths) -> list:
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for folder, _, names in os.walk(path):
+            files.extend(os.path.join(folder, name) for name in sorted(names))
+    return [f for f in sorted(files) if os.path.splitext(f)[1].lower() in MINIFIERS]
+
+
+def node_accepts(node: str, text: str, ext: str) -> bool:
+    with tempfile.NamedTemporaryFile('w', suffix=ext, delete=False, encoding='utf-8') as f:
+        f.write(text)
+    try:
+        return subprocess.run([node, '--check', f.name], capture_output=True).returncode == 0
+    finally:
+        os.unlink(f.name)
+
+
+def measure(path: str, runs: int, node) -> dict:
+    ext = os.path.splitext(path)[1].lower()
+    minifier = MINIFIERS[ext]
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        text = f.read()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = minifier(text)
+        timings.append((time.perf_counter() - start) * 1000)
+    raw, small = text.encode('utf-8'), out.encode('utf-8')
+    ms = statistics.median(timings)
+    row = {
+        'file': os.path.relpath(path, ROOT),
+        'bytes': len(raw),
+        'minified': len(small),
+        'saved': len(raw) - len(small),
+        'saved_pct': round(100 * (len(raw) - len(small)) / len(raw), 1) if raw else 0.0,
+        'gzip': len(gzip.compress(raw, 9, mtime=0)),
+        'gzip_min': len(gzip.compress(small, 9, mtime=0)),
+        'ms': round(ms, 2),
+        'mb_per_s': round(len(raw) / 1e6 / (ms / 1000), 1) if ms else None,
+        'problems': []
+    }
+    if minifier(out) != out:
+        row['problems'].append("not idempotent")
+    if node and ext in ('.js', '.mjs') and node_accepts(node, text, ext) and not node_accepts(node, out, ext):
+        row['problems'].append("node --check rejects the minified output")
+    return row
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='*', help='files or folders (default: static/ and templates/)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--verify', action='store_true', help='syntax-check minified JS with node')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    paths = args.paths or [os.path.join(ROOT, p) for p in DEFAULT_PATHS if os.path.exists(os.path.join(ROOT, p))]
+    files = collect(paths)
+    if not files:
+        print("No CSS, JS or HTML files found", file=sys.stderr)
+        return 0
+    node = shutil.which('node') if args.verify else None
+    if args.verify and not node:
+        print("node not found; skipping --verify", file=sys.stderr)
+
+    rows, failures = [], []
+    for path in files:
+        try:
+            row = measure(path, args.runs, node)
+        except MinifyError as e:
+            failures.append(f"{os.path.relpath(path, ROOT)}: {e}")
+            continue
+        rows.append(row)
+        failures.extend(f"{row['file']}: {problem}" for problem in row['problems'])
+
+    totals = {key: sum(row[key] for row in rows) for key in ('bytes', 'minified', 'saved', 'gzip', 'gzip_min', 'ms')}
+    totals['saved_pct'] = round(100 * totals['saved'] / totals['bytes'], 1) if totals['bytes'] else 0.0
+    totals['ms'] = round(totals['ms'], 2)
+
+    if args.json:
+        print(json.dumps({'files': rows, 'total': totals}, indent=2))
+    else:
+        header = f"{'file':<48} {'bytes':>9} {'minified':>9} {'saved':>13} {'gzip':>8} {'gzip_min':>8} {'ms':>8}"
+        print(header)
+        print('-' * len(header))
+        for row in rows + [{'file': 'TOTAL', **totals}]:
+            saved = f"{row['saved']} ({row['saved_pct']}%)"
+            print(f"{row['file'][-48:]:<48} {row['bytes']:>9} {row['minified']:>9} {saved:>13} "
+                  f"{row['gzip']:>8} {row['gzip_min']:>8} {row['ms']:>8}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Cold start benchmark
+
+Boots the app in fresh interpreters and measures:
+- import_ms: `import app` (module imports and service construction)
+- first_request_ms: the first GET /api/health after that
+
+Exits non-zero on a regression: when a heavy module (the models module or
+pandas) is loaded before any request needs it, when a median exceeds
+--max-import-ms / --max-first-request-ms, or when it is more than
+--tolerance slower than the saved baseline.
+
+    python bench_startup.py                     # compare with startup-baseline.json if present
+    python bench_startup.py --update-baseline   # record the current numbers
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(ROOT, 'startup-baseline.json')
+LAZY_MODULES = ('models.enhanced_ai_models', 'pandas')
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/api/health')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'status': response.status_code,
+    'loaded': [name for name in %r if name in sys.modules]
+}))
+""" % (LAZY_MODULES,)
+
+
+def run_probe() -> dict:
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Probe failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown over the baseline')
+    parser.add_argument('--max-import-ms', type=float, default=None)
+    parser.add_argument('--max-first-request-ms', type=float, default=None)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    samples = [run_probe() for _ in range(args.runs)]
+    report = {metric: round(statistics.median(sample[metric] for sample in samples), 1)
+              for metric in ('import_ms', 'first_request_ms')}
+    loaded = sorted({name for sample in samples for name in sample['loaded']})
+    print(json.dumps({**report, 'runs': args.runs, 'eagerly_loaded': loaded}, indent=2))
+
+    failures = []
+    if loaded:
+        failures.append(f"loaded before any model was needed: {', '.join(loaded)}")
+    if any(sample['status'] != 200 for sample in samples):
+        failures.append("/api/health did not return 200")
+    limits = {'import_ms': args.max_import_ms, 'first_request_ms': args.max_first_request_ms}
+    for metric, limit in limits.items():
+        if limit is not None and report[metric] > limit:
+            failures.append(f"{metric} {report[metric]} exceeds {limit}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        for metric, value in report.items():
+            allowed = baseline.get(metric, value) * (1 + args.tolerance)
+            if value > allowed:
+                failures.append(f"{metric} {value} regressed past {allowed:.1f} "
+                                f"(baseline {baseline[metric]}, tolerance {args.tolerance:.0%})")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,79 +2,305 @@
 """
 Power BI Tools Build Script
 Creates a production-ready static site for Netlify deployment
+
+The asset build is incremental: `.build-cache/manifest.json` records a content
+hash for every file under static/ and templates/, and only changed files are
+reprocessed. Minification (the single-pass tokenizers in minify.py) runs in
+parallel across cores (`--jobs`); a file the tokenizer rejects is reported
+and copied unminified, or fails the build with `--strict`. Static
+assets get fingerprinted names (`main.<hash>.js`), and references in the HTML
+templates and CSS are rewritten to them, so the one-year `immutable`
+Cache-Control in `_headers` is safe. A CSS or HTML file's cache key covers its
+own bytes plus the fingerprinted names of the assets it references, so editing
+an image rebuilds only the files that point at it. Text outputs get
+precompressed `.gz` siblings, plus `.br` when the brotli package is installed.
+`--clean` forces a full rebuild.
 """
 
+import argparse
+import gzip
+import hashlib
 import os
+import posixpath
 import re
 import shutil
 import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from minify import MINIFIERS, MinifyError
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_VERSION = 3   # bump when minifier output changes so cached outputs are rebuilt
+HASH_LENGTH = 8
+COMPRESSIBLE = {'.html', '.css', '.js', '.mjs', '.json', '.svg', '.txt', '.xml', '.map', '.ico', '.webmanifest'}
+MIN_COMPRESS_BYTES = 256
+
+STATIC_REF = re.compile(r"(?P<prefix>/?static/)(?P<path>[\w@~.+/-]+\.\w+)")
+URL_FOR_REF = re.compile(r"""(?P<prefix>url_for\(\s*['"]static['"]\s*,\s*filename\s*=\s*)(?P<quote>['"])(?P<path>[^'"]+)(?P=quote)""")
+CSS_URL = re.compile(r"""url\(\s*(?P<quote>['"]?)(?P<ref>[^'")]+)(?P=quote)\s*\)""")
+
+
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def fingerprinted(rel_path, digest):
+    """static/js/main.js -> static/js/main.<hash>.js"""
+    stem, ext = posixpath.splitext(rel_path)
+    return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def html_refs(html):
+    """Static-relative paths referenced by a template"""
+    return {match.group('path') for match in URL_FOR_REF.finditer(html)} | \
+        {match.group('path') for match in STATIC_REF.finditer(html)}
+
+
+def _css_target(ref, css_path):
+    """(static-relative target, path, query) of a url() reference, or None for external/inline ones"""
+    ref = ref.strip()
+    if ref.startswith(('data:', 'http:', 'https:', '//', '#')):
+        return None
+    path, _, suffix = ref.partition('?')
+    if path.startswith('/static/'):
+        return path[len('/static/'):], path, suffix
+    return posixpath.normpath(posixpath.join(posixpath.dirname(css_path), path)), path, suffix
+
+
+def css_refs(css, css_path):
+    """Static-relative paths referenced by a stylesheet's url() values"""
+    targets = (_css_target(match.group('ref'), css_path) for match in CSS_URL.finditer(css))
+    return {target[0] for target in targets if target}
+
+
+def rewrite_html_refs(html, assets):
+    """Point /static/... and url_for('static', filename=...) references at the fingerprinted names"""
+    def static_ref(match):
+        hashed = assets.get(match.group('path'))
+        return match.group('prefix') + hashed if hashed else match.group(0)
+
+    def url_for_ref(match):
+        hashed = assets.get(match.group('path'))
+        quote = match.group('quote')
+        return f"{match.group('prefix')}{quote}{hashed}{quote}" if hashed else match.group(0)
+
+    return STATIC_REF.sub(static_ref, URL_FOR_REF.sub(url_for_ref, html))
+
+
+def rewrite_css_refs(css, css_path, assets):
+    """Rewrite url(...) references (relative to the stylesheet, or /static/...) to fingerprinted names"""
+    def url_ref(match):
+        resolved = _css_target(match.group('ref'), css_path)
+        if resolved is None:
+            return match.group(0)
+        target, path, suffix = resolved
+        hashed = assets.get(target)
+        if not hashed:
+            return match.group(0)
+        new_ref = path[:len(path) - len(posixpath.basename(path))] + posixpath.basename(hashed)
+        return f"url({match.group('quote')}{new_ref}{'?' + suffix if suffix else ''}{match.group('quote')})"
+
+    return CSS_URL.sub(url_ref, css)
+
+
+def write_output(dist_dir, rel_path, data):
+    """Write one output plus its precompressed siblings; returns every path written"""
+    target = Path(dist_dir) / rel_path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(data)
+    written = [rel_path]
+    if posixpath.splitext(rel_path)[1].lower() in COMPRESSIBLE and len(data) >= MIN_COMPRESS_BYTES:
+        # mtime=0 keeps the .gz bytes identical across builds of the same input
+        Path(f"{target}.gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+        written.append(f"{rel_path}.gz")
+        if brotli is not None:
+            Path(f"{target}.br").write_bytes(brotli.compress(data, quality=11))
+            written.append(f"{rel_path}.br")
+    return written
+
+
+def process_file(task):
+    """Minify, fingerprint and compress one input (runs in a worker process)"""
+    source, rel_path, kind, assets, dist_dir = task
+    data = Path(source).read_bytes()
+    saved = 0
+    warning = None
+    ext = posixpath.splitext(rel_path)[1].lower()
+    minifier = MINIFIERS.get(ext)
+    if minifier is not None or kind == 'html':
+        text = data.decode('utf-8', errors='ignore')
+        if kind == 'html':
+            text = rewrite_html_refs(text, assets)
+        elif ext == '.css':
+            text = rewrite_css_refs(text, rel_path[len('static/'):], assets)
+        data = text.encode('utf-8')
+        try:
+            if minifier:
+                # Savings are the minifier's own: reference rewriting changes sizes too
+                minified = minifier(text).encode('utf-8')
+                saved = len(data) - len(minified)
+                data = minified
+        except MinifyError as e:
+            warning = f"{rel_path}: {e}; copied unminified"
+    outputs = []
+    output = rel_path
+    if kind == 'asset':
+        output = fingerprinted(rel_path, file_hash(data))
+    outputs += write_output(dist_dir, output, data)
+    if kind == 'html' and rel_path == 'templates/index.html':
+        outputs += write_output(dist_dir, 'index.html', data)
+    return {'input': rel_path, 'output': output, 'outputs': outputs, 'saved': saved, 'bytes': len(data),
+            'warning': warning}
+
+
+def collect_inputs(source_dir):
+    """(source path, dist-relative path, kind) for every file the asset pipeline owns"""
+    inputs = []
+    for folder, kind in (('static', 'asset'), ('templates', 'html')):
+        root = source_dir / folder
+        if not root.exists():
+            continue
+        for path in sorted(root.rglob('*')):
+            if path.is_file():
+                inputs.append((path, path.relative_to(source_dir).as_posix(), kind))
+    return inputs
+
+
+def load_manifest(path):
+    try:
+        manifest = json.loads(path.read_text(encoding='utf-8'))
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'files': {}}
+
+
+def build_assets(source_dir, dist_dir, manifest_path, jobs, clean=False):
+    """Incremental, parallel asset build; returns processed/unchanged/removed counts, bytes saved and warnings"""
+    manifest = {'version': MANIFEST_VERSION, 'files': {}} if clean else load_manifest(manifest_path)
+    previous = manifest['files']
+    inputs = collect_inputs(source_dir)
+    current = {}
+    counts = {'processed': 0, 'unchanged': 0, 'removed': 0, 'saved': 0, 'warnings': []}
+
+    def run(batch):
+        """Process the changed files of one stage; stages run in dependency order"""
+        work = []
+        for source, rel_path, kind, key in batch:
+            entry = previous.get(rel_path)
+            if entry and entry['key'] == key and all((dist_dir / out).exists() for out in entry['outputs']):
+                current[rel_path] = entry
+                counts['unchanged'] += 1
+            else:
+                work.append((source, rel_path, kind, key))
+        tasks = [(str(source), rel_path, kind, asset_map(), str(dist_dir)) for source, rel_path, kind, _ in work]
+        if len(tasks) > 1 and pool is not None:
+            results = list(pool.map(process_file, tasks, chunksize=max(1, len(tasks) // (jobs * 4))))
+        else:
+            results = [process_file(task) for task in tasks]
+        for (_, rel_path, _, key), result in zip(work, results):
+            old = previous.get(rel_path)
+            if old:
+                for stale in set(old['outputs']) - set(result['outputs']):
+                    (dist_dir / stale).unlink(missing_ok=True)
+            current[rel_path] = {'key': key, 'output': result['output'], 'outputs': result['outputs']}
+            if result['warning']:
+                # Kept in the manifest so the warning is repeated until the file is fixed
+                current[rel_path]['warning'] = result['warning']
+            counts['processed'] += 1
+            counts['saved'] += result['saved']
+
+    def asset_map():
+        return {rel[len('static/'):]: entry['output'][len('static/'):]
+                for rel, entry in current.items() if rel.startswith('static/')}
+
+    def keyed(items, with_refs):
+        """Cache keys: the file's bytes, plus the current names of the assets it references (CSS/HTML)"""
+        assets = asset_map() if with_refs else {}
+        batch = []
+        for source, rel, kind in items:
+            data = source.read_bytes()
+            if with_refs:
+                text = data.decode('utf-8', errors='ignore')
+                refs = html_refs(text) if kind == 'html' else css_refs(text, rel[len('static/'):])
+                data += json.dumps({ref: assets.get(ref) for ref in sorted(refs)}).encode()
+            batch.append((source, rel, kind, file_hash(data)))
+        return batch
+
+    # Stage 1: assets nothing else depends on; stage 2: CSS (its url() references need stage 1 names);
+    # stage 3: HTML (references everything)
+    plain = [item for item in inputs if item[2] == 'asset' and not item[1].endswith('.css')]
+    styles = [item for item in inputs if item[2] == 'asset' and item[1].endswith('.css')]
+    pages = [item for item in inputs if item[2] == 'html']
+    # Worker processes start on first use, so a build with nothing to do never spawns them
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        run(keyed(plain, False))
+        run(keyed(styles, True))
+        run(keyed(pages, True))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    counts['warnings'] = [entry['warning'] for entry in current.values() if entry.get('warning')]
+    for rel_path, entry in previous.items():
+        if rel_path not in current:
+            for stale in entry['outputs']:
+                (dist_dir / stale).unlink(missing_ok=True)
+            counts['removed'] += 1
+
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps({'version': MANIFEST_VERSION, 'files': current}, indent=2, sort_keys=True),
+                             encoding='utf-8')
+    assets = {f"/static/{src}": f"/static/{out}" for src, out in sorted(asset_map().items())}
+    (dist_dir / 'asset-manifest.json').write_text(json.dumps(assets, indent=2), encoding='utf-8')
+    return counts
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Build the static site into dist/")
+    parser.add_argument('--clean', action='store_true', help="discard dist/ and the build cache first")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="parallel minify workers")
+    parser.add_argument('--strict', action='store_true', help="fail when a file cannot be minified")
+    args = parser.parse_args()
+
     print("🚀 Starting Power BI Tools build process...")
+    started = time.perf_counter()
     
     # Configuration
     source_dir = Path(".")
     dist_dir = Path("dist")
+    manifest_path = source_dir / ".build-cache" / "manifest.json"
     
-    # Clean and create dist directory
-    if dist_dir.exists():
+    # dist/ is kept between builds; unchanged inputs are not reprocessed
+    if args.clean and dist_dir.exists():
         shutil.rmtree(dist_dir)
-    dist_dir.mkdir()
-    
-    # Copy static files
-    print("📁 Copying static files...")
-    static_src = source_dir / "static"
-    static_dest = dist_dir / "static"
-    if static_src.exists():
-        shutil.copytree(static_src, static_dest)
-        print("✓ Static files copied")
-        # Minify CSS/JS in-place for space efficiency
-        for root, _, files in os.walk(static_dest):
-            for name in files:
-                path = Path(root) / name
-                try:
-                    if name.endswith('.css'):
-                        content = path.read_text(encoding='utf-8', errors='ignore')
-                        content = re.sub(r"/\*.*?\*/", "", content, flags=re.S)
-                        content = re.sub(r"\s+", " ", content)
-                        content = content.replace(" {", "{").replace("} ", "}")
-                        path.write_text(content.strip(), encoding='utf-8')
-                    elif name.endswith('.js'):
-                        content = path.read_text(encoding='utf-8', errors='ignore')
-                        content = re.sub(r"/\*.*?\*/", "", content, flags=re.S)
-                        content = re.sub(r"\n+", "\n", content)
-                        content = re.sub(r"\s{2,}", " ", content)
-                        path.write_text(content.strip(), encoding='utf-8')
-                except Exception:
-                    # Non-fatal; keep original if minify fails
-                    pass
+    dist_dir.mkdir(exist_ok=True)
     
-    # Copy templates and export index.html at root
-    print("📄 Processing HTML templates...")
-    templates_src = source_dir / "templates"
-    if templates_src.exists():
-        templates_dest = dist_dir / "templates"
-        shutil.copytree(templates_src, templates_dest)
-        print("✓ HTML templates copied")
-        index_src = templates_src / "index.html"
-        if index_src.exists():
-            try:
-                html = index_src.read_text(encoding='utf-8')
-                # Light HTML minify
-                html = re.sub(r">\s+<", "><", html)
-                html = re.sub(r"\n+", "\n", html)
-                (dist_dir / "index.html").write_text(html, encoding='utf-8')
-                print("✓ index.html exported to dist/")
-            except Exception:
-                shutil.copy2(index_src, dist_dir / "index.html")
+    # Minify, fingerprint and precompress static files and templates (index.html is exported at root)
+    print("📁 Building static assets and HTML templates...")
+    counts = build_assets(source_dir, dist_dir, manifest_path, args.jobs, clean=args.clean)
+    print(f"✓ {counts['processed']} processed, {counts['unchanged']} unchanged, "
+          f"{counts['removed']} removed, {counts['saved']:,} bytes saved by minification ({args.jobs} workers)")
+    for warning in counts['warnings']:
+        print(f"⚠️ {warning}")
+    if args.strict and counts['warnings']:
+        raise SystemExit(f"❌ {len(counts['warnings'])} file(s) could not be minified")
     
     # Copy Netlify functions
     print("⚡ Copying Netlify functions...")
     functions_src = source_dir / "netlify" / "functions"
     if functions_src.exists():
         functions_dest = dist_dir / ".netlify" / "functions"
-        functions_dest.mkdir(parents=True)
+        shutil.rmtree(functions_dest / "api", ignore_errors=True)
+        functions_dest.mkdir(parents=True, exist_ok=True)
         shutil.copytree(functions_src, functions_dest / "api")
         print("✓ Netlify functions copied")
     
@@ -99,7 +325,7 @@ def main():
   Referrer-Policy: strict-origin-when-cross-origin
   Permissions-Policy: camera=(), microphone=(), geolocation=()
 
-# Cache static assets
+# Cache static assets (every file name carries its content hash)
 /static/*
   Cache-Control: public, max-age=31536000, immutable
 
@@ -203,7 +429,7 @@ Sitemap: https://your-site.netlify.app/sitemap.xml
         f.write(sitemap_content)
     print("✓ sitemap.xml created")
     
-    print("\n🎉 Build completed successfully!")
+    print(f"\n🎉 Build completed successfully in {time.perf_counter() - started:.2f}s!")
     print(f"📁 Output directory: {dist_dir.absolute()}")
     print("\n📋 Next steps:")
     print("1. Test locally: python -m http.server --directory dist")
@@ -0,0 +1,404 @@
+"""
+Tokenizing minifiers for the build pipeline
+
+Each minifier makes a single left-to-right pass with anchored regular
+expressions and never re-scans its output. Strings, template literals, regex
+literals, comments, url() values and the contents of <pre>/<textarea> are
+recognised as whole tokens, so a `/*` or `//` inside them is never mistaken
+for a comment. Whitespace is dropped only where the grammar makes it
+insignificant:
+
+- JS: a space is kept where two tokens would otherwise merge (`a in b`,
+  `a - -b`, `1 .toString()`). A line break is kept wherever automatic
+  semicolon insertion could depend on it: after return/throw/break/continue/
+  yield, after postfix ++/--, and wherever neither neighbouring token forces
+  the expression to continue.
+- CSS: spaces around `{ } ; , >` and after `:` are removed, and the last
+  `;` of a block is dropped. Spaces before `(` (media queries) and around
+  `+`/`-` (calc) are kept.
+- HTML: comments other than conditional comments are removed; the text on
+  both sides is then treated as one run, so `Hello <!-- x --> world` keeps a
+  space. Whitespace runs in text collapse to one space, which is dropped
+  entirely when the run directly touches a block-level tag (inline and
+  replaced elements such as <select>, <iframe> and <br> keep it). Inline
+  <script> and <style> bodies are minified; Jinja `{{ }}`/`{% %}`/`{# #}`
+  blocks pass through verbatim.
+
+`/*! ... */` comments (licences) are preserved in JS and CSS. Malformed input
+(an unterminated string, comment, template or regex) raises MinifyError with
+its line number instead of producing broken output.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+
+class MinifyError(ValueError):
+    """Raised for input the tokenizer cannot scan (unterminated strings, comments, templates or regexes)"""
+
+    def __init__(self, message: str, text: str, pos: int):
+        self.line = text.count('\n', 0, pos) + 1
+        super().__init__(f"{message} at line {self.line}")
+
+
+def _line_break(text: str) -> bool:
+    return any(ch in text for ch in '\r\n\u2028\u2029')
+
+
+# -------------------------
+# JavaScript
+# -------------------------
+
+_JS_SPACE = re.compile('[ \\t\\f\\v\\r\\n\\u00a0\\u2028\\u2029\\ufeff]+')
+_JS_LINE_COMMENT = re.compile('//[^\\r\\n\\u2028\\u2029]*')
+_JS_BLOCK_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_JS_STRING = {
+    '"': re.compile(r'"(?:[^"\\\r\n]|\\(?:\r\n|[\s\S]))*"'),
+    "'": re.compile(r"'(?:[^'\\\r\n]|\\(?:\r\n|[\s\S]))*'")
+}
+_JS_TEMPLATE_CHUNK = re.compile(r'(?:[^`\\$]|\\[\s\S]|\$(?!\{))*')
+_JS_REGEX = re.compile(r'/(?![*/])(?:[^/\\\[\r\n]|\\[^\r\n]|\[(?:[^\]\\\r\n]|\\[^\r\n])*\])+/[A-Za-z]*')
+_JS_NUMBER = re.compile(r'0[xXoObB][0-9a-fA-F_]+n?|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d[\d_]*)?n?')
+_JS_WORD = re.compile(r'#?(?:[\w$]|[^\x00-\x7f]|\\u[0-9a-fA-F]{4}|\\u\{[0-9a-fA-F]+\})+')
+_JS_PUNCTUATOR = re.compile(
+    r'>>>=|\.\.\.|===|!==|\*\*=|<<=|>>=|>>>|&&=|\|\|=|\?\?=|=>|==|!=|<=|>=|&&|\|\||\?\?|\?\.(?!\d)|\+\+|--'
+    r'|\+=|-=|\*=|/=|%=|&=|\|=|\^=|\*\*|<<|>>|[{}()\[\];,<>+\-*/%&|^!~?:=.@]')
+
+# After these a `/` starts a regex literal rather than a division
+_REGEX_KEYWORDS = {'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw', 'case', 'do',
+                   'else', 'yield', 'await'}
+# A line break after these always ends the statement (restricted productions)
+_RESTRICTED = {'return', 'throw', 'break', 'continue', 'yield', 'async', '++', '--'}
+# An expression cannot end with these, so a following line break is never a statement boundary
+_CONTINUES_AFTER = {'{', '(', '[', ',', ';', ':', '?', '.', '?.', '=', '==', '===', '!=', '!==', '<', '>', '<=', '>=',
+                    '+', '-', '*', '/', '%', '**', '&', '|', '^', '!', '~', '&&', '||', '??', '+=', '-=', '*=', '/=',
+                    '%=', '**=', '<<=', '>>=', '>>>=', '&=', '|=', '^=', '&&=', '||=', '??=', '=>', '<<', '>>', '>>>',
+                    '...'}
+# A statement never starts with these, so the previous line continues regardless of the line break
+_CONTINUES_BEFORE = {')', ']', '}', ',', ';', '.', '?.', ':', '?', '=', '==', '===', '!=', '!==', '<', '>', '<=', '>=',
+                     '*', '%', '**', '&', '|', '^', '&&', '||', '??', '+=', '-=', '*=', '/=', '%=', '**=', '<<=',
+                     '>>=', '>>>=', '&=', '|=', '^=', '&&=', '||=', '??=', '=>', '<<', '>>', '>>>', 'in',
+                     'instanceof', '(', '[', '+', '-', '/'}
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch in '_$\\#' or ord(ch) > 0x7f
+
+
+def _js_tokens(text: str):
+    """Yield (kind, value, line_break_before) for every significant token"""
+    pos = 0
+    n = len(text)
+    braces: List[str] = []          # 'brace' or 'template' for each open `{` / `${`
+    previous: Optional[Tuple[str, str]] = None
+    newline = False
+
+    def template_chunk(start: int) -> int:
+        """Scan template text from start; returns the end of `...` or `${`"""
+        end = _JS_TEMPLATE_CHUNK.match(text, start).end()
+        if end >= n:
+            raise MinifyError("Unterminated template literal", text, start)
+        if text[end] == '`':
+            return end + 1
+        braces.append('template')
+        return end + 2
+
+    while pos < n:
+        ch = text[pos]
+        match = _JS_SPACE.match(text, pos)
+        if match:
+            newline = newline or _line_break(match.group())
+            pos = match.end()
+            continue
+        if text.startswith('//', pos):
+            pos = _JS_LINE_COMMENT.match(text, pos).end()
+            continue
+        if text.startswith('/*', pos):
+            match = _JS_BLOCK_COMMENT.match(text, pos)
+            if not match:
+                raise MinifyError("Unterminated comment", text, pos)
+            comment = match.group()
+            pos = match.end()
+            if comment.startswith('/*!'):
+                yield 'comment', comment, newline
+                newline = False
+            else:
+                newline = newline or _line_break(comment)
+            continue
+
+        if ch in '"\'':
+            match = _JS_STRING[ch].match(text, pos)
+            if not match:
+                raise MinifyError("Unterminated string", text, pos)
+            kind, end = 'string', match.end()
+        elif ch == '`':
+            kind, end = 'template', template_chunk(pos + 1)
+        elif ch == '}' and braces and braces[-1] == 'template':
+            braces.pop()
+            kind, end = 'template', template_chunk(pos + 1)
+        elif ch == '/' and _regex_allowed(previous):
+            match = _JS_REGEX.match(text, pos)
+            if not match:
+                raise MinifyError("Unterminated regular expression", text, pos)
+            kind, end = 'regex', match.end()
+        elif ch.isdigit() or (ch == '.' and pos + 1 < n and text[pos + 1].isdigit()):
+            kind, end = 'number', _JS_NUMBER.match(text, pos).end()
+        else:
+            match = _JS_WORD.match(text, pos)
+            if match:
+                kind, end = 'word', match.end()
+            else:
+                match = _JS_PUNCTUATOR.match(text, pos)
+                kind, end = 'punct', match.end() if match else pos + 1
+                if text[pos] == '{':
+                    braces.append('brace')
+                elif text[pos] == '}' and braces:
+                    braces.pop()
+        value = text[pos:end]
+        yield kind, value, newline
+        previous = (kind, value)
+        newline = False
+        pos = end
+    if 'template' in braces:
+        # A `${` substitution that never closed
+        raise MinifyError("Unterminated template literal", text, n)
+
+
+def _regex_allowed(previous: Optional[Tuple[str, str]]) -> bool:
+    if previous is None:
+        return True
+    kind, value = previous
+    if kind == 'punct':
+        return value not in (')', ']', '}')
+    if kind == 'word':
+        return value in _REGEX_KEYWORDS
+    return kind == 'comment'
+
+
+def _js_needs_space(left: str, right: str, left_kind: str) -> bool:
+    if _is_word_char(left[-1]) and _is_word_char(right[0]):
+        return True
+    if left[-1] in '+-' and right[0] == left[-1]:
+        return True                                  # a - -b, a + ++b
+    if left[-1] == '/' and right[0] in '/*':
+        return True                                  # a / /re/ must not become a comment
+    if left_kind == 'number' and right[0] == '.' and not re.search(r'[.eExXn]', left):
+        return True                                  # 1 .toString()
+    if left.endswith('<') and right.startswith('!--') or left.endswith('--') and right[0] == '>':
+        return True                                  # never form <!-- or -->
+    return False
+
+
+def minify_js(text: str) -> str:
+    out: List[str] = []
+    previous_kind = previous_value = None
+    for kind, value, newline in _js_tokens(text):
+        if previous_value is not None:
+            keep_break = newline and (previous_value in _RESTRICTED or not (
+                (previous_kind == 'punct' and previous_value in _CONTINUES_AFTER)
+                or (kind in ('punct', 'word') and value in _CONTINUES_BEFORE)
+                or kind == 'template' and previous_kind != 'template'))
+            if kind == 'comment' or previous_kind == 'comment':
+                out.append('\n')
+            elif keep_break:
+                out.append('\n')
+            elif _js_needs_space(previous_value, value, previous_kind):
+                out.append(' ')
+        out.append(value)
+        previous_kind, previous_value = kind, value
+    return ''.join(out)
+
+
+# -------------------------
+# CSS
+# -------------------------
+
+_CSS_SPACE = re.compile(r'\s+')
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_STRING = {
+    '"': re.compile(r'"(?:[^"\\\n]|\\[\s\S])*"'),
+    "'": re.compile(r"'(?:[^'\\\n]|\\[\s\S])*'")
+}
+_CSS_URL = re.compile(r'url\(\s*([^)\'"\s]*)\s*\)', re.I)
+_CSS_RUN = re.compile(r'[^\s"\'/{};,>:()!]+|/')
+_CSS_TIGHT_BEFORE = set('{};,>)!')
+_CSS_TIGHT_AFTER = set('{};,>(:')
+
+
+def minify_css(text: str) -> str:
+    out: List[str] = []
+    pos = 0
+    n = len(text)
+    space = False
+    while pos < n:
+        ch = text[pos]
+        match = _CSS_SPACE.match(text, pos)
+        if match:
+            space = True
+            pos = match.end()
+            continue
+        if text.startswith('/*', pos):
+            match = _CSS_COMMENT.match(text, pos)
+            if not match:
+                raise MinifyError("Unterminated comment", text, pos)
+            if match.group().startswith('/*!'):
+                out.append(match.group())
+            else:
+                # A comment separates tokens like whitespace does (a/**/b is two tokens)
+                space = space or bool(out and out[-1][-1] not in _CSS_TIGHT_AFTER)
+            pos = match.end()
+            continue
+        if ch in '"\'':
+            match = _CSS_STRING[ch].match(text, pos)
+            if not match:
+                raise MinifyError("Unterminated string", text, pos)
+            token = match.group()
+        elif ch in 'uU' and _CSS_URL.match(text, pos):
+            match = _CSS_URL.match(text, pos)
+            token = f'url({match.group(1)})'
+        else:
+            match = _CSS_RUN.match(text, pos)
+            token = match.group() if match else ch
+        pos += len(match.group()) if match else 1
+        if token == '}' and out and out[-1] == ';':
+            out.pop()
+        if space and out and out[-1][-1] not in _CSS_TIGHT_AFTER and token[0] not in _CSS_TIGHT_BEFORE:
+            out.append(' ')
+        space = False
+        out.append(token)
+    return ''.join(out)
+
+
+# -------------------------
+# HTML
+# -------------------------
+
+_HTML_COMMENT = re.compile(r'<!--.*?-->', re.S)
+_HTML_DECLARATION = re.compile(r'<![^>]*>|<\?.*?\?>', re.S)
+_HTML_TAG = re.compile(r'</?([A-Za-z][\w:-]*)((?:"[^"]*"|\'[^\']*\'|\{\{.*?\}\}|\{%.*?%\}|[^>"\'{]|\{)*)>', re.S)
+_HTML_TAG_PARTS = re.compile(r'"[^"]*"|\'[^\']*\'|\{\{.*?\}\}|\{%.*?%\}|\s+|[^"\'\s{]+|\{', re.S)
+_HTML_JINJA = re.compile(r'\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\}', re.S)
+_HTML_TEXT = re.compile(r'[^<{]+|\{')
+_HTML_RAW = {'script', 'style', 'pre', 'textarea'}
+_HTML_BLOCK = {
+    'html', 'head', 'body', 'title', 'meta', 'link', 'script', 'style', 'noscript', 'template', 'base',
+    'div', 'p', 'section', 'article', 'header', 'footer', 'nav', 'main', 'aside', 'form', 'fieldset', 'legend',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li', 'dl', 'dt', 'dd', 'table', 'caption', 'colgroup', 'col',
+    'thead', 'tbody', 'tfoot', 'tr', 'td', 'th', 'hr', 'figure', 'figcaption', 'blockquote', 'details',
+    'summary', 'dialog', 'optgroup', 'pre'
+}
+_JS_TYPES = {'', 'text/javascript', 'application/javascript', 'module', 'text/ecmascript'}
+
+
+def _collapse_tag(tag: str) -> str:
+    """Collapse whitespace between attributes; quoted values and Jinja blocks stay verbatim"""
+    parts = [' ' if part.isspace() else part for part in _HTML_TAG_PARTS.findall(tag)]
+    collapsed = ''.join(parts)
+    return re.sub(r'\s+(/?>)$', r'\1', collapsed)
+
+
+def _script_type(tag: str) -> str:
+    match = re.search(r'\stype\s*=\s*["\']?([^"\'\s>]*)', tag, re.I)
+    return match.group(1).lower() if match else ''
+
+
+def _html_tokens(text: str):
+    """Yield (kind, value, tag name) tokens: tag, text, raw, keep (comments/doctype/Jinja kept verbatim)"""
+    pos = 0
+    n = len(text)
+    while pos < n:
+        if text.startswith('<!--', pos):
+            match = _HTML_COMMENT.match(text, pos)
+            if not match:
+                raise MinifyError("Unterminated comment", text, pos)
+            comment = match.group()
+            if comment.startswith(('<!--[if', '<!--<![endif]', '<!--!')):
+                yield 'keep', comment, '!'
+            pos = match.end()
+            continue
+        if text.startswith(('<!', '<?'), pos):
+            match = _HTML_DECLARATION.match(text, pos)
+            if match:
+                yield 'keep', match.group(), '!'
+                pos = match.end()
+                continue
+        if text[pos] == '<':
+            match = _HTML_TAG.match(text, pos)
+            if match:
+                name = match.group(1).lower()
+                tag = _collapse_tag(match.group())
+                closing = tag.startswith('</')
+                yield 'tag', tag, name
+                pos = match.end()
+                if name in _HTML_RAW and not closing and not tag.endswith('/>'):
+                    close = re.compile(r'</%s\s*>' % name, re.I).search(text, pos)
+                    if not close:
+                        raise MinifyError(f"Unclosed <{name}>", text, pos)
+                    body = text[pos:close.start()]
+                    if name == 'script' and _script_type(tag) in _JS_TYPES and not _HTML_JINJA.search(body):
+                        body = minify_js(body)
+                    elif name == 'style' and not _HTML_JINJA.search(body):
+                        body = minify_css(body)
+                    yield 'raw', body, name
+                    yield 'tag', f'</{name}>', name
+                    pos = close.end()
+                continue
+        match = _HTML_JINJA.match(text, pos)
+        if match:
+            yield 'jinja', match.group(), None
+            pos = match.end()
+            continue
+        match = _HTML_TEXT.match(text, pos)
+        yield 'text', match.group() if match else text[pos], None
+        pos = match.end() if match else pos + 1
+
+
+def _merge_text(tokens):
+    """Join adjacent text tokens (split at `{` or by a dropped comment) into one run"""
+    merged = []
+    for token in tokens:
+        if token[0] == 'text' and merged and merged[-1][0] == 'text':
+            merged[-1] = ('text', merged[-1][1] + token[1], None)
+        else:
+            merged.append(token)
+    return merged
+
+
+def minify_html(text: str) -> str:
+    tokens = _merge_text(_html_tokens(text))
+    out: List[str] = []
+    for i, (kind, value, name) in enumerate(tokens):
+        if kind != 'text':
+            out.append(value)
+            continue
+        collapsed = re.sub(r'\s+', ' ', value)
+        if collapsed == value.strip() == collapsed.strip() and collapsed:
+            out.append(collapsed)
+            continue
+        before = _neighbour(tokens, i, -1)
+        after = _neighbour(tokens, i, 1)
+        if before is None or before in _HTML_BLOCK or before == '!':
+            collapsed = collapsed.lstrip()
+        if after is None or after in _HTML_BLOCK or after == '!':
+            collapsed = collapsed.rstrip()
+        if collapsed:
+            out.append(collapsed)
+    return ''.join(out)
+
+
+def _neighbour(tokens, index: int, step: int) -> Optional[str]:
+    """Tag name of the token directly beside a text run, None at either end (Jinja tags count as inline)"""
+    j = index + step
+    if not 0 <= j < len(tokens):
+        return None
+    kind, _, name = tokens[j]
+    return name if kind in ('tag', 'keep') else 'jinja'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js, '.mjs': minify_js, '.html': minify_html, '.htm': minify_html}
+
+
+def minify(text: str, ext: str) -> str:
+    """Minify text by file extension; unknown extensions are returned unchanged"""
+    minifier = MINIFIERS.get(ext.lower())
+    return minifier(text) if minifier else text
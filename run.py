@@ -1,11 +1,17 @@
-from waitress import serve
-from app import app
+from waitress import create_server
+from app import app, model_backend, model_registry
+from services.registry import prewarm_enabled
 import os
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print(f"Starting server...")
+    server = create_server(app, host='0.0.0.0', port=port, threads=4, url_scheme='http')
+    # Models are built lazily; warm them (and the process backend's workers) in the background once the socket is bound
+    if prewarm_enabled():
+        model_registry.prewarm()
+        model_backend.prewarm()
     print(f"You can access the application at:")
     print(f"* Local:            http://localhost:{port}")
     print(f"* On Your Network:  http://127.0.0.1:{port}")
-    serve(app, host='0.0.0.0', port=port, threads=4, url_scheme='http')
+    server.run()
@@ -0,0 +1,4 @@
+"""
+Shared request-processing services used by the Flask app
+(dataset ingestion, caching, execution and monitoring helpers)
+"""
@@ -0,0 +1,267 @@
+"""
+Vectorized multi-algorithm anomaly detection
+
+Scores every selected numeric column of a ColumnarFrame at once. Columns are
+stacked into float matrices (NaN for nulls) a block at a time and each method
+is one NumPy kernel over the whole block:
+
+- zscore: distance from the mean in standard deviations
+- mad: robust z-score around the median (median absolute deviation)
+- iqr: distance outside the Tukey fences, in IQR units
+- rolling: residual against the trailing window mean/std, computed from
+  cumulative sums in O(n) instead of re-reducing every window
+
+Quantiles are computed once per block and shared by the mad and iqr kernels.
+"""
+
+import math
+import time
+import warnings
+from typing import Any, Dict, List, Mapping, Optional
+
+import numpy as np
+
+from services.columnar import NUMERIC, ColumnarFrame
+
+METHODS = ('zscore', 'mad', 'iqr', 'rolling')
+DEFAULT_THRESHOLDS = {
+    'zscore': 3.0,
+    'mad': 3.5,
+    'iqr': 1.5,
+    'rolling': 3.0
+}
+DEFAULT_WINDOW = 30
+BLOCK_COLUMNS = 16   # bounds the temporary matrices for wide tables
+MAX_REPORTED = 100   # anomalies listed per column and method (all are counted)
+
+
+class AnomalyOptionsError(ValueError):
+    """Raised for unknown columns or methods in an anomaly request"""
+
+
+def _as_list(value) -> Optional[List[str]]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return [str(item) for item in value]
+
+
+def parse_options(source: Mapping) -> Optional[Dict[str, Any]]:
+    """Engine options from a JSON body or query string; None selects the model detector"""
+    columns = _as_list(source.get('columns'))
+    methods = _as_list(source.get('methods'))
+    if columns is None and methods is None and source.get('engine') != 'vectorized':
+        return None
+    options = {'columns': columns, 'methods': methods}
+    try:
+        if source.get('window') is not None:
+            options['window'] = int(source.get('window'))
+        if source.get('min_votes') is not None:
+            options['min_votes'] = int(source.get('min_votes'))
+    except (TypeError, ValueError):
+        raise AnomalyOptionsError("window and min_votes must be integers")
+    return options
+
+
+def _zscore(block: np.ndarray, mean: np.ndarray, std: np.ndarray) -> np.ndarray:
+    scores = block - mean
+    scores /= np.where(std > 0, std, np.nan)
+    return scores
+
+
+def _mad(block: np.ndarray, median: np.ndarray, nulls: bool) -> np.ndarray:
+    deviation = np.abs(block - median)
+    mad = (np.nanmedian if nulls else np.median)(deviation, axis=0) * 1.4826
+    # Mostly-constant columns have MAD 0; fall back to the (scaled) mean absolute deviation
+    flat = mad == 0
+    if flat.any():
+        mad[flat] = np.nanmean(deviation[:, flat], axis=0) * 1.2533
+    scores = np.subtract(block, median, out=deviation)
+    scores /= np.where(mad > 0, mad, np.nan)
+    return scores
+
+
+def _iqr(block: np.ndarray, q1: np.ndarray, q3: np.ndarray, k: float) -> np.ndarray:
+    iqr = q3 - q1
+    iqr[iqr == 0] = np.nan
+    # Signed distance outside the fences in IQR units, 0 inside them
+    scores = np.minimum(block - (q1 - k * iqr), 0)
+    scores += np.maximum(block - (q3 + k * iqr), 0)
+    scores /= iqr
+    return scores
+
+
+def _window_sums(prefix: np.ndarray, window: int) -> np.ndarray:
+    """Sums over the previous `window` rows from prefix sums with a leading zero row"""
+    n = prefix.shape[0] - 1
+    # A window longer than the data covers every previous row
+    window = min(window, n)
+    sums = np.empty((n,) + prefix.shape[1:], order='F')
+    sums[:window] = prefix[:window]
+    np.subtract(prefix[window:n], prefix[:n - window], out=sums[window:])
+    return sums
+
+
+def _rolling(block: np.ndarray, mean: np.ndarray, std: np.ndarray, window: int, nulls: bool) -> np.ndarray:
+    """Residual of each value against the mean/std of the previous `window` values"""
+    n = block.shape[0]
+    min_periods = max(3, window // 2)
+    # Standardize first so the running sums stay well conditioned
+    centered = block - mean
+    centered /= np.where(std > 0, std, 1.0)
+    if nulls:
+        present = ~np.isnan(centered)
+        filled = np.where(present, centered, 0.0)
+        prefix = np.zeros((n + 1, block.shape[1]), order='F')
+        np.cumsum(present, axis=0, out=prefix[1:])
+        count = _window_sums(prefix, window)
+    else:
+        filled = centered
+        count = np.minimum(np.arange(n), window).astype(np.float64)[:, None]
+
+    prefix = np.zeros((n + 1, block.shape[1]), order='F')
+    np.cumsum(filled, axis=0, out=prefix[1:])
+    window_mean = _window_sums(prefix, window)
+    np.cumsum(np.square(filled), axis=0, out=prefix[1:])
+    variance = _window_sums(prefix, window)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        window_mean /= count
+        # Sample variance: (sum of squares / count - mean^2) * count / (count - 1)
+        variance /= count
+        variance -= np.square(window_mean)
+        variance *= count / (count - 1)
+        np.clip(variance, 0, None, out=variance)
+        std_window = np.sqrt(variance, out=variance)
+        std_window[(std_window < 1e-12) | np.broadcast_to(count < min_periods, std_window.shape)] = np.nan
+        centered -= window_mean
+        centered /= std_window
+    return centered
+
+
+def _number(value) -> Optional[float]:
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _top(scores: np.ndarray, flagged: np.ndarray, values: np.ndarray) -> List[Dict[str, Any]]:
+    indices = np.flatnonzero(flagged)
+    if len(indices) > MAX_REPORTED:
+        strength = np.abs(scores[indices])
+        indices = indices[np.argpartition(-strength, MAX_REPORTED)[:MAX_REPORTED]]
+    indices = indices[np.argsort(-np.abs(scores[indices]))]
+    return [{'index': int(i), 'value': float(values[i]), 'score': round(float(scores[i]), 4)} for i in indices]
+
+
+def detect_anomalies(frame: ColumnarFrame, columns: Optional[List[str]] = None,
+                     methods: Optional[List[str]] = None, window: int = DEFAULT_WINDOW,
+                     min_votes: Optional[int] = None,
+                     profile: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Score the selected numeric columns with the selected methods
+
+    With the frame's `profile` (ColumnarFrame.profile()) the column kinds, null
+    counts, means and standard deviations are taken from it instead of recomputed.
+    """
+    start_time = time.time()
+    methods = list(dict.fromkeys(methods or METHODS))
+    unknown = [method for method in methods if method not in METHODS]
+    if unknown:
+        raise AnomalyOptionsError(f"Unknown anomaly methods: {', '.join(unknown)}. "
+                                  f"Available: {', '.join(METHODS)}")
+    if profile is not None:
+        numeric = [name for name, stats in profile.items() if stats['kind'] == NUMERIC]
+    else:
+        numeric = frame.numeric_columns()
+    if columns is None:
+        columns = numeric
+    else:
+        invalid = [name for name in columns if name not in numeric]
+        if invalid:
+            raise AnomalyOptionsError(f"Not numeric columns of this dataset: {', '.join(invalid)}")
+    if window < 2:
+        raise AnomalyOptionsError("window must be at least 2")
+    min_votes = max(1, min(min_votes or (len(methods) + 1) // 2, len(methods)))
+
+    n = len(frame)
+    if n == 0:
+        columns = []
+    row_votes = np.zeros(n, dtype=np.int16)
+    report = {}
+    for offset in range(0, len(columns), BLOCK_COLUMNS):
+        names = columns[offset:offset + BLOCK_COLUMNS]
+        block = np.empty((n, len(names)), dtype=np.float64, order='F')
+        for j, name in enumerate(names):
+            col = frame.column(name)
+            block[:, j] = col.values
+            block[col.mask, j] = np.nan
+
+        with warnings.catch_warnings():
+            # All-null columns produce NaN statistics (and NumPy warnings); they simply score nothing
+            warnings.simplefilter('ignore', RuntimeWarning)
+            # Shared per-block statistics; the NaN-aware reductions are only needed with nulls
+            if profile is not None:
+                nulls = any(profile[name]['nulls'] for name in names)
+            else:
+                nulls = bool(np.isnan(block).any())
+            if nulls:
+                q1, median, q3 = np.nanpercentile(block, [25, 50, 75], axis=0)
+            else:
+                q1, median, q3 = np.percentile(block, [25, 50, 75], axis=0)
+            if profile is not None:
+                mean = np.array([profile[name].get('mean', np.nan) for name in names])
+                std = np.array([profile[name].get('std', np.nan) for name in names])
+            elif nulls:
+                mean, std = np.nanmean(block, axis=0), np.nanstd(block, axis=0)
+            else:
+                mean, std = block.mean(axis=0), block.std(axis=0)
+            scores = {}
+            if 'zscore' in methods:
+                scores['zscore'] = _zscore(block, mean, std)
+            if 'mad' in methods:
+                scores['mad'] = _mad(block, median, nulls)
+            if 'iqr' in methods:
+                scores['iqr'] = _iqr(block, q1.copy(), q3.copy(), DEFAULT_THRESHOLDS['iqr'])
+            if 'rolling' in methods:
+                scores['rolling'] = _rolling(block, mean, std, window, nulls)
+
+        votes = np.zeros(block.shape, dtype=np.int16)
+        flags = {}
+        with np.errstate(invalid='ignore'):
+            for method, score in scores.items():
+                threshold = 0.0 if method == 'iqr' else DEFAULT_THRESHOLDS[method]
+                flags[method] = np.abs(score) > threshold
+                votes += flags[method]
+        np.maximum(row_votes, votes.max(axis=1), out=row_votes)
+
+        for j, name in enumerate(names):
+            report[name] = {
+                'count': int(n - np.isnan(block[:, j]).sum()),
+                'median': _number(median[j]),
+                'q1': _number(q1[j]),
+                'q3': _number(q3[j]),
+                'methods': {
+                    method: {
+                        'threshold': DEFAULT_THRESHOLDS[method],
+                        'anomaly_count': int(flags[method][:, j].sum()),
+                        'anomalies': _top(scores[method][:, j], flags[method][:, j], block[:, j])
+                    }
+                    for method in scores
+                }
+            }
+
+    combined = np.flatnonzero(row_votes >= min_votes)
+    return {
+        'success': True,
+        'engine': 'vectorized',
+        'rows': n,
+        'methods': methods,
+        'window': window,
+        'columns': report,
+        'combined': {
+            'min_votes': min_votes,
+            'anomaly_count': int(len(combined)),
+            'rows': combined[:MAX_REPORTED * 10].tolist()
+        },
+        'execution_time': time.time() - start_time
+    }
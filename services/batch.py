@@ -0,0 +1,64 @@
+"""
+Batch analysis over one uploaded dataset
+
+The dataset is ingested and profiled once; the requested analyses then run
+concurrently against the same ColumnarFrame, each handed that profile, and
+their results are returned together, each with its own timing.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from services.columnar import ColumnarFrame
+
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', 4))
+
+_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='analyze-batch')
+
+
+def _timed(runner: Callable[[], Any]) -> Dict[str, Any]:
+    start_time = time.time()
+    try:
+        result = runner()
+        return {'success': True, 'result': result, 'execution_time': time.time() - start_time}
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e),
+            'error_type': type(e).__name__,
+            'execution_time': time.time() - start_time
+        }
+
+
+def run_batch(frame: ColumnarFrame, analyses: List[str],
+              runners: Dict[str, Callable[[ColumnarFrame, Dict[str, Any]], Any]]) -> Dict[str, Any]:
+    """Run the named analyses concurrently over one frame; each runner gets (frame, profile)"""
+    if not isinstance(analyses, list) or not all(isinstance(name, str) for name in analyses):
+        raise ValueError(f"analyses must be a list of analysis names. Available: {', '.join(sorted(runners))}")
+    unknown = [name for name in analyses if name not in runners]
+    if unknown:
+        raise ValueError(f"Unknown analyses: {', '.join(unknown)}. "
+                         f"Available: {', '.join(sorted(runners))}")
+
+    start_time = time.time()
+    profile = frame.profile()
+    profile_time = time.time() - start_time
+
+    # Deduplicate while keeping the requested order
+    names = list(dict.fromkeys(analyses))
+    futures = {name: _executor.submit(_timed, lambda runner=runners[name]: runner(frame, profile)) for name in names}
+    results = {name: future.result() for name, future in futures.items()}
+
+    return {
+        'success': all(r['success'] for r in results.values()),
+        'rows': len(frame),
+        'profile': profile,
+        'results': results,
+        'timings': {
+            'profile': profile_time,
+            **{name: r['execution_time'] for name, r in results.items()},
+            'total': time.time() - start_time
+        }
+    }
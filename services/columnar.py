@@ -0,0 +1,379 @@
+"""
+Columnar dataset ingestion
+
+Wraps the `dataset` payload of the analytics endpoints (a list of row dicts or
+a dict of column lists) in a ColumnarFrame once per request. The frame keeps
+the payload exactly as sent: row-based models get it back from to_records()
+as a real list, and the fingerprint hashes its canonical JSON, so payloads
+that differ only in JSON type or text ('01234' / 1234, two spellings of one
+timestamp) never share a cache entry or a dataset id. Typed columns (a NumPy
+array plus a null mask each) are inferred on first use of `columns`, so a
+request whose models only read rows pays no per-cell Python pass. Strings stay
+strings unless they are timestamps; only CSV text is parsed as numbers.
+"""
+
+import hashlib
+import json
+import math
+import re
+import warnings
+from collections.abc import Mapping, Sequence
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+NUMERIC = 'numeric'
+BOOLEAN = 'boolean'
+DATETIME = 'datetime'
+STRING = 'string'
+
+# numpy also reads bare numbers ('2024', '01234') as years; timestamps need at least YYYY-MM
+_DATE_TEXT = re.compile(r'\s*[+-]?\d{4,}-\d\d')
+
+
+class Column:
+    """A single typed column with a null mask (True where the value is missing)
+
+    `exact` is set when the column was inferred from payload values that it gives
+    back unchanged (as to_list(), or as ints when `integral`), so the payload can
+    be rebuilt from the arrays.
+    """
+
+    __slots__ = ('name', 'values', 'mask', 'kind', 'exact', 'integral')
+
+    def __init__(self, name: str, values: np.ndarray, mask: np.ndarray, kind: str,
+                 exact: bool = False, integral: bool = False):
+        self.name = name
+        self.values = values
+        self.mask = mask
+        self.kind = kind
+        self.exact = exact
+        self.integral = integral
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @property
+    def null_count(self) -> int:
+        return int(self.mask.sum())
+
+    def valid(self) -> np.ndarray:
+        """Return the non-null values"""
+        return self.values[~self.mask]
+
+    def value_at(self, index: int) -> Any:
+        """One value as a JSON-friendly Python value (None for nulls)"""
+        if self.mask[index]:
+            return None
+        if self.kind == DATETIME:
+            return str(np.datetime_as_string(self.values[index], unit='auto'))
+        return self.values[index].item() if isinstance(self.values[index], np.generic) else self.values[index]
+
+    def to_list(self) -> List[Any]:
+        """Convert back to JSON-friendly Python values (None for nulls)"""
+        if self.kind == DATETIME:
+            out = np.datetime_as_string(self.values, unit='auto').tolist()
+        else:
+            out = self.values.tolist()
+        if self.mask.any():
+            for i in np.flatnonzero(self.mask).tolist():
+                out[i] = None
+        return out
+
+
+def _is_null(value: Any) -> bool:
+    return value is None or value == '' or (isinstance(value, float) and math.isnan(value))
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+def _leading_zero(value: Any) -> bool:
+    # '01234' is an identifier (zip code, account number), not the number 1234
+    return isinstance(value, str) and len(value) > 1 and value[0] == '0' and value[1].isdigit()
+
+
+def infer_column(name: str, raw: Sequence, parse_text: bool = False) -> Column:
+    """Infer the column type from raw Python values and build its arrays
+
+    JSON strings are never read as numbers; `parse_text` does that for CSV cells,
+    which carry no types (values with a leading zero still keep the column text).
+    """
+    n = len(raw)
+    mask = np.fromiter((_is_null(v) for v in raw), dtype=bool, count=n)
+    present = [v for v, m in zip(raw, mask.tolist()) if not m]
+    # Whether the arrays give the values back: nulls must be None and every value one Python type
+    plain_nulls = all(raw[i] is None for i in np.flatnonzero(mask).tolist())
+    types = {type(v) for v in present}
+
+    if present and all(isinstance(v, (bool, np.bool_)) for v in present):
+        values = np.zeros(n, dtype=bool)
+        values[~mask] = present
+        return Column(name, values, mask, BOOLEAN, exact=plain_nulls and types == {bool})
+
+    if parse_text:
+        numeric = all(_is_number(v) or (isinstance(v, str) and not _leading_zero(v)) for v in present)
+    else:
+        numeric = all(_is_number(v) for v in present)
+    if numeric:
+        try:
+            values = np.full(n, np.nan, dtype=np.float64)
+            values[~mask] = np.asarray(present, dtype=np.float64)
+            integral = bool(types) and types <= {int} and bool(np.abs(values[~mask]).max() <= 2 ** 53)
+            exact = plain_nulls and not parse_text and (types <= {float} or integral)
+            return Column(name, values, mask, NUMERIC, exact=exact, integral=integral)
+        except (TypeError, ValueError):
+            pass
+
+    if present and all(isinstance(v, str) and _DATE_TEXT.match(v) for v in present):
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                parsed = np.asarray(present, dtype='datetime64[ms]')
+            values = np.full(n, np.datetime64('NaT'), dtype='datetime64[ms]')
+            values[~mask] = parsed
+            return Column(name, values, mask, DATETIME)
+        except (TypeError, ValueError):
+            pass
+
+    values = np.empty(n, dtype=object)
+    values[:] = [None if m else (v if isinstance(v, str) else str(v)) for v, m in zip(raw, mask.tolist())]
+    return Column(name, values, mask, STRING, exact=plain_nulls and types <= {str})
+
+
+def profile_column(col: Column) -> Dict[str, Any]:
+    """Summary statistics for one column"""
+    valid = col.valid()
+    stats = {'kind': col.kind, 'count': int(len(valid)), 'nulls': col.null_count}
+    if not len(valid):
+        return stats
+    if col.kind == NUMERIC:
+        stats.update({
+            'min': float(valid.min()),
+            'max': float(valid.max()),
+            'mean': float(valid.mean()),
+            'std': float(valid.std()),
+            'sum': float(valid.sum())
+        })
+    elif col.kind == DATETIME:
+        stats.update({
+            'min': str(valid.min()),
+            'max': str(valid.max())
+        })
+    elif col.kind == BOOLEAN:
+        stats['true_count'] = int(valid.sum())
+    else:
+        values, counts = np.unique(valid.astype(str), return_counts=True)
+        top = np.argsort(counts)[::-1][:5]
+        stats.update({
+            'distinct': int(len(values)),
+            'top_values': [{'value': str(values[i]), 'count': int(counts[i])} for i in top.tolist()]
+        })
+    return stats
+
+
+def payload_length(payload: Any) -> int:
+    """Row count of a list-of-rows or mapping-of-columns payload"""
+    if isinstance(payload, Mapping):
+        lengths = {len(values) for values in payload.values()}
+        if len(lengths) > 1:
+            raise ValueError("All dataset columns must have the same length")
+        return lengths.pop() if lengths else 0
+    return len(payload)
+
+
+def _json_default(value: Any) -> Any:
+    # Values JSON cannot carry (e.g. from MessagePack) still hash by type and content
+    if isinstance(value, np.generic):
+        return value.item()
+    return {'__type__': type(value).__name__, 'repr': repr(value)}
+
+
+def canonical_payload(payload: Any) -> bytes:
+    """Exact JSON encoding of a payload: key order, JSON types and string text are all preserved"""
+    return json.dumps(payload, separators=(',', ':'), default=_json_default).encode('ascii')
+
+
+class ColumnarFrame(Sequence):
+    """Typed columnar view of a request dataset, shared by all models of a request
+
+    Built from typed `columns`, or from the original `payload` (list of row dicts or
+    mapping of column lists), whose columns are then inferred on first use. A frame
+    without a payload derives its rows from the typed columns; `records_limit` caps
+    that for large columnar-only frames (streamed uploads).
+    """
+
+    def __init__(self, columns: Optional[Dict[str, Column]] = None, payload: Any = None,
+                 payload_loader: Optional[Callable[[], Any]] = None, n_rows: Optional[int] = None):
+        self._columns = columns
+        self._payload = payload
+        self._payload_loader = payload_loader
+        if n_rows is None:
+            if columns is not None:
+                lengths = {len(col) for col in columns.values()}
+                if len(lengths) > 1:
+                    raise ValueError("All dataset columns must have the same length")
+                n_rows = lengths.pop() if lengths else payload_length(payload or [])
+            else:
+                n_rows = payload_length(payload or [])
+        self.n_rows = n_rows
+        self._records = payload if isinstance(payload, list) else None
+        self._pandas = None
+        self._fingerprint = None
+        self._profile = None
+        self.source: Optional[str] = None  # dataset store directory the columns are mapped from
+        self.records_limit: Optional[int] = None
+
+    @property
+    def columns(self) -> Dict[str, Column]:
+        if self._columns is None:
+            self._columns = _infer_columns(self.payload())
+        return self._columns
+
+    @property
+    def has_payload(self) -> bool:
+        return self._payload is not None or self._payload_loader is not None
+
+    def payload(self) -> Any:
+        """The original request payload, or None for frames built from typed columns"""
+        if self._payload is None and self._payload_loader is not None:
+            self._payload = self._payload_loader()
+        return self._payload
+
+    # Sequence protocol: behave like the original list of row dicts
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def __getitem__(self, index):
+        if self._records is None and not self.has_payload and isinstance(index, int):
+            # One row from the columns, without materialising every row dict
+            if index < 0:
+                index += self.n_rows
+            if not 0 <= index < self.n_rows:
+                raise IndexError(index)
+            return {name: col.value_at(index) for name, col in self.columns.items()}
+        return self.to_records()[index]
+
+    def __iter__(self):
+        return iter(self.to_records())
+
+    def __repr__(self) -> str:
+        return f"ColumnarFrame(rows={self.n_rows}, columns={list(self.columns)})"
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.columns)
+
+    def column(self, name: str) -> Column:
+        return self.columns[name]
+
+    def numeric_columns(self) -> List[str]:
+        return [name for name, col in self.columns.items() if col.kind == NUMERIC]
+
+    def dtypes(self) -> Dict[str, str]:
+        return {name: col.kind for name, col in self.columns.items()}
+
+    def fingerprint(self) -> str:
+        """Content hash: of the exact payload when there is one, else of the typed columns"""
+        if self._fingerprint is None:
+            if self.has_payload:
+                self._fingerprint = hashlib.sha256(b'payload|' + canonical_payload(self.payload())).hexdigest()
+                return self._fingerprint
+            digest = hashlib.sha256()
+            for name, col in self.columns.items():
+                digest.update(json.dumps([name, col.kind, len(col)]).encode())
+                digest.update(np.packbits(col.mask).tobytes())
+                if col.kind == STRING:
+                    digest.update(json.dumps(col.values.tolist()).encode())
+                else:
+                    digest.update(np.ascontiguousarray(col.values).tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def profile(self) -> Dict[str, Dict[str, Any]]:
+        """Per-column statistics, computed once and shared by every analysis of the request"""
+        if self._profile is None:
+            self._profile = {name: profile_column(col) for name, col in self.columns.items()}
+        return self._profile
+
+    def take(self, indices: np.ndarray) -> 'ColumnarFrame':
+        """New frame with the given rows, in the given order (original rows are carried along)"""
+        columns = {name: Column(name, col.values[indices], col.mask[indices], col.kind, col.exact, col.integral)
+                   for name, col in self.columns.items()}
+        if not self.has_payload:
+            return ColumnarFrame(columns)
+        records = self.to_records()
+        return ColumnarFrame(columns, payload=[records[i] for i in np.asarray(indices).tolist()])
+
+    def to_records(self) -> List[dict]:
+        """Row dicts: the request payload itself when it was a list of rows, else built once"""
+        if self._records is None:
+            payload = self.payload()
+            if isinstance(payload, list):
+                self._records = payload
+            elif isinstance(payload, Mapping):
+                names = list(payload)
+                self._records = [dict(zip(names, row)) for row in zip(*payload.values())]
+            else:
+                if self.records_limit is not None and self.n_rows > self.records_limit:
+                    # Lazy import: streaming builds on this module
+                    from services.streaming import StreamingError
+                    raise StreamingError(
+                        f"This dataset has {self.n_rows} rows and is held only as columns; above "
+                        f"{self.records_limit} rows use the columnar paths (engine=vectorized anomalies, "
+                        f"ensemble forecasts, profile_mode=sketch, rollup, /api/execute-query)")
+                names = list(self.columns)
+                lists = [self.columns[name].to_list() for name in names]
+                self._records = [dict(zip(names, row)) for row in zip(*lists)]
+        return self._records
+
+    def to_pandas(self):
+        """Build (once) a pandas DataFrame from the column arrays"""
+        if self._pandas is None:
+            import pandas as pd
+            data = {}
+            for name, col in self.columns.items():
+                if col.kind == BOOLEAN and col.mask.any():
+                    data[name] = pd.array(np.where(col.mask, None, col.values).tolist(), dtype='boolean')
+                else:
+                    data[name] = col.values
+            self._pandas = pd.DataFrame(data)
+        return self._pandas
+
+
+def _collect_column_names(rows: Iterable[Mapping]) -> List[str]:
+    names = {}
+    for row in rows:
+        for key in row:
+            if key not in names:
+                names[key] = None
+    return list(names)
+
+
+def _infer_columns(payload: Any) -> Dict[str, Column]:
+    if isinstance(payload, Mapping):
+        return {str(name): infer_column(str(name), values) for name, values in payload.items()}
+    names = _collect_column_names(payload)
+    return {name: infer_column(name, [row.get(name) for row in payload]) for name in names}
+
+
+def ingest_dataset(dataset: Any) -> ColumnarFrame:
+    """Wrap a request `dataset` payload in a ColumnarFrame (columns are inferred on first use)"""
+    if isinstance(dataset, ColumnarFrame):
+        return dataset
+    if dataset is None:
+        return ColumnarFrame({}, [])
+
+    if isinstance(dataset, Mapping):
+        # Column-oriented payload: {"col": [..], ...}
+        if not all(isinstance(values, list) for values in dataset.values()):
+            raise ValueError("Dataset columns must map names to lists of values")
+        return ColumnarFrame(payload=dataset)
+
+    if isinstance(dataset, list):
+        if not all(isinstance(row, Mapping) for row in dataset):
+            raise ValueError("Dataset rows must be JSON objects")
+        return ColumnarFrame(payload=dataset)
+
+    raise ValueError("Dataset must be a list of rows or a mapping of columns")
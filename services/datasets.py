@@ -0,0 +1,287 @@
+"""
+Upload-once dataset registry
+
+`PUT /api/datasets` stores a table once and returns its content hash, which is
+the ColumnarFrame fingerprint: the hash of the exact JSON payload when one was
+sent, so 1, 1.0 and "1" are different datasets. Any analytics endpoint can then
+take `dataset_id` instead of an inline `dataset`. Each dataset is a directory
+under DATASET_STORE_DIR holding the payload as sent (payload.json, read only
+when a model needs rows, so a stored dataset gives models exactly what the
+inline one would) and .npy files for the typed columns: values and null mask
+per column, and strings as UTF-8 bytes plus offsets. Column files are opened
+memory-mapped, so only the pages a kernel touches are read. Process backend
+workers map the same files instead of receiving a copy through shared memory.
+Streamed uploads have no payload and keep only the columns.
+
+Requests lease the datasets they use. Leased datasets are never evicted.
+Beyond DATASET_STORE_MAX_BYTES or DATASET_STORE_MAX_DATASETS, the least
+recently used unleased dataset is deleted. Entries already on disk are
+picked up again at startup.
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from services.columnar import STRING, Column, ColumnarFrame, canonical_payload
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+PAYLOAD_FILE = 'payload.json'
+OPEN_FRAMES = 16   # decoded frames kept open (string columns are decoded once per open)
+
+
+class DatasetStoreError(ValueError):
+    """Raised for unknown dataset ids or uploads the store cannot hold"""
+
+
+def _load(path: str, length: int) -> np.ndarray:
+    # Zero-length arrays cannot be mapped; mapped ones are handed out as plain read-only ndarrays
+    if not length:
+        return np.load(path, allow_pickle=False)
+    return np.load(path, mmap_mode='r', allow_pickle=False).view(np.ndarray)
+
+
+def write_frame(frame: ColumnarFrame, directory: str) -> Dict[str, Any]:
+    """Write the frame's payload (if any) and columns as .npy files, plus a meta.json describing them"""
+    os.makedirs(directory)
+    if frame.has_payload:
+        with open(os.path.join(directory, PAYLOAD_FILE), 'wb') as f:
+            f.write(canonical_payload(frame.payload()))
+    columns = []
+    for i, (name, col) in enumerate(frame.columns.items()):
+        entry = {'name': name, 'kind': col.kind}
+        np.save(os.path.join(directory, f'{i}.mask.npy'), np.ascontiguousarray(col.mask, dtype=bool))
+        if col.kind == STRING:
+            encoded = [b'' if v is None else str(v).encode('utf-8') for v in col.values.tolist()]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+            np.save(os.path.join(directory, f'{i}.offsets.npy'), offsets)
+            np.save(os.path.join(directory, f'{i}.blob.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        else:
+            np.save(os.path.join(directory, f'{i}.values.npy'), np.ascontiguousarray(col.values))
+        columns.append(entry)
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    meta = {'rows': len(frame), 'columns': columns, 'bytes': size, 'created_at': time.time(),
+            'records_limit': frame.records_limit, 'payload': frame.has_payload}
+    with open(os.path.join(directory, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def load_frame(directory: str, meta: Optional[Dict[str, Any]] = None) -> ColumnarFrame:
+    """Open a stored dataset; numeric, boolean and datetime columns stay memory-mapped"""
+    if meta is None:
+        with open(os.path.join(directory, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    n = meta['rows']
+    columns = {}
+    for i, entry in enumerate(meta['columns']):
+        name = entry['name']
+        mask = _load(os.path.join(directory, f'{i}.mask.npy'), n)
+        if entry['kind'] == STRING:
+            offsets = np.load(os.path.join(directory, f'{i}.offsets.npy'))
+            blob = _load(os.path.join(directory, f'{i}.blob.npy'), int(offsets[-1])).tobytes()
+            values = np.empty(n, dtype=object)
+            values[:] = [None if m else blob[a:b].decode('utf-8')
+                         for a, b, m in zip(offsets[:-1].tolist(), offsets[1:].tolist(), mask.tolist())]
+        else:
+            values = _load(os.path.join(directory, f'{i}.values.npy'), n)
+        columns[name] = Column(name, values, mask, entry['kind'])
+    payload_loader = None
+    if meta.get('payload'):
+        def payload_loader():
+            with open(os.path.join(directory, PAYLOAD_FILE), 'rb') as f:
+                return json.load(f)
+    frame = ColumnarFrame(columns, payload_loader=payload_loader)
+    frame.source = directory
+    frame.records_limit = meta.get('records_limit')
+    return frame
+
+
+class DatasetStore:
+    """Content-addressed datasets on local disk with leases and LRU eviction"""
+
+    def __init__(self, root: str, max_bytes: int = 2 * 1024 ** 3, max_datasets: int = 100):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_datasets = max_datasets
+        self._entries: OrderedDict = OrderedDict()   # id -> meta, least recently used first
+        self._leases: Dict[str, int] = {}
+        self._open: OrderedDict = OrderedDict()      # id -> ColumnarFrame
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.counters = {'uploads': 0, 'deduplicated': 0, 'hits': 0, 'evicted': 0}
+        self._scan()
+
+    def _path(self, dataset_id: str) -> str:
+        return os.path.join(self.root, dataset_id)
+
+    def _scan(self):
+        os.makedirs(self.root, exist_ok=True)
+        found = []
+        for name in os.listdir(self.root):
+            meta_path = os.path.join(self.root, name, META_FILE)
+            if name.startswith('.'):
+                # Interrupted upload
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                continue
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                found.append((os.path.getmtime(meta_path), name, meta))
+            except (OSError, ValueError):
+                continue
+        for _, name, meta in sorted(found):
+            self._entries[name] = meta
+            self._bytes += meta['bytes']
+
+    def put(self, frame: ColumnarFrame) -> Dict[str, Any]:
+        """Store the frame (once per content hash) and return its id and metadata"""
+        dataset_id = frame.fingerprint()
+        with self._lock:
+            self.counters['uploads'] += 1
+            if dataset_id in self._entries:
+                self.counters['deduplicated'] += 1
+                self._entries.move_to_end(dataset_id)
+                return {'dataset_id': dataset_id, 'created': False, **self._describe(dataset_id)}
+
+        staging = os.path.join(self.root, f'.{uuid.uuid4().hex}')
+        try:
+            meta = write_frame(frame, staging)
+            if meta['bytes'] > self.max_bytes:
+                raise DatasetStoreError(f"Dataset needs {meta['bytes']} bytes; the store holds {self.max_bytes}")
+            try:
+                os.rename(staging, self._path(dataset_id))
+            except OSError:
+                # The same content was stored concurrently
+                if not os.path.isdir(self._path(dataset_id)):
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        with self._lock:
+            if dataset_id not in self._entries:
+                self._entries[dataset_id] = meta
+                self._bytes += meta['bytes']
+            self._entries.move_to_end(dataset_id)
+            self._evict(protect=dataset_id)
+            return {'dataset_id': dataset_id, 'created': True, **self._describe(dataset_id)}
+
+    def acquire(self, dataset_id: str) -> ColumnarFrame:
+        """Lease a dataset and return its frame; pair every call with release()"""
+        with self._lock:
+            meta = self._entries.get(dataset_id)
+            if meta is None:
+                raise DatasetStoreError(f"Unknown dataset_id: {dataset_id}")
+            self._entries.move_to_end(dataset_id)
+            self._leases[dataset_id] = self._leases.get(dataset_id, 0) + 1
+            frame = self._open.get(dataset_id)
+            if frame is not None:
+                self._open.move_to_end(dataset_id)
+                self.counters['hits'] += 1
+                return frame
+        try:
+            frame = load_frame(self._path(dataset_id), meta)
+        except (OSError, ValueError) as e:
+            self.release(dataset_id)
+            raise DatasetStoreError(f"Dataset {dataset_id} could not be opened: {e}")
+        # Stored under its content hash, so the fingerprint need not be recomputed
+        frame._fingerprint = dataset_id
+        with self._lock:
+            self._open[dataset_id] = frame
+            while len(self._open) > OPEN_FRAMES:
+                self._open.popitem(last=False)
+        return frame
+
+    def release(self, dataset_id: str):
+        with self._lock:
+            count = self._leases.get(dataset_id, 0) - 1
+            if count > 0:
+                self._leases[dataset_id] = count
+            else:
+                self._leases.pop(dataset_id, None)
+            self._evict()
+
+    @contextmanager
+    def lease(self, dataset_id: str):
+        frame = self.acquire(dataset_id)
+        try:
+            yield frame
+        finally:
+            self.release(dataset_id)
+
+    def _evict(self, protect: Optional[str] = None):
+        """Drop least recently used unleased datasets until the store is within its limits"""
+        for dataset_id in list(self._entries):
+            if self._bytes <= self.max_bytes and len(self._entries) <= self.max_datasets:
+                break
+            if dataset_id == protect or self._leases.get(dataset_id):
+                continue
+            self._remove(dataset_id)
+            self.counters['evicted'] += 1
+
+    def _remove(self, dataset_id: str):
+        meta = self._entries.pop(dataset_id)
+        self._bytes -= meta['bytes']
+        self._open.pop(dataset_id, None)
+        # Mappings still held by running jobs stay valid after the files are unlinked
+        shutil.rmtree(self._path(dataset_id), ignore_errors=True)
+
+    def delete(self, dataset_id: str) -> bool:
+        with self._lock:
+            if dataset_id not in self._entries:
+                return False
+            if self._leases.get(dataset_id):
+                raise DatasetStoreError(f"Dataset {dataset_id} is in use")
+            self._remove(dataset_id)
+            return True
+
+    def _describe(self, dataset_id: str) -> Dict[str, Any]:
+        meta = self._entries[dataset_id]
+        return {
+            'rows': meta['rows'],
+            'columns': {entry['name']: entry['kind'] for entry in meta['columns']},
+            'bytes': meta['bytes'],
+            'created_at': meta['created_at'],
+            'leases': self._leases.get(dataset_id, 0)
+        }
+
+    def describe(self, dataset_id: str) -> Dict[str, Any]:
+        with self._lock:
+            if dataset_id not in self._entries:
+                raise DatasetStoreError(f"Unknown dataset_id: {dataset_id}")
+            return {'dataset_id': dataset_id, **self._describe(dataset_id)}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'datasets': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_datasets': self.max_datasets,
+                'leased': len(self._leases),
+                'open': len(self._open),
+                'path': self.root,
+                **self.counters
+            }
+
+
+def create_dataset_store() -> DatasetStore:
+    """Build the store from DATASET_STORE_* environment variables"""
+    return DatasetStore(
+        root=os.getenv('DATASET_STORE_DIR') or os.path.join(tempfile.gettempdir(), 'powerbi-tools-datasets'),
+        max_bytes=int(os.getenv('DATASET_STORE_MAX_BYTES', 2 * 1024 ** 3)),
+        max_datasets=int(os.getenv('DATASET_STORE_MAX_DATASETS', 100))
+    )
@@ -0,0 +1,133 @@
+"""
+Bounded error log with fingerprint grouping
+
+Capturing an error only records its type, message, the frame locations of the
+stack (no source lines, no locals) and a short digest of the request context.
+Repeated errors are grouped by a fingerprint of type plus stack and counted;
+tracebacks are formatted only when a report asks for them.
+"""
+
+import hashlib
+import threading
+import traceback
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+DIGEST_LIMIT = 200
+
+
+def digest_value(value: Any, limit: int = DIGEST_LIMIT) -> Any:
+    """Short, bounded description of a context value"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= limit else f"{value[:limit]}... ({len(value)} chars)"
+    if isinstance(value, dict):
+        return {str(key)[:50]: digest_value(item, limit) for key, item in list(value.items())[:20]}
+    if isinstance(value, (list, tuple)):
+        first = repr(value[0])[:limit] if value else ''
+        return f"{type(value).__name__}[{len(value)}] first={first}"
+    return repr(value)[:limit]
+
+
+def _fingerprint(error_type: str, stack: traceback.StackSummary) -> str:
+    frames = '|'.join(f"{frame.filename}:{frame.lineno}:{frame.name}" for frame in stack)
+    return hashlib.sha1(f"{error_type}|{frames}".encode()).hexdigest()[:16]
+
+
+class ErrorGroup:
+    """All occurrences of one fingerprint"""
+
+    __slots__ = ('fingerprint', 'error_type', 'message', 'stack', 'count', 'first_seen', 'last_seen', 'context')
+
+    def __init__(self, fingerprint: str, error_type: str, message: str, stack, context: dict, seen_at: datetime):
+        self.fingerprint = fingerprint
+        self.error_type = error_type
+        self.message = message
+        self.stack = stack
+        self.count = 0
+        self.first_seen = seen_at
+        self.last_seen = seen_at
+        self.context = context
+
+    def format_traceback(self) -> str:
+        lines = ['Traceback (most recent call last):\n']
+        lines.extend(self.stack.format())
+        lines.append(f"{self.error_type}: {self.message}\n")
+        return ''.join(lines)
+
+
+class ErrorLog:
+    """Recent errors in a bounded deque, grouped by fingerprint with counters"""
+
+    def __init__(self, max_entries: int = 1000, max_groups: int = 200):
+        self.max_groups = max_groups
+        self._recent = deque(maxlen=max_entries)
+        self._groups: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def capture(self, error: BaseException, context: Optional[dict] = None) -> ErrorGroup:
+        """Record an error cheaply and return its group"""
+        error_type = type(error).__name__
+        message = str(error)[:DIGEST_LIMIT * 5]
+        stack = traceback.StackSummary.extract(traceback.walk_tb(error.__traceback__), lookup_lines=False)
+        fingerprint = _fingerprint(error_type, stack)
+        context = digest_value(context or {})
+        now = datetime.now()
+
+        with self._lock:
+            self.total += 1
+            group = self._groups.get(fingerprint)
+            if group is None:
+                group = ErrorGroup(fingerprint, error_type, message, stack, context, now)
+                self._groups[fingerprint] = group
+                if len(self._groups) > self.max_groups:
+                    self._groups.popitem(last=False)
+            else:
+                self._groups.move_to_end(fingerprint)
+                group.message = message
+                group.context = context
+            group.count += 1
+            group.last_seen = now
+            self._recent.append((now, fingerprint, error_type, message, context))
+        return group
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def recent(self, limit: int = 10, include_traceback: bool = False) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(self._recent)[-limit:]
+            groups = {fingerprint: self._groups.get(fingerprint) for _, fingerprint, _, _, _ in entries}
+        report = []
+        for timestamp, fingerprint, error_type, message, context in entries:
+            entry = {
+                'timestamp': timestamp.isoformat(),
+                'fingerprint': fingerprint,
+                'error_type': error_type,
+                'error_message': message,
+                'context': context
+            }
+            group = groups.get(fingerprint)
+            if include_traceback and group is not None:
+                entry['traceback'] = group.format_traceback()
+            report.append(entry)
+        return report
+
+    def groups(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most frequent error groups"""
+        with self._lock:
+            groups = sorted(self._groups.values(), key=lambda group: group.count, reverse=True)[:limit]
+        return [
+            {
+                'fingerprint': group.fingerprint,
+                'error_type': group.error_type,
+                'error_message': group.message,
+                'count': group.count,
+                'first_seen': group.first_seen.isoformat(),
+                'last_seen': group.last_seen.isoformat()
+            }
+            for group in groups
+        ]
@@ -0,0 +1,481 @@
+"""
+Execution backends for CPU-bound model calls
+
+The default `inline` backend calls the model singletons in the request thread,
+as before. The `process` backend keeps a pool of long-lived worker processes,
+each holding its own model instances, so heavy NumPy/pandas work does not hold
+the GIL of the waitress threads. Datasets are handed to workers through one
+shared memory segment per call instead of being pickled: the column buffers and
+null masks (strings as a UTF-8 blob plus offsets). Only a column the arrays
+cannot give back exactly (timestamps in their original spelling, mixed types,
+'' or NaN for nulls) travels as its raw values in JSON, and only a row payload
+whose rows do not all carry every column is sent whole; datasets from the
+dataset store are passed by path and memory-mapped by the worker. Workers can
+be pre-warmed so the first call does not pay for the model imports. Calls have
+a timeout and can be cancelled; a worker that overruns is terminated and
+replaced. A model error is re-raised in the
+parent as its nearest built-in class, so a ValueError still maps to a 400.
+
+Either way models receive a real list of row dicts: the payload as sent, or rows
+built from the columns for frames that have no payload.
+"""
+
+import builtins
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections.abc import Mapping
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.columnar import STRING, Column, ColumnarFrame, canonical_payload, ingest_dataset
+from services.datasets import load_frame
+from services.registry import build_model
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.05
+
+# The models the backends run (DAX/SQL generation stays in the app process)
+DATASET_MODELS = ('chart_recommender', 'insight_generator', 'anomaly_detector', 'forecasting_model')
+
+# Worker message that builds models without running a task
+WARM = 'warm'
+
+
+class TaskTimeoutError(TimeoutError):
+    """Raised when a model call exceeds its timeout"""
+
+
+class TaskCancelledError(RuntimeError):
+    """Raised when a model call is cancelled before it completes"""
+
+
+# -------------------------
+# Shared memory transport for ColumnarFrame
+# -------------------------
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def model_input(dataset) -> List[dict]:
+    """What the row-based models are called with: a plain list of row dicts"""
+    return ingest_dataset(dataset).to_records()
+
+
+def _payload_shape(frame: ColumnarFrame) -> Optional[str]:
+    """How to rebuild the frame's payload from its columns: 'rows', 'columns' or None (send it whole)"""
+    payload = frame.payload()
+    if isinstance(payload, Mapping):
+        return 'columns' if all(isinstance(name, str) for name in payload) else None
+    width = len(frame.columns)
+    if all(len(row) == width for row in payload):
+        return 'rows'
+    # Rows missing some keys: the columns would turn them into nulls
+    return None
+
+
+def share_frame(frame: ColumnarFrame) -> Tuple[shared_memory.SharedMemory, Dict[str, Any]]:
+    """Copy the frame's column buffers (or, rarely, its whole payload) into one shared memory segment"""
+    shape = _payload_shape(frame) if frame.has_payload else None
+    if frame.has_payload and shape is None:
+        encoded = canonical_payload(frame.payload())
+        shm = shared_memory.SharedMemory(create=True, size=max(len(encoded), 1))
+        shm.buf[:len(encoded)] = encoded
+        return shm, {'payload': 0, 'bytes': len(encoded)}
+
+    buffers = []
+    layout = []
+    offset = 0
+
+    def reserve(array: np.ndarray) -> int:
+        nonlocal offset
+        start = _align(offset)
+        buffers.append((start, array))
+        offset = start + array.nbytes
+        return start
+
+    for name, col in frame.columns.items():
+        entry = {'name': name, 'kind': col.kind, 'length': len(col)}
+        if shape is not None and not col.exact:
+            # Raw values the arrays would change; the worker rebuilds the payload from them
+            payload = frame.payload()
+            raw = payload[name] if shape == 'columns' else [row[name] for row in payload]
+            encoded = canonical_payload(raw)
+            entry['json'] = reserve(np.frombuffer(encoded, dtype=np.uint8))
+            entry['bytes'] = len(encoded)
+            layout.append(entry)
+            continue
+        entry['integral'] = col.integral
+        entry['mask'] = reserve(np.ascontiguousarray(col.mask))
+        if col.kind == STRING:
+            encoded = [b'' if v is None else v.encode('utf-8') for v in col.values.tolist()]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+            entry['offsets'] = reserve(offsets)
+            entry['blob'] = reserve(np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        else:
+            values = np.ascontiguousarray(col.values)
+            entry['dtype'] = values.dtype.str
+            entry['values'] = reserve(values)
+        layout.append(entry)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for start, array in buffers:
+        if array.nbytes:
+            shm.buf[start:start + array.nbytes] = array.view(np.uint8).reshape(-1)
+    return shm, {'shape': shape, 'rows': frame.n_rows, 'columns': layout}
+
+
+def _original_values(col: Column) -> List[Any]:
+    """A column's values as the payload had them (ints stay ints)"""
+    if not col.integral:
+        return col.to_list()
+    out = np.where(col.mask, 0, col.values).astype(np.int64).tolist()
+    for i in np.flatnonzero(col.mask).tolist():
+        out[i] = None
+    return out
+
+
+def attach_frame(shm: shared_memory.SharedMemory, layout: Dict[str, Any]) -> ColumnarFrame:
+    """Rebuild a ColumnarFrame over a shared segment (numeric buffers are not copied)"""
+    if 'payload' in layout:
+        start, size = layout['payload'], layout['bytes']
+        return ColumnarFrame(payload=json.loads(bytes(shm.buf[start:start + size])))
+    columns = {}
+    raw = {}
+    for entry in layout['columns']:
+        if 'json' in entry:
+            raw[entry['name']] = json.loads(bytes(shm.buf[entry['json']:entry['json'] + entry['bytes']]))
+            continue
+        length = entry['length']
+        mask = np.frombuffer(shm.buf, dtype=bool, count=length, offset=entry['mask'])
+        if entry['kind'] == STRING:
+            offsets = np.frombuffer(shm.buf, dtype=np.int64, count=length + 1, offset=entry['offsets'])
+            blob = bytes(shm.buf[entry['blob']:entry['blob'] + int(offsets[-1])])
+            values = np.empty(length, dtype=object)
+            values[:] = [None if m else blob[a:b].decode('utf-8')
+                         for a, b, m in zip(offsets[:-1].tolist(), offsets[1:].tolist(), mask.tolist())]
+        else:
+            values = np.frombuffer(shm.buf, dtype=np.dtype(entry['dtype']), count=length, offset=entry['values'])
+        columns[entry['name']] = Column(entry['name'], values, mask, entry['kind'], integral=entry['integral'])
+
+    shape = layout['shape']
+    if shape is None:
+        return ColumnarFrame(columns)
+    # A request payload: rebuild it from the exact columns and the raw ones
+    names = [entry['name'] for entry in layout['columns']]
+    lists = [raw[name] if name in raw else _original_values(columns[name]) for name in names]
+    if shape == 'columns':
+        return ColumnarFrame(payload=dict(zip(names, lists)))
+    if not names:
+        return ColumnarFrame(payload=[{} for _ in range(layout['rows'])])
+    return ColumnarFrame(payload=[dict(zip(names, row)) for row in zip(*lists)])
+
+
+# -------------------------
+# Worker process side
+# -------------------------
+
+def _worker_main(conn):
+    """Worker loop: build models lazily, run tasks from the parent until told to stop"""
+    models = {}
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if task is None:
+            break
+        if task[0] == WARM:
+            conn.send(('ok', _build_models(models, task[1])))
+            continue
+        model_name, method, shm_name, layout, args = task
+        shm = None
+        try:
+            if model_name not in models:
+                models[model_name] = build_model(model_name)
+            if shm_name is None:
+                # Dataset store entry: map the same files as the parent instead of copying
+                frame = load_frame(layout)
+            else:
+                shm = shared_memory.SharedMemory(name=shm_name)
+                frame = attach_frame(shm, layout)
+            result = getattr(models[model_name], method)(frame.to_records(), *args)
+            del frame
+            conn.send(('ok', result))
+        except Exception as e:
+            conn.send(('error', (type(e).__name__, _builtin_base(e), str(e))))
+        finally:
+            if shm is not None:
+                try:
+                    shm.close()
+                except BufferError:
+                    # A model kept a view on the buffers; the mapping goes away with the process
+                    pass
+
+
+def _build_models(models: Dict[str, Any], names) -> List[str]:
+    """Build the named models a worker does not hold yet; failures are left to the first real call"""
+    for name in names:
+        if name not in models:
+            try:
+                models[name] = build_model(name)
+            except Exception as e:
+                logger.warning(f"Pre-warming {name} in worker failed: {e}")
+    return sorted(models)
+
+
+def _builtin_base(error: Exception) -> str:
+    """Nearest built-in exception class of an error (StreamingError -> ValueError)"""
+    for cls in type(error).__mro__:
+        if cls.__module__ == 'builtins':
+            return cls.__name__
+    return 'RuntimeError'
+
+
+def _rebuild_error(error_type: str, base: str, message: str) -> Exception:
+    """Parent-side exception for a worker error, keeping its built-in base so ValueError still maps to 400"""
+    text = message if error_type == base else f"{error_type}: {message}"
+    for cls in getattr(builtins, base, RuntimeError).__mro__:
+        try:
+            return cls(text)
+        except TypeError:
+            # Built-ins with a different constructor (UnicodeDecodeError -> UnicodeError)
+            continue
+    return RuntimeError(text)
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        self.process.join(timeout=1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=1)
+        self.conn.close()
+
+
+# -------------------------
+# Backends
+# -------------------------
+
+class InlineModelBackend:
+    """Runs model calls directly in the calling thread (models is a dict or a ModelRegistry)"""
+
+    name = 'inline'
+
+    def __init__(self, models):
+        self.models = models
+
+    def call(self, model_name: str, method: str, dataset, *args,
+             timeout: Optional[float] = None, cancel_event: Optional[threading.Event] = None):
+        if cancel_event is not None and cancel_event.is_set():
+            raise TaskCancelledError(f"{model_name}.{method} was cancelled")
+        return getattr(self.models[model_name], method)(model_input(dataset), *args)
+
+    def prewarm(self, names=DATASET_MODELS) -> Optional[threading.Thread]:
+        """Nothing to do: the models live in this process (ModelRegistry.prewarm builds them)"""
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': self.name}
+
+    def shutdown(self):
+        pass
+
+
+class ProcessModelBackend:
+    """Pool of worker processes fed through shared memory, with timeouts and cancellation"""
+
+    name = 'process'
+
+    def __init__(self, workers: int = 2, timeout: float = 120):
+        self.size = workers
+        self.timeout = timeout
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._prewarm_thread: Optional[threading.Thread] = None
+        self.counters = {'tasks': 0, 'completed': 0, 'failed': 0, 'timeouts': 0, 'cancelled': 0, 'restarts': 0}
+
+    def _ensure_started(self):
+        with self._lock:
+            if not self._started:
+                for _ in range(self.size):
+                    self._idle.put(_Worker(self._context))
+                self._started = True
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _replace(self, worker: _Worker):
+        worker.kill()
+        self._count('restarts')
+        self._idle.put(_Worker(self._context))
+
+    def _take_worker(self, task: str, deadline: float, cancel_event: Optional[threading.Event]) -> _Worker:
+        """Wait for a live idle worker until the deadline (dead ones are replaced on the way)"""
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                self._count('cancelled')
+                raise TaskCancelledError(f"{task} was cancelled")
+            if time.monotonic() >= deadline:
+                self._count('timeouts')
+                raise TaskTimeoutError(f"{task} timed out waiting for a worker")
+            try:
+                worker = self._idle.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if worker.process.is_alive():
+                return worker
+            self._replace(worker)
+
+    def prewarm(self, names=DATASET_MODELS) -> threading.Thread:
+        """Start the workers and build the models in each of them, in a background thread"""
+        names = tuple(names)
+
+        def warm():
+            self._ensure_started()
+            deadline = time.monotonic() + self.timeout
+            workers = []
+            # Take every worker so each one builds the models, not whichever happens to be idle
+            while len(workers) < self.size and time.monotonic() < deadline:
+                try:
+                    workers.append(self._idle.get(timeout=POLL_INTERVAL))
+                except queue.Empty:
+                    continue
+            sent = []
+            for worker in workers:
+                try:
+                    worker.conn.send((WARM, names))
+                    sent.append(worker)
+                except OSError:
+                    self._replace(worker)
+            for worker in sent:
+                try:
+                    ready = worker.conn.poll(max(deadline - time.monotonic(), 0))
+                    if ready:
+                        worker.conn.recv()
+                except (EOFError, OSError):
+                    ready = False
+                if ready:
+                    self._idle.put(worker)
+                else:
+                    logger.warning("A model worker did not finish pre-warming; replacing it")
+                    self._replace(worker)
+
+        self._prewarm_thread = threading.Thread(target=warm, name='worker-prewarm', daemon=True)
+        self._prewarm_thread.start()
+        return self._prewarm_thread
+
+    def call(self, model_name: str, method: str, dataset, *args,
+             timeout: Optional[float] = None, cancel_event: Optional[threading.Event] = None):
+        """Run model.method(dataset, *args) in a worker process and return its result"""
+        self._ensure_started()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        task = f"{model_name}.{method}"
+        self._count('tasks')
+
+        # Payload errors surface here, before a worker is taken out of the pool
+        frame = ingest_dataset(dataset)
+        if frame.source is not None:
+            shm, shm_name, layout = None, None, frame.source
+        else:
+            shm, layout = share_frame(frame)
+            shm_name = shm.name
+
+        worker = None
+        try:
+            worker = self._take_worker(task, deadline, cancel_event)
+            try:
+                worker.conn.send((model_name, method, shm_name, layout, args))
+            except OSError:
+                self._count('failed')
+                self._replace(worker)
+                worker = None
+                raise RuntimeError(f"Worker process for {task} is not reachable")
+            while not worker.conn.poll(POLL_INTERVAL):
+                if cancel_event is not None and cancel_event.is_set():
+                    self._count('cancelled')
+                    self._replace(worker)
+                    worker = None
+                    raise TaskCancelledError(f"{task} was cancelled")
+                if time.monotonic() >= deadline:
+                    self._count('timeouts')
+                    self._replace(worker)
+                    worker = None
+                    raise TaskTimeoutError(f"{task} exceeded {timeout}s")
+            try:
+                status, payload = worker.conn.recv()
+            except (EOFError, OSError):
+                self._count('failed')
+                self._replace(worker)
+                worker = None
+                raise RuntimeError(f"Worker process for {task} exited unexpectedly")
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+        if status == 'error':
+            self._count('failed')
+            raise _rebuild_error(*payload)
+        self._count('completed')
+        return payload
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            'backend': self.name,
+            'workers': self.size,
+            'idle_workers': self._idle.qsize() if self._started else self.size,
+            'timeout_seconds': self.timeout,
+            'prewarming': self._prewarm_thread is not None and self._prewarm_thread.is_alive(),
+            **counters
+        }
+
+    def shutdown(self):
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+def create_model_backend(models):
+    """Build the backend selected by MODEL_EXECUTION_BACKEND (inline or process)"""
+    backend = os.getenv('MODEL_EXECUTION_BACKEND', 'inline').lower()
+    if backend == 'process':
+        return ProcessModelBackend(
+            workers=int(os.getenv('MODEL_POOL_WORKERS', 2)),
+            timeout=float(os.getenv('MODEL_TASK_TIMEOUT', 120))
+        )
+    if backend != 'inline':
+        logger.warning(f"Unknown MODEL_EXECUTION_BACKEND '{backend}', using inline")
+    return InlineModelBackend(models)
@@ -0,0 +1,428 @@
+"""
+Parallel ensemble forecasting over one or many series
+
+The frame is resampled once into a (series x period) matrix: rows are bucketed
+by the time column at a regular frequency and grouped by an optional
+`series_key`, so hundreds of grouped series become one array. Shared
+preprocessing (gap filling, classical seasonal decomposition, the
+deseasonalized series and its first differences) is computed once and every
+ensemble member reads it:
+
+- seasonal_naive: repeat the last observed season
+- holt_winters: additive Holt-Winters, updated for all series per step
+- linear_trend: least-squares trend on the deseasonalized series
+- ar: AR(p) on the differenced deseasonalized series (batched normal equations)
+
+Members are vectorized across series: every step of the Holt-Winters and AR
+recursions updates all series at once. The recursions still step through time
+in Python and hold the GIL, so when the series matrix is large enough to pay for
+shipping it, the holdout and final fits of every member run together in a pool
+of worker processes; smaller matrices run in the calling thread. Each series
+weights the members by their inverse error on a holdout of the most recent
+periods.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from services.columnar import DATETIME, NUMERIC, ColumnarFrame
+
+logger = logging.getLogger(__name__)
+
+FORECAST_WORKERS = int(os.getenv('FORECAST_WORKERS', 4))
+# Series x period cells from which the members run in worker processes
+PARALLEL_MIN_CELLS = int(os.getenv('FORECAST_PARALLEL_MIN_CELLS', 200000))
+MAX_PERIODS = 100000
+
+FREQUENCIES = {
+    # name: (datetime64 unit, default season length)
+    'hour': ('h', 24),
+    'day': ('D', 7),
+    'week': ('W', 52),
+    'month': ('M', 12),
+    'year': ('Y', 1)
+}
+AR_ORDER = 3
+HW_ALPHA, HW_BETA, HW_GAMMA = 0.3, 0.05, 0.2
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class ForecastOptionsError(ValueError):
+    """Raised for invalid ensemble forecast options"""
+
+
+def parse_options(source: Mapping) -> Optional[Dict[str, Any]]:
+    """Ensemble options from a JSON body or query string; None selects the model forecaster"""
+    members = source.get('members')
+    if isinstance(members, str):
+        members = [item.strip() for item in members.split(',') if item.strip()]
+    if not source.get('series_key') and not members and source.get('engine') != 'ensemble':
+        return None
+    options = {
+        'series_key': source.get('series_key') or None,
+        'target': source.get('target') or None,
+        'time_column': source.get('time_column') or None,
+        'frequency': source.get('frequency') or None,
+        'aggregate': source.get('aggregate') or 'sum',
+        'members': members or None
+    }
+    if source.get('season_length') is not None:
+        try:
+            options['season_length'] = int(source.get('season_length'))
+        except (TypeError, ValueError):
+            raise ForecastOptionsError("season_length must be an integer")
+    return options
+
+
+def _fill_gaps(values: np.ndarray) -> np.ndarray:
+    """Forward-fill NaNs along each row, then fill leading NaNs with the first value"""
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+    positions = np.where(missing, 0, np.arange(values.shape[1]))
+    np.maximum.accumulate(positions, axis=1, out=positions)
+    filled = np.take_along_axis(values, positions, axis=1)
+    still = np.isnan(filled)
+    if still.any():
+        first = np.argmax(~still, axis=1)
+        filled = np.where(still, filled[np.arange(len(filled)), first][:, None], filled)
+    return np.nan_to_num(filled)
+
+
+class Resampled:
+    """Series matrix built from a frame, with the keys and period labels of its rows/columns"""
+
+    def __init__(self, values: np.ndarray, keys: List[Any], periods: Optional[np.ndarray],
+                 frequency: Optional[str], target: str):
+        self.values = values
+        self.keys = keys
+        self.periods = periods
+        self.frequency = frequency
+        self.target = target
+
+    def future_periods(self, horizon: int) -> Optional[List[str]]:
+        if self.periods is None:
+            return None
+        unit = FREQUENCIES[self.frequency][0]
+        future = self.periods[-1] + np.arange(1, horizon + 1).astype(f'timedelta64[{unit}]')
+        return np.datetime_as_string(future, unit='auto').tolist()
+
+
+def _infer_frequency(times: np.ndarray) -> str:
+    days = np.unique(times.astype('datetime64[h]')).astype(np.int64) / 24.0
+    if len(days) < 2:
+        return 'day'
+    gap = float(np.median(np.diff(days)))
+    if gap < 0.5:
+        return 'hour'
+    if gap <= 1.5:
+        return 'day'
+    if gap <= 10:
+        return 'week'
+    if gap <= 45:
+        return 'month'
+    return 'year'
+
+
+def resample(frame: ColumnarFrame, target: Optional[str] = None, series_key: Optional[str] = None,
+             time_column: Optional[str] = None, frequency: Optional[str] = None,
+             aggregate: str = 'sum', profile: Optional[Dict[str, Dict[str, Any]]] = None) -> Resampled:
+    """Bucket and group the frame into a (series x period) matrix in one vectorized pass
+
+    With the frame's `profile` (ColumnarFrame.profile()) the column kinds come from
+    it, and columns it reports without nulls are used without a filtering copy.
+    """
+    kinds = {name: stats['kind'] for name, stats in profile.items()} if profile is not None else frame.dtypes()
+    numeric = [name for name, kind in kinds.items() if kind == NUMERIC and name != series_key]
+    target = target or (numeric[0] if numeric else None)
+    if target not in numeric:
+        raise ForecastOptionsError(f"Forecast target must be a numeric column, got {target!r}")
+    if series_key is not None and series_key not in kinds:
+        raise ForecastOptionsError(f"Unknown series_key column: {series_key}")
+    if time_column is None:
+        time_column = next((name for name, kind in kinds.items() if kind == DATETIME), None)
+    elif kinds.get(time_column) != DATETIME:
+        raise ForecastOptionsError(f"time_column must be a date/time column, got {time_column!r}")
+    if aggregate not in ('sum', 'mean'):
+        raise ForecastOptionsError("aggregate must be 'sum' or 'mean'")
+
+    y_col = frame.column(target)
+    checked = [target] if time_column is None else [target, time_column]
+    if profile is not None and not any(profile[name]['nulls'] for name in checked):
+        keep = slice(None)
+    else:
+        keep = ~y_col.mask
+        if time_column is not None:
+            keep &= ~frame.column(time_column).mask
+    y = y_col.values[keep].astype(np.float64, copy=False)
+
+    if series_key is not None:
+        raw_keys = frame.column(series_key).to_list()
+        labels = np.array(['' if value is None else str(value) for value in raw_keys], dtype=object)[keep]
+        keys, group = np.unique(labels, return_inverse=True)
+        keys = keys.tolist()
+    else:
+        keys, group = [None], np.zeros(len(y), dtype=np.int64)
+    n_series = len(keys)
+
+    periods = None
+    if time_column is not None:
+        times = frame.column(time_column).values[keep]
+        frequency = frequency or _infer_frequency(times)
+        if frequency not in FREQUENCIES:
+            raise ForecastOptionsError(f"frequency must be one of {', '.join(FREQUENCIES)}")
+        buckets = times.astype(f'datetime64[{FREQUENCIES[frequency][0]}]')
+        start = buckets.min() if len(buckets) else None
+        position = (buckets - start).astype(np.int64) if len(buckets) else np.zeros(0, dtype=np.int64)
+        n_periods = int(position.max()) + 1 if len(position) else 0
+        if n_periods > MAX_PERIODS:
+            raise ForecastOptionsError(f"{n_periods} {frequency} periods exceed the limit of {MAX_PERIODS}; "
+                                       f"use a coarser frequency")
+        if n_periods:
+            periods = start + np.arange(n_periods)
+    else:
+        # No time column: row order within each series is its time axis, right-aligned
+        order = np.argsort(group, kind='stable')
+        counts = np.bincount(group, minlength=n_series)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        n_periods = int(counts.max()) if len(counts) else 0
+        position = np.empty(len(group), dtype=np.int64)
+        position[order] = np.arange(len(group)) - np.repeat(starts, counts) + np.repeat(n_periods - counts, counts)
+
+    flat = group * n_periods + position
+    sums = np.bincount(flat, weights=y, minlength=n_series * n_periods).reshape(n_series, n_periods)
+    counts = np.bincount(flat, minlength=n_series * n_periods).reshape(n_series, n_periods)
+    observed = counts > 0
+    if aggregate == 'mean' or time_column is None:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = _fill_gaps(np.where(observed, sums / counts, np.nan))
+    else:
+        # An empty period inside a series' observed range sums to 0; the periods before its
+        # first and after its last observation are outside its history and filled like gaps
+        columns = np.arange(n_periods)
+        first = np.argmax(observed, axis=1)
+        last = n_periods - 1 - np.argmax(observed[:, ::-1], axis=1)
+        inside = (columns >= first[:, None]) & (columns <= last[:, None])
+        values = _fill_gaps(np.where(inside, sums, np.nan))
+    return Resampled(values, keys, periods, frequency, target)
+
+
+class Prepared:
+    """Preprocessing shared by all ensemble members"""
+
+    def __init__(self, values: np.ndarray, season_length: int):
+        self.values = values
+        n_series, n_periods = values.shape
+        # Seasonality needs two full seasons to estimate
+        self.season_length = season_length if season_length > 1 and n_periods >= 2 * season_length else 1
+        m = self.season_length
+        self.seasonal = np.zeros((n_series, m))
+        if m > 1:
+            # Classical decomposition: centered moving average, then mean detrended value per phase
+            prefix = np.concatenate([np.zeros((n_series, 1)), np.cumsum(values, axis=1)], axis=1)
+            moving = (prefix[:, m:] - prefix[:, :-m]) / m
+            offset = m // 2
+            detrended = np.full(values.shape, np.nan)
+            detrended[:, offset:offset + moving.shape[1]] = values[:, offset:offset + moving.shape[1]] - moving
+            padded = np.full((n_series, -(-n_periods // m) * m), np.nan)
+            padded[:, :n_periods] = detrended
+            seasonal = np.nanmean(padded.reshape(n_series, -1, m), axis=1)
+            self.seasonal = seasonal - seasonal.mean(axis=1, keepdims=True)
+        self.season_by_period = np.tile(self.seasonal, -(-n_periods // m))[:, :n_periods]
+        self.deseasonalized = values - self.season_by_period
+        self.differences = np.diff(self.deseasonalized, axis=1)
+
+    def future_season(self, horizon: int) -> np.ndarray:
+        m = self.season_length
+        phases = (self.values.shape[1] + np.arange(horizon)) % m
+        return self.seasonal[:, phases]
+
+
+def seasonal_naive(prep: Prepared, horizon: int) -> np.ndarray:
+    m = prep.season_length
+    last = prep.values[:, -m:]
+    return last[:, np.arange(horizon) % m]
+
+
+def holt_winters(prep: Prepared, horizon: int) -> np.ndarray:
+    values, m = prep.values, prep.season_length
+    n_periods = values.shape[1]
+    first = values[:, :m].mean(axis=1)
+    level = prep.deseasonalized[:, 0].copy()
+    trend = (values[:, m:2 * m].mean(axis=1) - first) / m if n_periods >= 2 * m and m > 1 else \
+        (values[:, -1] - values[:, 0]) / max(n_periods - 1, 1)
+    season = prep.seasonal.copy()
+    for t in range(n_periods):
+        phase = t % m
+        observed = values[:, t]
+        previous = level
+        level = HW_ALPHA * (observed - season[:, phase]) + (1 - HW_ALPHA) * (level + trend)
+        trend = HW_BETA * (level - previous) + (1 - HW_BETA) * trend
+        season[:, phase] = HW_GAMMA * (observed - level) + (1 - HW_GAMMA) * season[:, phase]
+    steps = np.arange(1, horizon + 1)
+    phases = (n_periods + steps - 1) % m
+    return level[:, None] + steps * trend[:, None] + season[:, phases]
+
+
+def linear_trend(prep: Prepared, horizon: int) -> np.ndarray:
+    y = prep.deseasonalized
+    n_periods = y.shape[1]
+    x = np.arange(n_periods, dtype=np.float64)
+    x_centered = x - x.mean()
+    denominator = (x_centered ** 2).sum() or 1.0
+    slope = (y - y.mean(axis=1, keepdims=True)) @ x_centered / denominator
+    intercept = y.mean(axis=1) - slope * x.mean()
+    future = np.arange(n_periods, n_periods + horizon)
+    return intercept[:, None] + slope[:, None] * future + prep.future_season(horizon)
+
+
+def autoregressive(prep: Prepared, horizon: int) -> np.ndarray:
+    d = prep.differences
+    p = min(AR_ORDER, max(d.shape[1] - 2, 0))
+    if p == 0:
+        return np.repeat(prep.values[:, -1:], horizon, axis=1)
+    lags = np.lib.stride_tricks.sliding_window_view(d, p, axis=1)[:, :-1]   # (series, samples, p)
+    targets = d[:, p:]
+    mean = d.mean(axis=1, keepdims=True)
+    lags, targets = lags - mean[:, :, None], targets - mean
+    # Batched ridge normal equations: one small p x p solve per series
+    gram = np.einsum('snp,snq->spq', lags, lags) + 1e-6 * np.eye(p)
+    coefficients = np.linalg.solve(gram, np.einsum('snp,sn->sp', lags, targets)[..., None])[..., 0]
+
+    history = list((d[:, -p:] - mean).T)
+    steps = []
+    for _ in range(horizon):
+        window = np.stack(history[-p:], axis=1)
+        step = (window * coefficients).sum(axis=1)
+        history.append(step)
+        steps.append(step + mean[:, 0])
+    levels = prep.deseasonalized[:, -1:] + np.cumsum(np.stack(steps, axis=1), axis=1)
+    return levels + prep.future_season(horizon)
+
+
+MEMBERS: Dict[str, Callable[[Prepared, int], np.ndarray]] = {
+    'seasonal_naive': seasonal_naive,
+    'holt_winters': holt_winters,
+    'linear_trend': linear_trend,
+    'ar': autoregressive
+}
+
+
+def _member_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=FORECAST_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _run_members(fits: List[Tuple[Prepared, int]], names: List[str]) -> List[Dict[str, np.ndarray]]:
+    """Every member for each (prep, horizon) fit; in worker processes for large series matrices"""
+    global _pool
+    cells = sum(prep.values.size for prep, _ in fits)
+    if FORECAST_WORKERS > 1 and cells >= PARALLEL_MIN_CELLS:
+        try:
+            pool = _member_pool()
+            futures = [{name: pool.submit(MEMBERS[name], prep, horizon) for name in names} for prep, horizon in fits]
+            return [{name: future.result() for name, future in run.items()} for run in futures]
+        except BrokenProcessPool:
+            logger.warning("Forecast worker pool broke; running the members in this thread")
+            with _pool_lock:
+                _pool = None
+    return [{name: MEMBERS[name](prep, horizon) for name in names} for prep, horizon in fits]
+
+
+def forecast_ensemble(frame: ColumnarFrame, horizon: int = 30, series_key: Optional[str] = None,
+                      target: Optional[str] = None, time_column: Optional[str] = None,
+                      frequency: Optional[str] = None, aggregate: str = 'sum',
+                      members: Optional[List[str]] = None, season_length: Optional[int] = None,
+                      profile: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Forecast every series in the frame with a weighted ensemble (`profile` as in resample)"""
+    start_time = time.time()
+    horizon = int(horizon)
+    if horizon < 1:
+        raise ForecastOptionsError("horizon must be at least 1")
+    names = list(dict.fromkeys(members or MEMBERS))
+    unknown = [name for name in names if name not in MEMBERS]
+    if unknown:
+        raise ForecastOptionsError(f"Unknown ensemble members: {', '.join(unknown)}. "
+                                   f"Available: {', '.join(MEMBERS)}")
+
+    series = resample(frame, target, series_key, time_column, frequency, aggregate, profile)
+    values = series.values
+    n_series, n_periods = values.shape
+    if n_periods < 3:
+        raise ForecastOptionsError("At least 3 periods are needed to forecast")
+    if season_length is None:
+        season_length = FREQUENCIES[series.frequency][1] if series.frequency else 1
+    resample_time = time.time() - start_time
+
+    # Holdout of the most recent periods to weight the members per series; fitted together with the final run
+    holdout = min(horizon, n_periods // 5)
+    prep = Prepared(values, season_length)
+    fits = [(prep, horizon)]
+    if holdout >= 1 and n_periods - holdout >= 3:
+        fits.append((Prepared(values[:, :-holdout], season_length), holdout))
+    runs = _run_members(fits, names)
+    forecasts = runs[0]
+    members_time = time.time() - start_time - resample_time
+
+    weights = np.full((n_series, len(names)), 1.0 / len(names))
+    errors = None
+    if len(runs) > 1:
+        validation = runs[1]
+        actual = values[:, -holdout:]
+        errors = np.stack([np.abs(validation[name] - actual).mean(axis=1) for name in names], axis=1)
+        inverse = 1.0 / np.maximum(errors, 1e-9)
+        weights = inverse / inverse.sum(axis=1, keepdims=True)
+    stacked = np.stack([forecasts[name] for name in names], axis=2)        # (series, horizon, members)
+    combined = (stacked * weights[:, None, :]).sum(axis=2)
+    if errors is not None:
+        # Interval from the weighted holdout error, widening with the horizon
+        scale = (errors * weights).sum(axis=1) * 1.25
+        spread = 1.96 * scale[:, None] * np.sqrt(np.arange(1, horizon + 1))
+    else:
+        spread = np.full(combined.shape, np.nan)
+
+    results = []
+    for i, key in enumerate(series.keys):
+        entry = {
+            'forecast': combined[i].tolist(),
+            'lower': None if errors is None else (combined[i] - spread[i]).tolist(),
+            'upper': None if errors is None else (combined[i] + spread[i]).tolist(),
+            'weights': {name: round(float(weights[i, j]), 4) for j, name in enumerate(names)},
+            'members': {name: forecasts[name][i].tolist() for name in names}
+        }
+        if series_key is not None:
+            entry['key'] = key
+        results.append(entry)
+
+    return {
+        'success': True,
+        'method': 'ensemble',
+        'members': names,
+        'target': series.target,
+        'series_key': series_key,
+        'frequency': series.frequency,
+        'season_length': prep.season_length,
+        'horizon': horizon,
+        'periods': series.future_periods(horizon),
+        'series_count': n_series,
+        'history_periods': n_periods,
+        'series': results if series_key is not None else results[0],
+        'timings': {
+            'resample': resample_time,
+            'members': members_time,
+            'total': time.time() - start_time
+        }
+    }
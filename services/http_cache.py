@@ -0,0 +1,87 @@
+"""
+HTTP validators and response compression
+
+The GET forms of the Power BI routes are pure functions of their query string.
+Their strong ETag is a hash of the route, the canonical query (minus the API
+key), the negotiated response format and a deploy salt. A matching
+If-None-Match can be answered with 304 before the dataset is parsed or a
+model runs.
+
+Large bodies are compressed with brotli (when the package is installed) or
+gzip, according to Accept-Encoding. Each encoding gets its own ETag suffix
+(`"<hash>-br"`), as RFC 9110 requires, and the suffix is ignored when
+If-None-Match is compared.
+"""
+
+import gzip
+import hashlib
+import json
+from typing import Iterable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IGNORED_PARAMS = {'api_key'}
+ENCODING_SUFFIXES = ('-br', '-gzip')
+
+
+def input_etag(path: str, args: Iterable[Tuple[str, str]], variant: Optional[str] = None,
+               salt: str = '') -> str:
+    """Strong ETag (quoted) for a deterministic GET request"""
+    query = sorted((key, value) for key, value in args if key not in IGNORED_PARAMS)
+    canonical = json.dumps([path, query, variant or 'json', salt], separators=(',', ':'))
+    return '"' + hashlib.sha256(canonical.encode()).hexdigest()[:32] + '"'
+
+
+def _base_tag(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against our ETag, as RFC 9110 prescribes for GET"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    wanted = _base_tag(etag)
+    return any(_base_tag(tag) == wanted for tag in if_none_match.split(',') if tag.strip())
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best supported content coding: br, then gzip; None when neither is acceptable"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        fields = part.strip().split(';')
+        coding = fields[0].strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for field in fields[1:]:
+            key, _, value = field.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    wildcard = accepted.get('*', 0.0)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    ranked = [(accepted.get(coding, wildcard), -i, coding) for i, coding in enumerate(candidates)]
+    quality, _, coding = max(ranked)
+    return coding if quality > 0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
@@ -0,0 +1,219 @@
+"""
+Asynchronous jobs for long-running model calls
+
+A job is submitted with a priority and returns an id immediately. Jobs wait in
+a bounded priority queue and are executed by a small pool of worker threads;
+clients poll `/api/jobs/<id>` for status and the result. A running job reports
+which stage it is in (e.g. `rollup`, then `model`); model calls give no finer
+progress, so none is invented. Finished jobs are kept for a TTL and then dropped.
+A job's `on_finish` callback runs exactly once whatever the outcome, including
+cancellation while still queued, so resources taken at submit time (dataset
+leases) are always given back.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = {SUCCEEDED, FAILED, CANCELLED}
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the job queue is at capacity"""
+
+
+class Job:
+    """A unit of work and its lifecycle state"""
+
+    def __init__(self, kind: str, func: Callable[[threading.Event, Callable[[str], None]], Any], priority: int,
+                 on_finish: Optional[Callable[[], None]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.func = func
+        self.priority = priority
+        self.on_finish = on_finish
+        self.status = QUEUED
+        self.stage = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'type': self.kind,
+            'status': self.status,
+            'priority': self.priority,
+            'stage': self.stage,
+            'created_at': datetime.fromtimestamp(self.created_at).isoformat(),
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat() if self.started_at else None,
+            'finished_at': datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None
+        }
+        if self.started_at:
+            data['execution_time'] = (self.finished_at or time.time()) - self.started_at
+        if self.error:
+            data['error'] = self.error
+        if include_result and self.status == SUCCEEDED:
+            data['result'] = self.result
+        return data
+
+
+class JobManager:
+    """Bounded priority queue of jobs with worker threads and TTL retention"""
+
+    def __init__(self, workers: int = 2, max_queue: int = 100, result_ttl: float = 3600):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self._jobs: Dict[str, Job] = {}
+        self._queue = []  # heap of (priority, sequence, job)
+        self._pending = 0
+        self._sequence = itertools.count()
+        self._finished = deque()  # (finished_at, job_id) in completion order
+        self._cond = threading.Condition()
+        self._threads = []
+        self.counters = {'submitted': 0, 'succeeded': 0, 'failed': 0, 'cancelled': 0, 'rejected': 0, 'expired': 0}
+
+    def _ensure_started(self):
+        if not self._threads:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind: str, func: Callable[[threading.Event, Callable[[str], None]], Any], priority: int = 5,
+               on_finish: Optional[Callable[[], None]] = None) -> Job:
+        """Queue func(cancel_event, set_stage); lower priority values run first
+
+        on_finish is called once when the job ends; it is not called if the job is rejected.
+        """
+        with self._cond:
+            self._ensure_started()
+            self._expire()
+            if self._pending >= self.max_queue:
+                self.counters['rejected'] += 1
+                raise QueueFullError(f"Job queue is full ({self.max_queue} pending jobs)")
+            job = Job(kind, func, priority, on_finish)
+            self._jobs[job.id] = job
+            heapq.heappush(self._queue, (priority, next(self._sequence), job))
+            self._pending += 1
+            self.counters['submitted'] += 1
+            self._cond.notify()
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued job, or signal a running one to stop"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return job
+            job.cancel_event.set()
+            if job.status == QUEUED:
+                # Left in the heap; workers skip it when popped
+                self._pending -= 1
+                self._finish(job, CANCELLED)
+        if job.status == CANCELLED:
+            self._release(job)
+        return job
+
+    def queue_position(self, job: Job) -> Optional[int]:
+        with self._cond:
+            if job.status != QUEUED:
+                return None
+            key = (job.priority, job.created_at)
+            return sum(1 for _, _, other in self._queue
+                       if other.status == QUEUED and (other.priority, other.created_at) < key)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._queue)
+                if job.status != QUEUED:
+                    continue
+                self._pending -= 1
+                job.status = RUNNING
+                job.stage = RUNNING
+                job.started_at = time.time()
+            try:
+                result = job.func(job.cancel_event, lambda stage: self._set_stage(job, stage))
+                with self._cond:
+                    if job.cancel_event.is_set():
+                        self._finish(job, CANCELLED)
+                    else:
+                        job.result = result
+                        self._finish(job, SUCCEEDED)
+            except Exception as e:
+                with self._cond:
+                    job.error = str(e)
+                    self._finish(job, CANCELLED if job.cancel_event.is_set() else FAILED)
+            self._release(job)
+
+    def _set_stage(self, job: Job, stage: str):
+        with self._cond:
+            if job.status == RUNNING:
+                job.stage = stage
+
+    def _release(self, job: Job):
+        """Run the job's on_finish callback once (outside the lock; it may block on other services)"""
+        with self._cond:
+            callback, job.on_finish = job.on_finish, None
+        if callback is not None:
+            callback()
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.stage = status
+        job.finished_at = time.time()
+        job.func = None
+        self.counters[status] += 1
+        self._finished.append((job.finished_at, job.id))
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        while self._finished and self._finished[0][0] < cutoff:
+            _, job_id = self._finished.popleft()
+            if self._jobs.pop(job_id, None) is not None:
+                self.counters['expired'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            running = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+            return {
+                'workers': self.workers,
+                'queued': self._pending,
+                'running': running,
+                'retained': len(self._jobs),
+                'max_queue': self.max_queue,
+                'result_ttl_seconds': self.result_ttl,
+                **self.counters
+            }
+
+
+def create_job_manager() -> JobManager:
+    """Build the job manager from JOB_* environment variables"""
+    return JobManager(
+        workers=int(os.getenv('JOB_WORKERS', 2)),
+        max_queue=int(os.getenv('JOB_MAX_QUEUE', 100)),
+        result_ttl=float(os.getenv('JOB_RESULT_TTL', 3600))
+    )
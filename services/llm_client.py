@@ -0,0 +1,249 @@
+"""
+Guard for the generators' outbound LLM calls
+
+The DAX and SQL generators (models package) make their own completions calls;
+every call to them from the app goes through one process-wide guard:
+
+- a concurrency cap; callers queue for a slot up to `queue_timeout`, so a slow
+  upstream cannot tie up every server thread
+- retries with capped, full-jitter exponential backoff on timeouts, connection
+  errors, 429 and 5xx
+- optional hedging: if a call has not answered after `hedge_after` seconds a
+  second identical call is started, and the first answer wins
+- a circuit breaker that fails fast while the upstream is unhealthy so the
+  app can answer from `AutoErrorRecovery.auto_recover` instead
+
+Only exceptions (timeouts, connection errors, upstream 5xx) count as breaker
+failures, and a call counts once however many attempts it took. A generator result with `success: False` is an answer about the
+requirement, not an upstream failure, and is returned as is.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the upstream circuit breaker is open"""
+
+
+class ClientBusyError(RuntimeError):
+    """Raised when no concurrency slot frees up within the queue timeout"""
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP status carried by an upstream error (urllib, requests and openai spell it differently)"""
+    for value in (getattr(error, 'status_code', None), getattr(error, 'code', None),
+                  getattr(getattr(error, 'response', None), 'status_code', None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, connection errors, 429 and 5xx are worth another attempt; other errors are not"""
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError, OSError)):
+        return True
+    name = type(error).__name__
+    return 'Timeout' in name or 'Connection' in name
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures; half-open probe after the reset timeout"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.short_circuited = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                # Let exactly one probe through
+                self._probe_in_flight = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Upstream circuit opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, func: Callable[[], Any], fallback: Optional[Callable[[Exception], Any]] = None):
+        """Run func under the breaker; while open, answer from fallback (or raise)"""
+        if not self.allow():
+            error = CircuitOpenError("Upstream temporarily unavailable")
+            if fallback is None:
+                raise error
+            return fallback(error)
+        try:
+            result = func()
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'short_circuited': self.short_circuited
+        }
+
+
+class UpstreamGuard:
+    """Concurrency cap, retries, hedging and circuit breaker around calls that reach the LLM upstream"""
+
+    def __init__(self, max_concurrency: int = 8, queue_timeout: float = 10.0,
+                 breaker: Optional[CircuitBreaker] = None, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 hedge_after: Optional[float] = None):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._hedge_executor = None
+        self._lock = threading.Lock()
+        self.counters = {'calls': 0, 'attempts': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0,
+                         'failures': 0, 'busy_rejections': 0}
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter: uniform over [0, min(backoff_max, backoff_base * 2^attempt)]"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _attempt(self, func: Callable[[], Any]):
+        self._count('attempts')
+        return func()
+
+    def _hedged(self, func: Callable[[], Any]):
+        """One attempt; start a second identical one if the first is still running after hedge_after"""
+        if not self.hedge_after:
+            return self._attempt(func)
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=self.max_concurrency * 2,
+                                                          thread_name_prefix='llm-hedge')
+        first = self._hedge_executor.submit(self._attempt, func)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        self._count('hedges')
+        second = self._hedge_executor.submit(self._attempt, func)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is second:
+                    self._count('hedge_wins')
+                return result
+        raise error
+
+    def _with_retries(self, func: Callable[[], Any]):
+        attempt = 0
+        while True:
+            try:
+                return self._hedged(func)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                attempt += 1
+                self._count('retries')
+                time.sleep(self._backoff(attempt))
+
+    def call(self, func: Callable[[], Any], fallback: Optional[Callable[[Exception], Any]] = None):
+        """Run func in a concurrency slot under the breaker, with retries and hedging; answer from fallback while the circuit is open"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count('busy_rejections')
+            raise ClientBusyError(f"No upstream slot free within {self.queue_timeout}s")
+        try:
+            self._count('calls')
+            try:
+                return self.breaker.call(lambda: self._with_retries(func), fallback)
+            except CircuitOpenError:
+                raise
+            except Exception:
+                self._count('failures')
+                raise
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            'max_concurrency': self.max_concurrency,
+            'queue_timeout_seconds': self.queue_timeout,
+            'max_retries': self.max_retries,
+            'hedge_after_seconds': self.hedge_after,
+            'circuit': self.breaker.stats(),
+            **counters
+        }
+
+
+def create_upstream_guard() -> UpstreamGuard:
+    """Build the shared guard from LLM_* environment variables"""
+    hedge_after = os.getenv('LLM_HEDGE_AFTER')
+    return UpstreamGuard(
+        max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', 8)),
+        queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', 10)),
+        max_retries=int(os.getenv('LLM_MAX_RETRIES', 2)),
+        backoff_base=float(os.getenv('LLM_BACKOFF_BASE', 0.5)),
+        backoff_max=float(os.getenv('LLM_BACKOFF_MAX', 8)),
+        hedge_after=float(hedge_after) if hedge_after else None,
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv('LLM_BREAKER_THRESHOLD', 5)),
+            reset_timeout=float(os.getenv('LLM_BREAKER_RESET', 30))
+        )
+    )
@@ -0,0 +1,203 @@
+"""
+Request metrics store
+
+Each thread records into its own per-endpoint shard, so the request path takes
+no lock: a shard holds counters, a fixed-bucket latency histogram and a ring
+buffer of the most recent samples in preallocated arrays. Reads merge the
+shards, which costs O(threads x buckets) no matter how many requests have been
+recorded.
+"""
+
+import bisect
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Geometric latency buckets from 0.1 ms to ~10 min, 20% apart
+BUCKET_BOUNDS = [1e-4 * 1.2 ** i for i in range(int(math.log(6000 / 1e-4, 1.2)) + 2)]
+RING_SIZE = 256
+
+
+class _Shard:
+    """Metrics for one endpoint written by a single thread"""
+
+    __slots__ = ('count', 'successes', 'total_time', 'max_time', 'buckets',
+                 'ring_timestamp', 'ring_duration', 'ring_success', 'ring_pos',
+                 'last_error', 'last_error_at')
+
+    def __init__(self):
+        self.count = 0
+        self.successes = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.ring_timestamp = np.zeros(RING_SIZE, dtype=np.float64)
+        self.ring_duration = np.zeros(RING_SIZE, dtype=np.float64)
+        self.ring_success = np.zeros(RING_SIZE, dtype=bool)
+        self.ring_pos = 0
+        self.last_error = None
+        self.last_error_at = 0.0
+
+    def record(self, execution_time: float, success: bool, error: Optional[str]):
+        now = time.time()
+        self.count += 1
+        self.total_time += execution_time
+        if execution_time > self.max_time:
+            self.max_time = execution_time
+        if success:
+            self.successes += 1
+        elif error:
+            self.last_error = error
+            self.last_error_at = now
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, execution_time)] += 1
+        slot = self.ring_pos % RING_SIZE
+        self.ring_timestamp[slot] = now
+        self.ring_duration[slot] = execution_time
+        self.ring_success[slot] = success
+        self.ring_pos += 1
+
+
+def percentile(buckets: np.ndarray, q: float) -> float:
+    """Estimate a quantile from histogram bucket counts (geometric bucket midpoint)"""
+    total = int(buckets.sum())
+    if not total:
+        return 0.0
+    index = int(np.searchsorted(np.cumsum(buckets), q * total, side='left'))
+    if index == 0:
+        return BUCKET_BOUNDS[0]
+    if index >= len(BUCKET_BOUNDS):
+        return BUCKET_BOUNDS[-1]
+    return math.sqrt(BUCKET_BOUNDS[index - 1] * BUCKET_BOUNDS[index])
+
+
+class MetricsStore:
+    """Per-thread sharded request metrics, merged on read"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: Dict[str, List[_Shard]] = {}
+        self._register_lock = threading.Lock()
+
+    def _shard(self, endpoint: str) -> _Shard:
+        shards = getattr(self._local, 'shards', None)
+        if shards is None:
+            shards = self._local.shards = {}
+        shard = shards.get(endpoint)
+        if shard is None:
+            shard = shards[endpoint] = _Shard()
+            # Registration happens once per (thread, endpoint)
+            with self._register_lock:
+                self._shards.setdefault(endpoint, []).append(shard)
+        return shard
+
+    def record(self, endpoint: str, execution_time: float, success: bool, error: Optional[str] = None):
+        self._shard(endpoint).record(execution_time, success, error)
+
+    def endpoints(self) -> List[str]:
+        with self._register_lock:
+            return list(self._shards)
+
+    def _snapshot(self, endpoint: str) -> List[_Shard]:
+        with self._register_lock:
+            return list(self._shards.get(endpoint, []))
+
+    def histogram(self, endpoint: str) -> np.ndarray:
+        shards = self._snapshot(endpoint)
+        if not shards:
+            return np.zeros(len(BUCKET_BOUNDS) + 1, dtype=np.int64)
+        return np.sum([shard.buckets for shard in shards], axis=0)
+
+    def summary(self, endpoint: str) -> Dict[str, Any]:
+        shards = self._snapshot(endpoint)
+        count = sum(shard.count for shard in shards)
+        if not count:
+            return {'total_requests': 0}
+        successes = sum(shard.successes for shard in shards)
+        total_time = sum(shard.total_time for shard in shards)
+        buckets = self.histogram(endpoint)
+        last_error = max(shards, key=lambda shard: shard.last_error_at)
+        return {
+            'total_requests': count,
+            'success_rate': successes / count,
+            'avg_execution_time': total_time / count,
+            'max_execution_time': max(shard.max_time for shard in shards),
+            'p50_execution_time': percentile(buckets, 0.50),
+            'p95_execution_time': percentile(buckets, 0.95),
+            'p99_execution_time': percentile(buckets, 0.99),
+            'last_error': last_error.last_error
+        }
+
+    def summaries(self) -> Dict[str, Dict[str, Any]]:
+        return {endpoint: self.summary(endpoint) for endpoint in self.endpoints()}
+
+    def recent(self, endpoint: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recent samples across all shards, newest last"""
+        shards = self._snapshot(endpoint)
+        if not shards:
+            return []
+        timestamps = np.concatenate([shard.ring_timestamp for shard in shards])
+        durations = np.concatenate([shard.ring_duration for shard in shards])
+        successes = np.concatenate([shard.ring_success for shard in shards])
+        order = np.argsort(timestamps)
+        order = order[timestamps[order] > 0][-limit:]
+        return [
+            {
+                'timestamp': datetime.fromtimestamp(timestamps[i]).isoformat(),
+                'execution_time': float(durations[i]),
+                'success': bool(successes[i])
+            }
+            for i in order.tolist()
+        ]
+
+    def __bool__(self) -> bool:
+        return bool(self.endpoints())
+
+
+# -------------------------
+# Prometheus text exposition
+# -------------------------
+
+# Every 6th bucket bound (~3x apart) keeps exported histograms compact while staying exact
+EXPORT_BOUNDS = list(range(0, len(BUCKET_BOUNDS), 6))
+INF_LABEL = 'le="+Inf"'
+
+
+def _labels(names, values, extra: str = '') -> str:
+    if not isinstance(values, tuple):
+        values = (values,)
+    parts = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def render_prometheus(histograms, counters=()) -> str:
+    """Render (name, help, store, label_names) families as histograms and counters"""
+    lines = []
+    for name, help_text, store, label_names in counters:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for key in store.endpoints():
+            count = sum(shard.count for shard in store._snapshot(key))
+            lines.append(f'{name}{_labels(label_names, key)} {count}')
+
+    for name, help_text, store, label_names in histograms:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for key in store.endpoints():
+            shards = store._snapshot(key)
+            cumulative = np.cumsum(store.histogram(key))
+            for index in EXPORT_BOUNDS:
+                le = f'le="{BUCKET_BOUNDS[index]:.6g}"'
+                lines.append(f'{name}_bucket{_labels(label_names, key, le)} {int(cumulative[index])}')
+            lines.append(f'{name}_bucket{_labels(label_names, key, INF_LABEL)} {int(cumulative[-1])}')
+            lines.append(f'{name}_sum{_labels(label_names, key)} {sum(shard.total_time for shard in shards):.9g}')
+            lines.append(f'{name}_count{_labels(label_names, key)} {sum(shard.count for shard in shards)}')
+    return '\n'.join(lines) + '\n'
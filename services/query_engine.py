@@ -0,0 +1,1878 @@
+"""
+Local query engine for generated SQL and DAX
+
+Runs the common subset of what /api/generate-sql and /api/generate-dax
+produce against a request or stored dataset. A generated query can then be
+checked without a round trip to the warehouse.
+
+- SQL: SELECT [DISTINCT] [TOP n] ... FROM <table> [WHERE] [GROUP BY] [HAVING]
+  [ORDER BY] [LIMIT/OFFSET]. Supports aggregates (including COUNT(DISTINCT)),
+  CASE, date functions (YEAR, MONTH, DATE_TRUNC, DATEADD, EXTRACT, ...) and
+  window functions over the result (LAG/LEAD, ROW_NUMBER/RANK, and running
+  or partition SUM/AVG/COUNT/MIN/MAX). Window functions express MoM and YTD.
+- DAX: EVALUATE with SUMMARIZECOLUMNS, SUMMARIZE, TOPN, FILTER, ROW or
+  CALCULATETABLE, plus DEFINE MEASURE/VAR, measure definitions
+  (`Name = ...`), CALCULATE filters, DIVIDE, IF, VAR/RETURN, the X iterators,
+  and time intelligence: TOTALYTD/QTD/MTD, DATESYTD, DATEADD,
+  SAMEPERIODLASTYEAR, PREVIOUSMONTH/QUARTER/YEAR and PARALLELPERIOD.
+
+Every table name refers to the one dataset. Both dialects compile to the
+same plan. WHERE clauses become NumPy masks. Group keys are hashed to dense
+codes, and each aggregate is a bincount (or a sort and reduceat) over those
+codes. Time intelligence runs on the grouped result. Each group is placed
+in a calendar bucket of the date column, taken from the grouping or
+implicitly by month. Prior periods are looked up by shifted bucket. To-date
+totals are cumulative sums within each year, quarter or month.
+"""
+
+import operator
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.columnar import BOOLEAN, ColumnarFrame
+
+DEFAULT_PREVIEW_ROWS = 100
+MAX_PREVIEW_ROWS = 1000
+
+AGGREGATES = {'SUM', 'AVG', 'MIN', 'MAX', 'COUNT'}
+GRAINS = ('day', 'week', 'month', 'quarter', 'year')
+UNIT_ALIASES = {
+    'd': 'day', 'dd': 'day', 'day': 'day', 'days': 'day',
+    'wk': 'week', 'ww': 'week', 'week': 'week', 'weeks': 'week',
+    'm': 'month', 'mm': 'month', 'month': 'month', 'months': 'month',
+    'q': 'quarter', 'qq': 'quarter', 'quarter': 'quarter', 'quarters': 'quarter',
+    'yy': 'year', 'yyyy': 'year', 'year': 'year', 'years': 'year'
+}
+DATE_PARTS = {'YEAR', 'MONTH', 'DAY', 'QUARTER'}
+
+
+class QueryError(ValueError):
+    """Raised for queries outside the supported subset or that do not fit the dataset"""
+
+
+# -------------------------
+# Tokenizer
+# -------------------------
+
+_TOKEN = re.compile(r"""
+    (?P<ws>\s+|--[^\n]*|//[^\n]*|/\*.*?\*/)
+  | (?P<num>\d+\.\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?|\d+(?:[eE][-+]?\d+)?)
+  | (?P<sq>'(?:[^']|'')*')
+  | (?P<dq>"(?:[^"]|"")*")
+  | (?P<br>\[[^\]]*\])
+  | (?P<bt>`[^`]*`)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op><>|!=|<=|>=|==|&&|\|\||:=|[-+*/%^=<>(),{};&.])
+""", re.S | re.X)
+
+
+def tokenize(text: str) -> List[Tuple[str, Any, int]]:
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None:
+            raise QueryError(f"Unexpected character {text[pos]!r} at position {pos}")
+        kind = match.lastgroup
+        value = match.group()
+        if kind == 'num':
+            tokens.append(('num', float(value) if any(c in value for c in '.eE') else int(value), pos))
+        elif kind == 'sq':
+            tokens.append(('sq', value[1:-1].replace("''", "'"), pos))
+        elif kind == 'dq':
+            tokens.append(('dq', value[1:-1].replace('""', '"'), pos))
+        elif kind in ('br', 'bt'):
+            tokens.append((kind, value[1:-1], pos))
+        elif kind != 'ws':
+            tokens.append((kind, value, pos))
+        pos = match.end()
+    tokens.append(('eof', None, len(text)))
+    return tokens
+
+
+def _and(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return ('bin', 'and', left, right)
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.i = 0
+
+    def peek(self, offset: int = 0):
+        return self.tokens[min(self.i + offset, len(self.tokens) - 1)]
+
+    def next(self):
+        token = self.tokens[self.i]
+        self.i = min(self.i + 1, len(self.tokens) - 1)
+        return token
+
+    def is_keyword(self, *words, offset: int = 0) -> bool:
+        kind, value, _ = self.peek(offset)
+        return kind == 'ident' and value.upper() in words
+
+    def accept_keyword(self, *words) -> Optional[str]:
+        if self.is_keyword(*words):
+            return self.next()[1].upper()
+        return None
+
+    def expect_keyword(self, word: str):
+        if not self.accept_keyword(word):
+            self.fail(f"Expected {word}")
+
+    def is_op(self, *ops, offset: int = 0) -> bool:
+        kind, value, _ = self.peek(offset)
+        return kind == 'op' and value in ops
+
+    def accept_op(self, *ops) -> Optional[str]:
+        if self.is_op(*ops):
+            return self.next()[1]
+        return None
+
+    def expect_op(self, op: str):
+        if not self.accept_op(op):
+            self.fail(f"Expected '{op}'")
+
+    def fail(self, message: str):
+        kind, value, pos = self.peek()
+        found = 'end of query' if kind == 'eof' else repr(value)
+        raise QueryError(f"{message} at position {pos} (found {found})")
+
+    def integer(self) -> int:
+        kind, value, _ = self.next()
+        if kind != 'num' or not isinstance(value, int):
+            self.i -= 1
+            self.fail("Expected an integer")
+        return value
+
+
+# -------------------------
+# SQL front end
+# -------------------------
+
+class _SQLParser(_Parser):
+    COMPARISONS = ('=', '==', '<>', '!=', '<', '<=', '>', '>=')
+
+    def query(self) -> Dict[str, Any]:
+        if self.is_keyword('WITH'):
+            self.fail("Common table expressions (WITH) are not supported")
+        self.expect_keyword('SELECT')
+        plan = _new_plan()
+        plan['distinct'] = bool(self.accept_keyword('DISTINCT'))
+        if self.accept_keyword('TOP'):
+            plan['limit'] = self.integer()
+        if self.accept_op('*'):
+            plan['star'] = True
+        else:
+            while True:
+                start = self.peek()[2]
+                expr = self.expr()
+                end = self.peek()[2]
+                alias = None
+                if self.accept_keyword('AS'):
+                    alias = self.name()
+                elif self.peek()[0] in ('ident', 'dq', 'br', 'bt') and not self.is_keyword(
+                        'FROM', 'WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'UNION'):
+                    alias = self.name()
+                plan['select'].append((expr, alias or self.text[start:end].strip()))
+                if not self.accept_op(','):
+                    break
+        if self.accept_keyword('FROM'):
+            if self.is_op('('):
+                self.fail("Subqueries are not supported")
+            self.name()
+            while self.accept_op('.'):
+                self.name()
+            if self.peek()[0] in ('ident', 'dq', 'br', 'bt') and not self.is_keyword(
+                    'WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'JOIN', 'INNER', 'LEFT',
+                    'RIGHT', 'FULL', 'CROSS', 'UNION'):
+                self.accept_keyword('AS')
+                self.name()
+            if self.is_keyword('JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'CROSS') or self.is_op(','):
+                self.fail("JOINs are not supported; the dataset is a single table")
+        if self.accept_keyword('WHERE'):
+            plan['where'] = self.expr()
+        if self.accept_keyword('GROUP'):
+            self.expect_keyword('BY')
+            plan['group_by'] = self.expr_list()
+        if self.accept_keyword('HAVING'):
+            plan['having'] = self.expr()
+        if self.accept_keyword('ORDER'):
+            self.expect_keyword('BY')
+            plan['order_by'] = self.order_list()
+        if self.accept_keyword('LIMIT'):
+            plan['limit'] = self.integer()
+        if self.accept_keyword('OFFSET'):
+            plan['offset'] = self.integer()
+            self.accept_keyword('ROWS', 'ROW')
+        if self.accept_keyword('FETCH'):
+            self.accept_keyword('FIRST', 'NEXT')
+            plan['limit'] = self.integer()
+            self.accept_keyword('ROWS', 'ROW')
+            self.accept_keyword('ONLY')
+        self.accept_op(';')
+        if self.peek()[0] != 'eof':
+            self.fail("Unsupported clause")
+        return plan
+
+    def name(self) -> str:
+        kind, value, _ = self.next()
+        if kind not in ('ident', 'dq', 'br', 'bt', 'sq'):
+            self.i -= 1
+            self.fail("Expected a name")
+        return value
+
+    def expr_list(self) -> List[tuple]:
+        items = [self.expr()]
+        while self.accept_op(','):
+            items.append(self.expr())
+        return items
+
+    def order_list(self) -> List[Tuple[tuple, bool]]:
+        items = []
+        while True:
+            expr = self.expr()
+            desc = self.accept_keyword('ASC', 'DESC') == 'DESC'
+            if self.accept_keyword('NULLS'):
+                self.accept_keyword('FIRST', 'LAST')
+            items.append((expr, desc))
+            if not self.accept_op(','):
+                return items
+
+    def expr(self):
+        node = self.and_expr()
+        while self.accept_keyword('OR'):
+            node = ('bin', 'or', node, self.and_expr())
+        return node
+
+    def and_expr(self):
+        node = self.not_expr()
+        while self.accept_keyword('AND'):
+            node = ('bin', 'and', node, self.not_expr())
+        return node
+
+    def not_expr(self):
+        if self.accept_keyword('NOT'):
+            return ('not', self.not_expr())
+        return self.predicate()
+
+    def predicate(self):
+        node = self.additive()
+        op = self.accept_op(*self.COMPARISONS)
+        if op:
+            return ('bin', '=' if op == '==' else ('<>' if op == '!=' else op), node, self.additive())
+        negate = bool(self.accept_keyword('NOT'))
+        if self.accept_keyword('IN'):
+            self.expect_op('(')
+            if self.is_keyword('SELECT'):
+                self.fail("Subqueries are not supported")
+            items = self.expr_list()
+            self.expect_op(')')
+            return ('in', node, items, negate)
+        if self.accept_keyword('BETWEEN'):
+            low = self.additive()
+            self.expect_keyword('AND')
+            return ('between', node, low, self.additive(), negate)
+        if self.accept_keyword('LIKE'):
+            return ('like', node, self.additive(), negate)
+        if negate:
+            self.fail("Expected IN, BETWEEN or LIKE after NOT")
+        if self.accept_keyword('IS'):
+            negate = bool(self.accept_keyword('NOT'))
+            self.expect_keyword('NULL')
+            return ('isnull', node, negate)
+        return node
+
+    def additive(self):
+        node = self.multiplicative()
+        while True:
+            op = self.accept_op('+', '-', '||')
+            if not op:
+                return node
+            node = ('bin', '&' if op == '||' else op, node, self.multiplicative())
+
+    def multiplicative(self):
+        node = self.unary()
+        while True:
+            op = self.accept_op('*', '/', '%')
+            if not op:
+                return node
+            node = ('bin', op, node, self.unary())
+
+    def unary(self):
+        if self.accept_op('-'):
+            return ('neg', self.unary())
+        self.accept_op('+')
+        return self.primary()
+
+    def primary(self):
+        kind, value, _ = self.peek()
+        if kind == 'num':
+            self.next()
+            return ('lit', value)
+        if kind == 'sq':
+            self.next()
+            return ('lit', value)
+        if self.accept_op('('):
+            if self.is_keyword('SELECT'):
+                self.fail("Subqueries are not supported")
+            node = self.expr()
+            self.expect_op(')')
+            return node
+        if kind in ('dq', 'br', 'bt'):
+            self.next()
+            return self.qualified(value)
+        if kind != 'ident':
+            self.fail("Expected an expression")
+        word = value.upper()
+        if word == 'NULL':
+            self.next()
+            return ('lit', None)
+        if word in ('TRUE', 'FALSE'):
+            self.next()
+            return ('lit', word == 'TRUE')
+        if word in ('DATE', 'TIMESTAMP') and self.peek(1)[0] == 'sq':
+            self.next()
+            return ('func', 'CAST', [('lit', self.next()[1]), ('lit', 'DATE')])
+        if word in ('CURRENT_DATE', 'CURRENT_TIMESTAMP'):
+            self.next()
+            return ('func', 'TODAY', [])
+        if word == 'CASE':
+            self.next()
+            return self.case()
+        if word == 'INTERVAL':
+            self.fail("INTERVAL literals are not supported; use DATEADD")
+        self.next()
+        if self.accept_op('('):
+            return self.call(word)
+        return self.qualified(value)
+
+    def qualified(self, name: str):
+        # table.column (or schema.table.column): the qualifier is the one dataset
+        while self.accept_op('.'):
+            name = self.name()
+        return ('col', name)
+
+    def case(self):
+        operand = None if self.is_keyword('WHEN') else self.expr()
+        whens = []
+        while self.accept_keyword('WHEN'):
+            condition = self.expr()
+            if operand is not None:
+                condition = ('bin', '=', operand, condition)
+            self.expect_keyword('THEN')
+            whens.append((condition, self.expr()))
+        otherwise = self.expr() if self.accept_keyword('ELSE') else ('lit', None)
+        self.expect_keyword('END')
+        return ('case', whens, otherwise)
+
+    def call(self, name: str):
+        if name == 'EXTRACT':
+            part = self.name().upper()
+            self.expect_keyword('FROM')
+            arg = self.expr()
+            self.expect_op(')')
+            return ('func', part, [arg])
+        if name == 'CAST':
+            arg = self.expr()
+            self.expect_keyword('AS')
+            target = self.name().upper()
+            if self.accept_op('('):
+                self.expr_list()
+                self.expect_op(')')
+            self.expect_op(')')
+            return ('func', 'CAST', [arg, ('lit', target)])
+        if name in ('DATEADD', 'DATEPART', 'DATEDIFF', 'DATE_PART', 'DATETRUNC') and self.peek()[0] == 'ident':
+            # T-SQL style unit arguments are bare words: DATEADD(month, -1, d)
+            args = [('lit', self.next()[1])]
+            while self.accept_op(','):
+                args.append(self.expr())
+        else:
+            distinct = bool(self.accept_keyword('DISTINCT'))
+            if self.accept_op('*'):
+                args = [('star',)]
+            elif self.is_op(')'):
+                args = []
+            else:
+                args = self.expr_list()
+            if distinct:
+                self.expect_op(')')
+                if name != 'COUNT':
+                    self.fail("DISTINCT is only supported in COUNT")
+                return ('agg', 'COUNT', args[0], True, None, ())
+        self.expect_op(')')
+        if self.accept_keyword('OVER'):
+            return self.window(name, args)
+        name = {'AVERAGE': 'AVG', 'MEAN': 'AVG'}.get(name, name)
+        if name in AGGREGATES:
+            if len(args) != 1:
+                self.fail(f"{name} takes one argument")
+            return ('agg', name, args[0], False, None, ())
+        return ('func', name, args)
+
+    def window(self, name: str, args: List[tuple]):
+        self.expect_op('(')
+        partition, order = [], []
+        if self.accept_keyword('PARTITION'):
+            self.expect_keyword('BY')
+            partition = self.expr_list()
+        if self.accept_keyword('ORDER'):
+            self.expect_keyword('BY')
+            order = self.order_list()
+        if self.accept_keyword('ROWS', 'RANGE'):
+            # Frames other than the default running frame are not supported; skip the clause
+            depth = 0
+            while depth or not self.is_op(')'):
+                depth += 1 if self.is_op('(') else (-1 if self.is_op(')') else 0)
+                self.next()
+        self.expect_op(')')
+        name = {'AVERAGE': 'AVG'}.get(name, name)
+        return ('window', name, args, partition, order)
+
+
+# -------------------------
+# DAX front end
+# -------------------------
+
+DAX_AGGREGATES = {'SUM': 'SUM', 'AVERAGE': 'AVG', 'MIN': 'MIN', 'MAX': 'MAX', 'COUNT': 'COUNT', 'COUNTA': 'COUNT'}
+DAX_ITERATORS = {'SUMX': 'SUM', 'AVERAGEX': 'AVG', 'MINX': 'MIN', 'MAXX': 'MAX', 'COUNTX': 'COUNT'}
+DAX_PREVIOUS = {'PREVIOUSDAY': 'day', 'PREVIOUSMONTH': 'month', 'PREVIOUSQUARTER': 'quarter', 'PREVIOUSYEAR': 'year',
+                'NEXTDAY': 'day', 'NEXTMONTH': 'month', 'NEXTQUARTER': 'quarter', 'NEXTYEAR': 'year'}
+DAX_TO_DATE = {'DATESYTD': 'year', 'DATESQTD': 'quarter', 'DATESMTD': 'month',
+               'TOTALYTD': 'year', 'TOTALQTD': 'quarter', 'TOTALMTD': 'month'}
+DAX_SCALARS = {'DIVIDE', 'IF', 'ISBLANK', 'COALESCE', 'ABS', 'ROUND', 'UPPER', 'LOWER', 'YEAR', 'MONTH', 'DAY',
+               'QUARTER', 'WEEKDAY', 'TODAY', 'NOW'}
+DAX_IGNORED = {'ALL', 'ALLSELECTED', 'REMOVEFILTERS', 'ALLEXCEPT', 'ALLNOBLANKROW', 'USERELATIONSHIP', 'CROSSFILTER'}
+
+
+class _DAXParser(_Parser):
+    def __init__(self, text: str):
+        super().__init__(text)
+        self.scopes: List[set] = []
+
+    def document(self) -> Tuple[tuple, Dict[str, tuple]]:
+        measures = {}
+        if self.accept_keyword('DEFINE'):
+            while True:
+                if self.accept_keyword('MEASURE'):
+                    name = self.measure_name()
+                    self.expect_op('=')
+                    measures[name.lower()] = self.expr()
+                elif self.accept_keyword('VAR'):
+                    name = self.next()[1]
+                    self.expect_op('=')
+                    measures[name.lower()] = self.expr()
+                elif self.accept_keyword('COLUMN', 'TABLE'):
+                    self.fail("DEFINE COLUMN/TABLE is not supported")
+                else:
+                    break
+        if self.accept_keyword('EVALUATE'):
+            table = self.expr()
+            order = []
+            if self.accept_keyword('ORDER'):
+                self.expect_keyword('BY')
+                while True:
+                    expr = self.expr()
+                    order.append((expr, self.accept_keyword('ASC', 'DESC') == 'DESC'))
+                    if not self.accept_op(','):
+                        break
+            top = ('evaluate', table, order)
+        else:
+            name = self.definition_name()
+            top = ('measure', name or 'Value', self.expr())
+        if self.peek()[0] != 'eof':
+            self.fail("Unexpected text after the expression")
+        return top, measures
+
+    def measure_name(self) -> str:
+        kind, value, _ = self.next()
+        if kind in ('ident', 'sq') and self.peek()[0] == 'br':
+            return self.next()[1]
+        if kind in ('br', 'ident', 'sq'):
+            return value
+        self.i -= 1
+        self.fail("Expected a measure name")
+
+    def definition_name(self) -> Optional[str]:
+        """`Name = expr` / `Name := expr`; the name may contain spaces"""
+        for j in range(self.i, len(self.tokens)):
+            kind, value, pos = self.tokens[j]
+            if kind == 'op' and value in ('=', ':='):
+                if j == self.i:
+                    self.fail("Expected a measure name")
+                name = self.text[self.peek()[2]:pos].strip()
+                if '(' in name or self.is_keyword('VAR'):
+                    return None
+                self.i = j + 1
+                return name.strip('[]')
+            if kind == 'op' and value not in ('.', '-'):
+                return None
+            if kind in ('num', 'dq', 'eof'):
+                return None
+        return None
+
+    def expr(self):
+        node = self.and_expr()
+        while self.accept_op('||'):
+            node = ('bin', 'or', node, self.and_expr())
+        return node
+
+    def and_expr(self):
+        node = self.not_expr()
+        while self.accept_op('&&'):
+            node = ('bin', 'and', node, self.not_expr())
+        return node
+
+    def not_expr(self):
+        if self.is_keyword('NOT') and not self.is_op('(', offset=1):
+            self.next()
+            return ('not', self.not_expr())
+        return self.comparison()
+
+    def comparison(self):
+        node = self.concat()
+        op = self.accept_op('=', '==', '<>', '<', '<=', '>', '>=')
+        if op:
+            return ('bin', '=' if op == '==' else op, node, self.concat())
+        negate = False
+        if self.is_keyword('NOT') and self.is_keyword('IN', offset=1):
+            self.next()
+            negate = True
+        if self.accept_keyword('IN'):
+            items = self.primary()
+            if items[0] != 'set':
+                self.fail("Expected a {...} list after IN")
+            return ('in', node, items[1], negate)
+        return node
+
+    def concat(self):
+        node = self.additive()
+        while self.accept_op('&'):
+            node = ('bin', '&', node, self.additive())
+        return node
+
+    def additive(self):
+        node = self.multiplicative()
+        while True:
+            op = self.accept_op('+', '-')
+            if not op:
+                return node
+            node = ('bin', op, node, self.multiplicative())
+
+    def multiplicative(self):
+        node = self.power()
+        while True:
+            op = self.accept_op('*', '/')
+            if not op:
+                return node
+            node = ('bin', op, node, self.power())
+
+    def power(self):
+        node = self.unary()
+        if self.accept_op('^'):
+            return ('bin', '^', node, self.power())
+        return node
+
+    def unary(self):
+        if self.accept_op('-'):
+            return ('neg', self.unary())
+        self.accept_op('+')
+        return self.primary()
+
+    def primary(self):
+        kind, value, _ = self.next()
+        if kind == 'num':
+            return ('lit', value)
+        if kind == 'dq':
+            return ('lit', value)
+        if kind == 'br':
+            return ('ref', value)
+        if kind == 'sq':
+            if self.peek()[0] == 'br':
+                return ('col', self.next()[1])
+            return ('table', value)
+        if kind == 'op' and value == '(':
+            node = self.expr()
+            self.expect_op(')')
+            return node
+        if kind == 'op' and value == '{':
+            items = [] if self.is_op('}') else [self.expr()]
+            while self.accept_op(','):
+                items.append(self.expr())
+            self.expect_op('}')
+            return ('set', items)
+        if kind != 'ident':
+            self.i -= 1
+            self.fail("Expected an expression")
+        word = value.upper()
+        if word == 'VAR':
+            return self.let()
+        if self.peek()[0] == 'br':
+            return ('col', self.next()[1])
+        if self.accept_op('('):
+            args = [] if self.is_op(')') else [self.expr()]
+            while self.accept_op(','):
+                args.append(self.expr())
+            self.expect_op(')')
+            return self.call(word, args)
+        if any(value.lower() in scope for scope in self.scopes):
+            return ('varref', value.lower())
+        if word in ('TRUE', 'FALSE'):
+            return ('lit', word == 'TRUE')
+        return ('table', value)
+
+    def let(self):
+        bindings = []
+        self.scopes.append(set())
+        try:
+            while True:
+                name = self.next()[1]
+                self.expect_op('=')
+                bindings.append((name.lower(), self.expr()))
+                self.scopes[-1].add(name.lower())
+                if not self.accept_keyword('VAR'):
+                    break
+            self.expect_keyword('RETURN')
+            return ('let', bindings, self.expr())
+        finally:
+            self.scopes.pop()
+
+    def call(self, name: str, args: List[tuple]):
+        if name in ('TRUE', 'FALSE'):
+            return ('lit', name == 'TRUE')
+        if name == 'BLANK':
+            return ('lit', None)
+        if name in DAX_AGGREGATES:
+            return ('agg', DAX_AGGREGATES[name], self.arg(args, 0, name), False, None, ())
+        if name == 'DISTINCTCOUNT':
+            return ('agg', 'COUNT', self.arg(args, 0, name), True, None, ())
+        if name == 'COUNTROWS':
+            return ('agg', 'COUNT', ('star',), False, _table_filter(args[0]) if args else None, ())
+        if name in DAX_ITERATORS:
+            return ('agg', DAX_ITERATORS[name], self.arg(args, 1, name), False, _table_filter(args[0]), ())
+        if name == 'CALCULATE':
+            return ('calc', self.arg(args, 0, name), [_modifier(arg) for arg in args[1:]])
+        if name in ('TOTALYTD', 'TOTALQTD', 'TOTALMTD'):
+            modifiers = [('todate', _column_name(self.arg(args, 1, name)), DAX_TO_DATE[name])]
+            modifiers += [_modifier(arg) for arg in args[2:3]]
+            return ('calc', args[0], modifiers)
+        if name == 'DATE' and len(args) == 3:
+            return ('func', 'MAKEDATE', args)
+        if name in DAX_SCALARS:
+            return ('func', name, args)
+        return ('call', name, args)
+
+    def arg(self, args: List[tuple], index: int, name: str):
+        if len(args) <= index:
+            self.fail(f"{name} needs at least {index + 1} argument(s)")
+        return args[index]
+
+
+def _column_name(node) -> str:
+    if node[0] in ('col', 'ref'):
+        return node[1]
+    raise QueryError("Expected a date column reference")
+
+
+def _table_filter(node) -> Optional[tuple]:
+    """Row filter implied by a DAX table expression (FILTER, CALCULATETABLE, ALL, a table name)"""
+    if node[0] == 'table':
+        return None
+    if node[0] == 'call':
+        name, args = node[1], node[2]
+        if name == 'FILTER':
+            return _and(_table_filter(args[0]), args[1])
+        if name == 'CALCULATETABLE':
+            condition = _table_filter(args[0])
+            for modifier in map(_modifier, args[1:]):
+                if modifier[0] == 'filter':
+                    condition = _and(condition, modifier[1])
+            return condition
+        if name in DAX_IGNORED or name in ('VALUES', 'DISTINCT', 'KEEPFILTERS'):
+            return _table_filter(args[0]) if name == 'KEEPFILTERS' else None
+    raise QueryError(f"Unsupported table expression: {_describe(node)}")
+
+
+def _modifier(node) -> tuple:
+    """A CALCULATE argument: row filter, time intelligence shift / to-date, or an ignored ALL()"""
+    if node[0] == 'call':
+        name, args = node[1], node[2]
+        if name == 'KEEPFILTERS':
+            return _modifier(args[0])
+        if name in DAX_IGNORED:
+            return ('ignore', name)
+        if name in ('FILTER', 'CALCULATETABLE', 'VALUES'):
+            return ('filter', _table_filter(node))
+        if name in ('DATEADD', 'PARALLELPERIOD'):
+            return ('shift', _column_name(args[0]), int(_literal(args[1])), _unit(args[2]))
+        if name == 'SAMEPERIODLASTYEAR':
+            return ('shift', _column_name(args[0]), -1, 'year')
+        if name in DAX_PREVIOUS:
+            return ('shift', _column_name(args[0]), -1 if name.startswith('PREVIOUS') else 1, DAX_PREVIOUS[name])
+        if name in DAX_TO_DATE:
+            return ('todate', _column_name(args[0]), DAX_TO_DATE[name])
+        raise QueryError(f"Unsupported CALCULATE filter: {name}")
+    return ('filter', node)
+
+
+def _literal(node):
+    if node[0] == 'lit':
+        return node[1]
+    if node[0] == 'neg' and node[1][0] == 'lit':
+        return -node[1][1]
+    raise QueryError(f"Expected a literal, found {_describe(node)}")
+
+
+def _unit(node) -> str:
+    value = node[1] if node[0] in ('lit', 'table', 'col') else None
+    unit = UNIT_ALIASES.get(str(value).lower())
+    if unit is None:
+        raise QueryError(f"Unknown date unit: {value}")
+    return unit
+
+
+def _describe(node) -> str:
+    if node[0] in ('call', 'func'):
+        return f"{node[1]}(...)"
+    return node[0]
+
+
+def _dax_plan(top: tuple, measures: Dict[str, tuple]) -> Dict[str, Any]:
+    if top[0] == 'measure':
+        plan = _new_plan()
+        plan['select'].append((top[2], top[1]))
+        plan['measures'] = {top[1]}
+    else:
+        plan = _table_plan(top[1])
+        plan['order_by'] = plan['order_by'] + top[2]
+    aliases = {alias.lower() for _, alias in plan['select']}
+    lower = _Lowering(measures, aliases)
+    plan['select'] = [(lower.expr(expr, alias in plan['measures']), alias) for expr, alias in plan['select']]
+    plan['group_by'] = [lower.expr(expr, False) for expr in plan['group_by']]
+    for clause in ('where', 'having'):
+        if plan[clause] is not None:
+            plan[clause] = lower.expr(plan[clause], clause == 'having')
+    plan['order_by'] = [(lower.expr(expr, True), desc) for expr, desc in plan['order_by']]
+    plan['notes'] = sorted(lower.notes)
+    return plan
+
+
+def _table_plan(node) -> Dict[str, Any]:
+    if node[0] == 'table':
+        plan = _new_plan()
+        plan['star'] = True
+        return plan
+    if node[0] != 'call':
+        raise QueryError(f"EVALUATE needs a table expression, found {_describe(node)}")
+    name, args = node[1], node[2]
+    if name in ('SUMMARIZECOLUMNS', 'SUMMARIZE', 'GROUPBY'):
+        plan = _new_plan()
+        rest = args
+        if name != 'SUMMARIZECOLUMNS':
+            plan['where'] = _table_filter(args[0])
+            rest = args[1:]
+        i = 0
+        while i < len(rest):
+            arg = rest[i]
+            if arg[0] == 'lit' and isinstance(arg[1], str):
+                if i + 1 >= len(rest):
+                    raise QueryError(f"Measure \"{arg[1]}\" has no expression")
+                plan['select'].append((rest[i + 1], arg[1]))
+                plan['measures'].add(arg[1])
+                i += 2
+                continue
+            if arg[0] in ('col', 'ref'):
+                plan['group_by'].append(('col', arg[1]))
+                plan['select'].append((('col', arg[1]), arg[1]))
+            elif arg[0] == 'call' and arg[1] in ('VALUES', 'ALL') and arg[2] and arg[2][0][0] == 'col':
+                plan['group_by'].append(arg[2][0])
+                plan['select'].append((arg[2][0], arg[2][0][1]))
+            else:
+                plan['where'] = _and(plan['where'], _table_filter(arg))
+            i += 1
+        return plan
+    if name == 'TOPN':
+        plan = _table_plan(args[1])
+        plan['limit'] = int(_literal(args[0]))
+        order = []
+        rest = args[2:]
+        i = 0
+        while i < len(rest):
+            desc = True
+            if i + 1 < len(rest) and _is_direction(rest[i + 1]):
+                desc = _direction(rest[i + 1])
+                order.append((rest[i], desc))
+                i += 2
+            else:
+                order.append((rest[i], desc))
+                i += 1
+        plan['order_by'] = order + plan['order_by']
+        return plan
+    if name == 'FILTER':
+        inner = args[0]
+        if inner[0] == 'table' or (inner[0] == 'call' and inner[1] in DAX_IGNORED | {'VALUES'}):
+            plan = _table_plan(('table', 'dataset'))
+            plan['where'] = args[1]
+            return plan
+        plan = _table_plan(inner)
+        plan['having'] = _and(plan['having'], args[1])
+        return plan
+    if name == 'CALCULATETABLE':
+        plan = _table_plan(args[0])
+        for modifier in map(_modifier, args[1:]):
+            if modifier[0] == 'filter':
+                plan['where'] = _and(plan['where'], modifier[1])
+        return plan
+    if name == 'ROW':
+        plan = _new_plan()
+        for i in range(0, len(args) - 1, 2):
+            plan['select'].append((args[i + 1], _literal(args[i])))
+            plan['measures'].add(_literal(args[i]))
+        return plan
+    if name in DAX_IGNORED | {'VALUES', 'DISTINCT'}:
+        if args and args[0][0] == 'col':
+            plan = _new_plan()
+            plan['select'].append((args[0], args[0][1]))
+            plan['group_by'].append(args[0])
+            return plan
+        return _table_plan(('table', 'dataset'))
+    raise QueryError(f"Unsupported table function: {name}")
+
+
+def _is_direction(node) -> bool:
+    return (node[0] == 'table' and node[1].upper() in ('ASC', 'DESC')) or (node[0] == 'lit' and node[1] in (0, 1))
+
+
+def _direction(node) -> bool:
+    """True for descending"""
+    if node[0] == 'table':
+        return node[1].upper() == 'DESC'
+    return node[1] == 0
+
+
+class _Lowering:
+    """Resolves measures, VARs and CALCULATE modifiers into plain aggregates with filters and time ops"""
+
+    def __init__(self, measures: Dict[str, tuple], aliases: set):
+        self.measures = measures
+        self.aliases = aliases
+        self.notes = set()
+
+    def expr(self, node, measure_context: bool, modifiers: Tuple = (), env: Optional[dict] = None):
+        env = env or {}
+        kind = node[0]
+        if kind == 'calc':
+            extra = []
+            for modifier in node[2]:
+                if modifier[0] == 'ignore':
+                    self.notes.add(f"{modifier[1]}() is ignored: the preview has no outer filter context")
+                else:
+                    extra.append(modifier)
+            return self.expr(node[1], True, tuple(modifiers) + tuple(extra), env)
+        if kind == 'let':
+            scope = dict(env)
+            for name, value in node[1]:
+                scope[name] = self.expr(value, measure_context, modifiers, scope)
+            return self.expr(node[2], measure_context, modifiers, scope)
+        if kind == 'varref':
+            return env[node[1]]
+        if kind == 'agg':
+            condition = node[4]
+            time_ops = list(node[5])
+            for modifier in reversed(modifiers):
+                if modifier[0] == 'filter':
+                    condition = _and(condition, self.expr(modifier[1], False, (), env))
+                else:
+                    time_ops.append(modifier)
+            if condition is not None and node[4] is None:
+                condition = self.expr(condition, False, (), env)
+            arg = node[2] if node[2][0] == 'star' else self.expr(node[2], False, (), env)
+            return ('agg', node[1], arg, node[3], condition, tuple(time_ops))
+        if kind == 'ref':
+            name = node[1].lower()
+            if name in self.measures:
+                return self.expr(self.measures[name], True, modifiers, env)
+            if measure_context and name in self.aliases and not modifiers:
+                return ('ref', node[1])
+            if measure_context:
+                # A bare column in a measure is summed, as Power BI does for implicit measures
+                return self.expr(('agg', 'SUM', ('col', node[1]), False, None, ()), True, modifiers, env)
+            return ('col', node[1])
+        if kind == 'col':
+            if measure_context and modifiers:
+                return self.expr(('agg', 'SUM', node, False, None, ()), True, modifiers, env)
+            return node
+        if kind == 'table':
+            raise QueryError(f"'{node[1]}' is a table, not a value")
+        if kind == 'call':
+            raise QueryError(f"Unsupported DAX function: {node[1]}")
+        return _map_children(node, lambda child: self.expr(child, measure_context, modifiers, env))
+
+
+def _map_children(node, fn):
+    kind = node[0]
+    if kind in ('bin',):
+        return (kind, node[1], fn(node[2]), fn(node[3]))
+    if kind in ('neg', 'not'):
+        return (kind, fn(node[1]))
+    if kind == 'func':
+        return (kind, node[1], [fn(arg) for arg in node[2]])
+    if kind == 'in':
+        return (kind, fn(node[1]), [fn(item) for item in node[2]], node[3])
+    if kind == 'set':
+        return (kind, [fn(item) for item in node[1]])
+    if kind == 'case':
+        return (kind, [(fn(c), fn(v)) for c, v in node[1]], fn(node[2]))
+    if kind == 'between':
+        return (kind, fn(node[1]), fn(node[2]), fn(node[3]), node[4])
+    if kind == 'like':
+        return (kind, fn(node[1]), fn(node[2]), node[3])
+    if kind == 'isnull':
+        return (kind, fn(node[1]), node[2])
+    if kind == 'window':
+        return (kind, node[1], [fn(arg) for arg in node[2]], [fn(p) for p in node[3]],
+                [(fn(e), d) for e, d in node[4]])
+    return node
+
+
+def _children(node) -> List[tuple]:
+    found = []
+    _map_children(node, lambda child: found.append(child) or child)
+    if node[0] == 'agg':
+        found = [node[2]] + ([node[4]] if node[4] is not None else [])
+    return found
+
+
+def _walk(node):
+    yield node
+    for child in _children(node):
+        yield from _walk(child)
+
+
+def _new_plan() -> Dict[str, Any]:
+    return {'select': [], 'star': False, 'distinct': False, 'where': None, 'group_by': [], 'having': None,
+            'order_by': [], 'limit': None, 'offset': 0, 'measures': set(), 'notes': []}
+
+
+def detect_language(text: str) -> str:
+    stripped = re.sub(r'(--|//)[^\n]*|/\*.*?\*/', ' ', text, flags=re.S).strip()
+    if re.match(r'(SELECT|WITH)\b', stripped, re.I):
+        return 'sql'
+    return 'dax'
+
+
+def parse_query(text: str, language: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """Compile SQL or DAX text into an execution plan"""
+    if not text or not str(text).strip():
+        raise QueryError("query is empty")
+    language = (language or detect_language(text)).lower()
+    if language == 'sql':
+        parser = _SQLParser(text)
+        plan = parser.query()
+        _resolve_sql_references(plan)
+    elif language == 'dax':
+        top, measures = _DAXParser(text).document()
+        plan = _dax_plan(top, measures)
+    else:
+        raise QueryError(f"Unknown query language: {language}. Use sql or dax")
+    return language, plan
+
+
+def _resolve_sql_references(plan: Dict[str, Any]):
+    """GROUP BY / ORDER BY may name a select alias or a 1-based select position"""
+    select = plan['select']
+    aliases = {alias.lower(): expr for expr, alias in select}
+
+    def resolve(node):
+        if node[0] == 'lit' and isinstance(node[1], int) and not isinstance(node[1], bool):
+            if not 1 <= node[1] <= len(select):
+                raise QueryError(f"Position {node[1]} is not in the select list")
+            return select[node[1] - 1][0]
+        return node
+
+    group_by = []
+    for node in plan['group_by']:
+        node = resolve(node)
+        if node[0] == 'col' and node[1].lower() in aliases and aliases[node[1].lower()] != node:
+            node = aliases[node[1].lower()]
+        group_by.append(node)
+    plan['group_by'] = group_by
+    plan['order_by'] = [(resolve(expr), desc) for expr, desc in plan['order_by']]
+
+
+# -------------------------
+# Evaluation
+# -------------------------
+
+def _is_datetime(value) -> bool:
+    return isinstance(value, (np.ndarray, np.generic)) and np.issubdtype(value.dtype, np.datetime64)
+
+
+def _is_object(value) -> bool:
+    return isinstance(value, str) or (isinstance(value, np.ndarray) and value.dtype == object)
+
+
+def _to_datetime(value):
+    try:
+        if isinstance(value, str):
+            return np.datetime64(value, 'ms')
+        if isinstance(value, np.ndarray) and value.dtype == object:
+            return np.array([np.datetime64('NaT') if v is None else np.datetime64(v, 'ms') for v in value.tolist()],
+                            dtype='datetime64[ms]')
+    except ValueError:
+        raise QueryError(f"Cannot compare a date column with {value!r}")
+    return value
+
+
+def _truthy(value, n: int) -> np.ndarray:
+    value = np.asarray(value)
+    if value.dtype == bool:
+        out = value
+    elif value.dtype == object:
+        out = np.array([bool(v) for v in value.tolist()], dtype=bool) if value.ndim else np.array(bool(value.item()))
+    else:
+        with np.errstate(invalid='ignore'):
+            out = (value != 0) & ~np.isnan(value.astype(np.float64))
+    return np.broadcast_to(out, (n,)) if out.ndim == 0 else out
+
+
+def _nulls(value) -> np.ndarray:
+    value = np.asarray(value)
+    if value.dtype == object:
+        return np.array([v is None for v in value.ravel().tolist()], dtype=bool).reshape(value.shape)
+    if value.dtype.kind in 'fmM':
+        return np.isnan(value)
+    return np.zeros(value.shape, dtype=bool)
+
+
+COMPARE = {'=': operator.eq, '<>': operator.ne, '<': operator.lt, '<=': operator.le,
+           '>': operator.gt, '>=': operator.ge}
+
+
+def _compare(op: str, left, right) -> np.ndarray:
+    if left is None or right is None:
+        return np.array(False)
+    if _is_datetime(left) and not _is_datetime(right):
+        right = _to_datetime(right)
+    elif _is_datetime(right) and not _is_datetime(left):
+        left = _to_datetime(left)
+    if _is_object(left) or _is_object(right):
+        a, b = np.broadcast_arrays(np.asarray(left, dtype=object), np.asarray(right, dtype=object))
+        compare = COMPARE[op]
+        out = np.empty(a.shape, dtype=bool)
+        for i, (x, y) in enumerate(zip(a.ravel().tolist(), b.ravel().tolist())):
+            try:
+                out.flat[i] = x is not None and y is not None and bool(compare(x, y))
+            except TypeError:
+                out.flat[i] = False
+        return out
+    with np.errstate(invalid='ignore'):
+        out = COMPARE[op](np.asarray(left), np.asarray(right))
+    if op == '<>':
+        out = out & ~_nulls(left) & ~_nulls(right)
+    return out
+
+
+def _arithmetic(op: str, left, right):
+    if left is None or right is None:
+        return np.nan
+    if op == '&':
+        a, b = np.broadcast_arrays(np.asarray(left, dtype=object), np.asarray(right, dtype=object))
+        return np.array(['' if x is None else _text(x) for x in a.ravel().tolist()], dtype=object).reshape(a.shape) + \
+            np.array(['' if y is None else _text(y) for y in b.ravel().tolist()], dtype=object).reshape(b.shape)
+    if _is_object(left) or _is_object(right):
+        if op == '+':
+            return _arithmetic('&', left, right)
+        raise QueryError(f"Operator {op} needs numbers")
+    if _is_datetime(left) and not _is_datetime(right) and op in '+-':
+        days = np.asarray(right, dtype=np.float64) * 86400000
+        return left + days.astype('timedelta64[ms]') if op == '+' else left - days.astype('timedelta64[ms]')
+    if _is_datetime(left) and _is_datetime(right) and op == '-':
+        return (left - right).astype('timedelta64[ms]').astype(np.float64) / 86400000
+    a = np.asarray(left, dtype=np.float64)
+    b = np.asarray(right, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if op == '+':
+            return a + b
+        if op == '-':
+            return a - b
+        if op == '*':
+            return a * b
+        if op == '/':
+            return np.where(b == 0, np.nan, a / np.where(b == 0, 1, b))
+        if op == '%':
+            return np.fmod(a, b)
+        if op == '^':
+            return np.power(a, b)
+    raise QueryError(f"Unsupported operator {op}")
+
+
+def _text(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def floor_dates(values: np.ndarray, grain: str) -> np.ndarray:
+    """Start of the calendar bucket of each date, as datetime64[D]"""
+    if grain == 'day':
+        return values.astype('datetime64[D]')
+    if grain == 'week':
+        days = values.astype('datetime64[D]')
+        # ISO weeks start on Monday; 1970-01-01 was a Thursday
+        return days - ((days.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
+    if grain == 'month':
+        return values.astype('datetime64[M]').astype('datetime64[D]')
+    if grain == 'quarter':
+        months = values.astype('datetime64[M]')
+        offset = months.astype(np.int64) % 3
+        return (months - offset.astype('timedelta64[M]')).astype('datetime64[D]')
+    if grain == 'year':
+        return values.astype('datetime64[Y]').astype('datetime64[D]')
+    raise QueryError(f"Unknown date unit: {grain}")
+
+
+def shift_dates(days: np.ndarray, amount: int, unit: str) -> np.ndarray:
+    """Calendar shift of datetime64[D] values; month ends are clamped (Mar 31 - 1 month = Feb 28/29)"""
+    if unit in ('day', 'week'):
+        return days + np.timedelta64(amount * (7 if unit == 'week' else 1), 'D')
+    months = {'month': 1, 'quarter': 3, 'year': 12}[unit] * amount
+    start = days.astype('datetime64[M]')
+    day = (days - start.astype('datetime64[D]')).astype(np.int64)
+    target = start + np.timedelta64(months, 'M')
+    length = ((target + np.timedelta64(1, 'M')).astype('datetime64[D]') - target.astype('datetime64[D]')).astype(np.int64)
+    return target.astype('datetime64[D]') + np.minimum(day, length - 1).astype('timedelta64[D]')
+
+
+def _date_part(part: str, values) -> np.ndarray:
+    values = _to_datetime(values)
+    if not _is_datetime(values):
+        raise QueryError(f"{part} needs a date")
+    values = np.asarray(values)
+    missing = np.isnat(values)
+    if part == 'YEAR':
+        out = values.astype('datetime64[Y]').astype(np.int64) + 1970
+    elif part == 'MONTH':
+        out = values.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    elif part == 'QUARTER':
+        out = (values.astype('datetime64[M]').astype(np.int64) % 12) // 3 + 1
+    elif part == 'DAY':
+        out = (values.astype('datetime64[D]') - values.astype('datetime64[M]').astype('datetime64[D]')).astype(np.int64) + 1
+    elif part in ('WEEKDAY', 'DAYOFWEEK', 'DOW'):
+        out = (values.astype('datetime64[D]').astype(np.int64) + 4) % 7 + 1
+    else:
+        raise QueryError(f"Unsupported date part: {part}")
+    out = out.astype(np.float64)
+    out[missing] = np.nan
+    return out
+
+
+class _Evaluator:
+    """Vectorized expression evaluation; subclasses resolve columns, aggregates and windows"""
+
+    n = 0
+
+    def lookup(self, node):
+        raise NotImplementedError
+
+    def match(self, node):
+        return None
+
+    def eval(self, node):
+        found = self.match(node)
+        if found is not None:
+            return found
+        kind = node[0]
+        if kind == 'lit':
+            return node[1]
+        if kind in ('col', 'ref', 'agg', 'window', 'star'):
+            return self.lookup(node)
+        if kind == 'bin':
+            op = node[1]
+            if op in ('and', 'or'):
+                left = _truthy(self.eval(node[2]), self.n)
+                right = _truthy(self.eval(node[3]), self.n)
+                return left & right if op == 'and' else left | right
+            left, right = self.eval(node[2]), self.eval(node[3])
+            if op in COMPARE:
+                return _compare(op, left, right)
+            return _arithmetic(op, left, right)
+        if kind == 'neg':
+            return _arithmetic('-', 0.0, self.eval(node[1]))
+        if kind == 'not':
+            return ~_truthy(self.eval(node[1]), self.n)
+        if kind == 'in':
+            value = self.eval(node[1])
+            out = np.zeros(self.n, dtype=bool)
+            for item in node[2]:
+                out |= np.broadcast_to(_compare('=', value, self.eval(item)), (self.n,))
+            return ~out & ~np.broadcast_to(_nulls(value), (self.n,)) if node[3] else out
+        if kind == 'between':
+            value = self.eval(node[1])
+            out = _compare('>=', value, self.eval(node[2])) & _compare('<=', value, self.eval(node[3]))
+            return ~out & ~_nulls(value) if node[4] else out
+        if kind == 'like':
+            return self.like(node)
+        if kind == 'isnull':
+            out = np.broadcast_to(_nulls(self.eval(node[1])), (self.n,))
+            return ~out if node[2] else out
+        if kind == 'case':
+            return self.case(node)
+        if kind == 'func':
+            return self.func(node[1], node[2])
+        if kind == 'set':
+            raise QueryError("A {...} list is only valid after IN")
+        raise QueryError(f"Unsupported expression: {_describe(node)}")
+
+    def like(self, node):
+        value = self.eval(node[1])
+        pattern = self.eval(node[2])
+        if not isinstance(pattern, str):
+            raise QueryError("LIKE needs a string pattern")
+        regex = re.compile('^' + ''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c)
+                                         for c in pattern) + '$', re.S | re.I)
+        values = np.broadcast_to(np.asarray(value, dtype=object), (self.n,))
+        out = np.array([v is not None and regex.match(_text(v)) is not None for v in values.tolist()], dtype=bool)
+        return ~out & ~_nulls(values) if node[3] else out
+
+    def case(self, node):
+        result = _full(self.eval(node[2]), self.n).copy()
+        decided = np.zeros(self.n, dtype=bool)
+        for condition, value in node[1]:
+            hit = _truthy(self.eval(condition), self.n) & ~decided
+            value = _full(self.eval(value), self.n)
+            if value.dtype != result.dtype and not (value.dtype.kind == 'f' and result.dtype.kind == 'f'):
+                result = result.astype(object)
+            result[hit] = value[hit]
+            decided |= hit
+        if result.dtype == object and all(v is None or isinstance(v, (int, float)) for v in result.tolist()):
+            result = np.array([np.nan if v is None else v for v in result.tolist()], dtype=np.float64)
+        return result
+
+    def func(self, name: str, args: List[tuple]):
+        values = [self.eval(arg) for arg in args]
+        if name in DATE_PARTS or name in ('WEEKDAY', 'DAYOFWEEK', 'DOW'):
+            return _date_part(name, values[0])
+        if name in ('DATEPART', 'DATE_PART'):
+            return _date_part(str(values[0]).upper().rstrip('S'), values[1])
+        if name in ('DATE_TRUNC', 'DATETRUNC', 'TRUNC'):
+            unit, value = (values[0], values[1]) if isinstance(values[0], str) else (values[1], values[0])
+            grain = UNIT_ALIASES.get(str(unit).lower())
+            if grain is None:
+                raise QueryError(f"Unknown date unit: {unit}")
+            return floor_dates(np.asarray(_to_datetime(value)), grain).astype('datetime64[ms]')
+        if name in ('DATEADD', 'DATE_ADD'):
+            unit = UNIT_ALIASES.get(str(values[0]).lower())
+            if unit is None:
+                raise QueryError(f"Unknown date unit: {values[0]}")
+            dates = np.asarray(_to_datetime(values[2]))
+            if not _is_datetime(dates):
+                raise QueryError("DATEADD needs a date")
+            day = dates.astype('datetime64[D]')
+            return (shift_dates(day, int(_scalar(values[1])), unit).astype('datetime64[ms]') + (dates - day))
+        if name in ('TODAY', 'GETDATE', 'NOW', 'CURRENT_DATE', 'SYSDATE'):
+            return np.datetime64('today', 'D').astype('datetime64[ms]')
+        if name == 'MAKEDATE':
+            parts = [int(_scalar(v)) for v in values]
+            return np.datetime64(f'{parts[0]:04d}-{parts[1]:02d}-{parts[2]:02d}', 'ms')
+        if name == 'CAST':
+            return self.cast(values[0], values[1])
+        if name == 'DIVIDE':
+            quotient = _arithmetic('/', values[0], values[1])
+            if len(values) > 2 and values[2] is not None:
+                quotient = np.where(np.isnan(quotient), float(values[2]), quotient)
+            return quotient
+        if name in ('COALESCE', 'IFNULL', 'ISNULL', 'NVL') and len(values) >= 2:
+            result = values[0]
+            for value in values[1:]:
+                missing = np.broadcast_to(_nulls(result), (self.n,))
+                result = np.where(missing, value, result)
+            return result
+        if name == 'NULLIF':
+            return np.where(_compare('=', values[0], values[1]), np.nan, values[0])
+        if name in ('IF', 'IIF'):
+            condition = _truthy(values[0], self.n)
+            otherwise = values[2] if len(values) > 2 else np.nan
+            return np.where(condition, np.nan if values[1] is None else values[1],
+                            np.nan if otherwise is None else otherwise)
+        if name == 'ISBLANK':
+            return np.broadcast_to(_nulls(values[0]), (self.n,))
+        if name == 'ABS':
+            return np.abs(np.asarray(values[0], dtype=np.float64))
+        if name == 'ROUND':
+            return np.round(np.asarray(values[0], dtype=np.float64), int(_scalar(values[1])) if len(values) > 1 else 0)
+        if name in ('UPPER', 'LOWER'):
+            convert = str.upper if name == 'UPPER' else str.lower
+            source = np.broadcast_to(np.asarray(values[0], dtype=object), (self.n,))
+            return np.array([None if v is None else convert(_text(v)) for v in source.tolist()], dtype=object)
+        raise QueryError(f"Unsupported function: {name}")
+
+    def cast(self, value, target: str):
+        if target in ('DATE', 'DATETIME', 'TIMESTAMP', 'DATETIME2'):
+            dates = _to_datetime(value)
+            return floor_dates(np.asarray(dates), 'day').astype('datetime64[ms]') if target == 'DATE' else dates
+        if target in ('VARCHAR', 'NVARCHAR', 'CHAR', 'TEXT', 'STRING'):
+            source = np.broadcast_to(np.asarray(value, dtype=object), (self.n,))
+            return np.array([None if v is None else _text(v) for v in source.tolist()], dtype=object)
+        try:
+            number = np.asarray(value, dtype=np.float64) if not _is_object(value) else np.array(
+                [np.nan if v is None else float(v) for v in np.broadcast_to(np.asarray(value, dtype=object),
+                                                                             (self.n,)).tolist()])
+        except ValueError:
+            raise QueryError(f"Cannot cast to {target}")
+        return np.trunc(number) if target in ('INT', 'INTEGER', 'BIGINT', 'SMALLINT') else number
+
+
+def _full(value, n: int) -> np.ndarray:
+    """Broadcast a value to n rows; strings and None become object arrays"""
+    if value is None or isinstance(value, str):
+        value = np.asarray(value, dtype=object)
+    value = np.asarray(value)
+    if value.dtype.kind == 'U':
+        value = value.astype(object)
+    elif value.dtype.kind in 'iu':
+        value = value.astype(np.float64)
+    return np.broadcast_to(value, (n,))
+
+
+def _scalar(value):
+    value = np.asarray(value)
+    if value.ndim:
+        raise QueryError("Expected a constant")
+    return value.item()
+
+
+class _RowEvaluator(_Evaluator):
+    """Expressions over dataset rows (optionally a subset of them)"""
+
+    def __init__(self, frame: ColumnarFrame, index: Optional[np.ndarray] = None):
+        self.frame = frame
+        self.index = index
+        self.n = len(frame) if index is None else len(index)
+        self.names = {name.lower(): name for name in frame.columns}
+        self.aliases: Dict[str, Any] = {}
+        self._cache: Dict[str, np.ndarray] = {}
+
+    def column(self, name: str) -> np.ndarray:
+        actual = name if name in self.frame.columns else self.names.get(name.lower())
+        if actual is None:
+            raise QueryError(f"Unknown column: {name}. Available: {', '.join(self.frame.columns)}")
+        if actual not in self._cache:
+            col = self.frame.column(actual)
+            values, mask = col.values, col.mask
+            if self.index is not None:
+                values, mask = values[self.index], mask[self.index]
+            # Numeric nulls are already NaN and datetime nulls NaT; booleans become 0/1 with NaN for nulls
+            if col.kind == BOOLEAN:
+                values = np.where(mask, np.nan, values.astype(np.float64))
+            self._cache[actual] = values
+        return self._cache[actual]
+
+    def lookup(self, node):
+        kind = node[0]
+        if kind in ('col', 'ref'):
+            if node[1].lower() in self.aliases:
+                return self.aliases[node[1].lower()]
+            return self.column(node[1])
+        if kind == 'window':
+            return _window(self, node)
+        if kind == 'star':
+            return np.ones(self.n)
+        raise QueryError("Aggregates are not allowed in row filters or ungrouped selects")
+
+
+class _GroupEvaluator(_Evaluator):
+    """Expressions over the grouped result: group keys, aggregates and select aliases"""
+
+    def __init__(self, n: int, keys: Dict[str, np.ndarray], aggregates: Dict[str, np.ndarray]):
+        self.n = n
+        self.keys = keys
+        self.aggregates = aggregates
+        self.aliases: Dict[str, Any] = {}
+
+    def match(self, node):
+        if node[0] in ('lit', 'agg'):
+            return None
+        return self.keys.get(repr(node))
+
+    def lookup(self, node):
+        kind = node[0]
+        if kind == 'agg':
+            return self.aggregates[repr(node)]
+        if kind == 'window':
+            return _window(self, node)
+        if kind in ('col', 'ref'):
+            name = node[1].lower()
+            if name in self.aliases:
+                return self.aliases[name]
+            for key, values in self.keys.items():
+                if key.lower() == repr(('col', node[1])).lower():
+                    return values
+            raise QueryError(f"Column {node[1]} must be grouped or aggregated")
+        raise QueryError(f"Unsupported expression: {_describe(node)}")
+
+
+# -------------------------
+# Grouping and aggregation
+# -------------------------
+
+def factorize(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Dense codes for the distinct values (hash table for strings, sort for numbers and dates)"""
+    if values.dtype == object:
+        table: Dict[Any, int] = {}
+        codes = np.fromiter((table.setdefault(v, len(table)) for v in values.tolist()), dtype=np.int64,
+                            count=len(values))
+        uniques = np.empty(len(table), dtype=object)
+        uniques[:] = list(table)
+        return codes, uniques
+    uniques, codes = np.unique(values, return_inverse=True)
+    return codes.astype(np.int64).reshape(-1), uniques
+
+
+def combine_codes(code_arrays: List[np.ndarray], n: int) -> Tuple[np.ndarray, int]:
+    """One group id per row for several key columns, renumbered densely after each column"""
+    if not code_arrays:
+        return np.zeros(n, dtype=np.int64), 1
+    group = code_arrays[0]
+    for codes in code_arrays[1:]:
+        width = int(codes.max()) + 1 if len(codes) else 1
+        # Renumbering keeps the combined id below rows * width, so it never overflows
+        group = factorize(group * width + codes)[0]
+    size = int(group.max()) + 1 if len(group) else 0
+    return group, size
+
+
+def _aggregate(func: str, distinct: bool, values: Optional[np.ndarray], groups: np.ndarray, size: int,
+               keep: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(values, row counts) per group for one aggregate over the kept rows"""
+    if values is not None:
+        keep = keep & ~_nulls(values)
+    g = groups[keep]
+    counts = np.bincount(g, minlength=size).astype(np.float64)
+    if func == 'COUNT' and not distinct:
+        return counts, counts
+    if values is None:
+        raise QueryError(f"{func}(*) is not supported")
+    v = values[keep]
+    if distinct:
+        codes, _ = factorize(v)
+        pairs = np.unique(g * (int(codes.max()) + 1 if len(codes) else 1) + codes)
+        width = int(codes.max()) + 1 if len(codes) else 1
+        return np.bincount(pairs // width, minlength=size).astype(np.float64), counts
+    if v.dtype == object:
+        raise QueryError(f"{func} needs a numeric or date column")
+    is_date = _is_datetime(v)
+    numbers = v.astype('datetime64[ms]').astype(np.int64).astype(np.float64) if is_date else v.astype(np.float64)
+    present = counts > 0
+    if func in ('SUM', 'AVG'):
+        if is_date:
+            raise QueryError(f"{func} needs a numeric column")
+        sums = np.bincount(g, weights=numbers, minlength=size)
+        out = sums if func == 'SUM' else sums / np.where(present, counts, 1)
+        return np.where(present, out, np.nan), counts
+    # MIN / MAX: sort rows by (group, value) and read the first / last row of each group
+    order = np.lexsort((numbers, g))
+    g_sorted = g[order]
+    boundaries = np.flatnonzero(np.diff(g_sorted)) + 1
+    if func == 'MIN':
+        picks = np.r_[0, boundaries] if len(g_sorted) else np.zeros(0, dtype=np.int64)
+    else:
+        picks = np.r_[boundaries - 1, len(g_sorted) - 1] if len(g_sorted) else np.zeros(0, dtype=np.int64)
+    out = np.full(size, np.nan)
+    out[g_sorted[picks]] = numbers[order][picks]
+    if is_date:
+        dates = np.full(size, np.datetime64('NaT'), dtype='datetime64[ms]')
+        dates[present] = out[present].astype(np.int64).astype('datetime64[ms]')
+        return dates, counts
+    return out, counts
+
+
+def _segments(sort_keys: List[np.ndarray], segment_keys: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Row order sorted by segment, then by sort_keys (last key first), and the segment id of each position"""
+    order = np.lexsort(list(sort_keys) + list(segment_keys))
+    change = np.zeros(len(order), dtype=bool)
+    if len(order):
+        change[0] = True
+        for key in segment_keys:
+            key = key[order]
+            change[1:] |= key[1:] != key[:-1]
+    return order, np.cumsum(change) - 1
+
+
+def _segmented_cumsum(values: np.ndarray, segment: np.ndarray) -> np.ndarray:
+    totals = np.cumsum(values)
+    if not len(values):
+        return totals
+    starts = np.r_[0, np.flatnonzero(np.diff(segment)) + 1]
+    before = totals[starts] - values[starts]
+    return totals - before[segment]
+
+
+class _TimeAxis:
+    """Calendar bucket of every group for one date column, and the partition of the other keys"""
+
+    def __init__(self, column: str, grain: str, buckets: np.ndarray, partition: np.ndarray):
+        self.column = column
+        self.grain = grain
+        self.buckets = buckets.astype('datetime64[D]')
+        self.partition = partition
+
+    def shift(self, values: np.ndarray, amount: int, unit: str) -> np.ndarray:
+        if GRAINS.index(unit) < GRAINS.index(self.grain) and unit != 'week':
+            raise QueryError(f"Cannot shift by {unit} on a {self.grain} axis")
+        # The value of the period `amount` units earlier/later (e.g. -1 month) for the same other keys
+        source = shift_dates(self.buckets, amount, unit)
+        keys = self.partition * 10 ** 7 + (self.buckets.astype(np.int64) + 5 * 10 ** 6)
+        wanted = self.partition * 10 ** 7 + (source.astype(np.int64) + 5 * 10 ** 6)
+        order = np.argsort(keys)
+        position = np.searchsorted(keys[order], wanted)
+        position = np.minimum(position, len(keys) - 1)
+        found = keys[order][position] == wanted
+        out = np.full(len(values), np.nan) if not _is_datetime(values) else \
+            np.full(len(values), np.datetime64('NaT'), dtype=values.dtype)
+        out[found] = values[order][position[found]]
+        return out
+
+    def to_date(self, sums: np.ndarray, counts: np.ndarray, func: str, period: str) -> np.ndarray:
+        if GRAINS.index(period) < GRAINS.index(self.grain):
+            raise QueryError(f"Cannot total {period}-to-date on a {self.grain} axis")
+        periods = floor_dates(self.buckets, period).astype(np.int64)
+        order, segment = _segments([self.buckets.astype(np.int64)], [periods, self.partition])
+        if func in ('SUM', 'COUNT', 'AVG'):
+            running_sums = _segmented_cumsum(np.nan_to_num(sums[order] * (counts[order] if func == 'AVG' else 1)),
+                                             segment)
+            running_counts = _segmented_cumsum(counts[order], segment)
+            if func == 'AVG':
+                ordered = running_sums / np.where(running_counts > 0, running_counts, np.nan)
+            else:
+                ordered = np.where(running_counts > 0, running_sums, np.nan)
+        else:
+            ordered = sums[order].astype(np.float64)
+            accumulate = np.fmin.accumulate if func == 'MIN' else np.fmax.accumulate
+            starts = np.r_[0, np.flatnonzero(np.diff(segment)) + 1, len(order)]
+            for start, end in zip(starts[:-1], starts[1:]):
+                ordered[start:end] = accumulate(ordered[start:end])
+        out = np.empty(len(order))
+        out[order] = ordered
+        return out
+
+
+def _time_key_grain(node, column: str) -> Optional[str]:
+    """Grain of a group key that is a calendar function of `column`, else None"""
+    if node == ('col', column):
+        return 'day'
+    if node[0] == 'func' and node[2] and node[2][-1] == ('col', column):
+        if node[1] in ('DATE_TRUNC', 'DATETRUNC', 'TRUNC') and node[2][0][0] == 'lit':
+            return UNIT_ALIASES.get(str(node[2][0][1]).lower())
+        if node[1] in DATE_PARTS:
+            return node[1].lower()
+    return None
+
+
+def _window(ctx: _Evaluator, node) -> np.ndarray:
+    """Window function over the rows of ctx (grouped result or dataset rows)"""
+    _, name, args, partition, order = node
+    n = ctx.n
+    part_codes = combine_codes([factorize(_full(ctx.eval(p), n).copy())[0]
+                                for p in partition], n)[0]
+    sort_keys = []
+    for expr, desc in reversed(order):
+        sort_keys.append(_sort_rank(_full(ctx.eval(expr), n).copy(), desc))
+    order_idx, segment = _segments(sort_keys or [np.arange(n)], [part_codes])
+    starts = np.r_[0, np.flatnonzero(np.diff(segment)) + 1] if n else np.zeros(0, dtype=np.int64)
+    position = np.arange(n) - starts[segment] if n else np.zeros(0, dtype=np.int64)
+    out = np.empty(n, dtype=object if name in ('LAG', 'LEAD') else np.float64)
+
+    if name == 'ROW_NUMBER':
+        ordered = position + 1.0
+    elif name in ('RANK', 'DENSE_RANK'):
+        tie_keys = [key[order_idx] for key in sort_keys]
+        new_value = np.ones(n, dtype=bool)
+        if n:
+            new_value[1:] = segment[1:] != segment[:-1]
+            for key in tie_keys:
+                new_value[1:] |= key[1:] != key[:-1]
+        if name == 'DENSE_RANK':
+            ordered = _segmented_cumsum(new_value.astype(np.float64), segment)
+        else:
+            last_new = np.maximum.accumulate(np.where(new_value, np.arange(n), 0)) if n else np.zeros(0)
+            ordered = last_new - starts[segment] + 1.0
+    elif name in ('LAG', 'LEAD'):
+        values = _full(ctx.eval(args[0]), n)[order_idx]
+        offset = int(_scalar(ctx.eval(args[1]))) if len(args) > 1 else 1
+        default = ctx.eval(args[2]) if len(args) > 2 else None
+        source = np.arange(n) - offset if name == 'LAG' else np.arange(n) + offset
+        valid = (source >= 0) & (source < n)
+        valid[valid] &= segment[source[valid]] == segment[valid]
+        ordered = np.empty(n, dtype=values.dtype if values.dtype != object else object)
+        if values.dtype.kind == 'f':
+            ordered[:] = np.nan if default is None else default
+        elif _is_datetime(values):
+            ordered[:] = np.datetime64('NaT')
+        else:
+            ordered = ordered.astype(object)
+            ordered[:] = default
+        ordered[valid] = values[source[valid]]
+        out = np.empty(n, dtype=ordered.dtype)
+    elif name in AGGREGATES:
+        values = np.ones(n) if args and args[0][0] == 'star' else \
+            np.asarray(_full(ctx.eval(args[0]), n), dtype=np.float64)[order_idx]
+        present = ~np.isnan(values)
+        if order:
+            sums = _segmented_cumsum(np.where(present, values, 0), segment)
+            counts = _segmented_cumsum(present.astype(np.float64), segment)
+            if name in ('MIN', 'MAX'):
+                ordered = values.copy()
+                accumulate = np.fmin.accumulate if name == 'MIN' else np.fmax.accumulate
+                bounds = np.r_[starts, n]
+                for start, end in zip(bounds[:-1], bounds[1:]):
+                    ordered[start:end] = accumulate(ordered[start:end])
+            else:
+                ordered = {'SUM': sums, 'COUNT': counts, 'AVG': sums / np.where(counts > 0, counts, np.nan)}[name]
+        else:
+            seg_sums = np.bincount(segment, weights=np.where(present, values, 0))
+            seg_counts = np.bincount(segment, weights=present.astype(np.float64))
+            if name in ('MIN', 'MAX'):
+                reduce = np.fmin if name == 'MIN' else np.fmax
+                seg_values = reduce.reduceat(values, starts) if n else np.zeros(0)
+            else:
+                seg_values = {'SUM': seg_sums, 'COUNT': seg_counts,
+                              'AVG': seg_sums / np.where(seg_counts > 0, seg_counts, np.nan)}[name]
+            ordered = seg_values[segment]
+    else:
+        raise QueryError(f"Unsupported window function: {name}")
+    out[order_idx] = ordered
+    return out
+
+
+def _sort_rank(values: np.ndarray, desc: bool = False) -> np.ndarray:
+    """Integer sort keys (negated for descending order) with nulls last"""
+    missing = _nulls(values)
+    ranks = np.full(len(values), len(values), dtype=np.int64)
+    present = values[~missing]
+    if len(present):
+        if present.dtype == object:
+            try:
+                uniques = sorted(set(present.tolist()))
+            except TypeError:
+                uniques = sorted(set(present.tolist()), key=str)
+            lookup = {value: i for i, value in enumerate(uniques)}
+            ranks[~missing] = np.fromiter((lookup[v] for v in present.tolist()), dtype=np.int64, count=len(present))
+        else:
+            ranks[~missing] = np.unique(present, return_inverse=True)[1].reshape(-1)
+    if desc:
+        ranks[~missing] = -ranks[~missing]
+    return ranks
+
+
+# -------------------------
+# Execution
+# -------------------------
+
+def _json_values(values, n: int) -> List[Any]:
+    values = _full(values, n)
+    if _is_datetime(values):
+        days = values.astype('datetime64[D]')
+        unit = 'D' if (values[~np.isnat(values)] == days[~np.isnat(values)]).all() else 's'
+        text = np.datetime_as_string(values, unit=unit).tolist()
+        return [None if t == 'NaT' else t for t in text]
+    if values.dtype.kind == 'b':
+        return values.tolist()
+    if values.dtype.kind in 'iuf':
+        floats = values.astype(np.float64)
+        finite = ~np.isnan(floats)
+        integral = bool(finite.any()) and bool((floats[finite] == np.round(floats[finite])).all()) and \
+            bool((np.abs(floats[finite]) < 2 ** 53).all())
+        return [None if not ok else (int(v) if integral else v) for v, ok in zip(floats.tolist(), finite.tolist())]
+    return [None if isinstance(v, float) and v != v else v for v in values.tolist()]
+
+
+def execute_plan(frame: ColumnarFrame, plan: Dict[str, Any], limit: int = DEFAULT_PREVIEW_ROWS) -> Dict[str, Any]:
+    timings = {}
+    clock = time.perf_counter()
+
+    def lap(stage: str):
+        nonlocal clock
+        now = time.perf_counter()
+        timings[stage] = round((now - clock) * 1000, 3)
+        clock = now
+
+    rows = _RowEvaluator(frame)
+    index = None
+    if plan['where'] is not None:
+        index = np.flatnonzero(_truthy(rows.eval(plan['where']), rows.n))
+        rows = _RowEvaluator(frame, index)
+    lap('filter_ms')
+
+    expressions = [expr for expr, _ in plan['select']] + [expr for expr, _ in plan['order_by']]
+    if plan['having'] is not None:
+        expressions.append(plan['having'])
+    aggregated = bool(plan['group_by']) or plan['distinct'] or any(
+        node[0] == 'agg' for expr in expressions for node in _walk(expr))
+
+    select = list(plan['select'])
+    if plan['star']:
+        if aggregated:
+            raise QueryError("SELECT * cannot be combined with GROUP BY or aggregates")
+        select = [(('col', name), name) for name in frame.columns]
+
+    if aggregated:
+        ctx, select = _grouped(rows, plan, select, timings, lap)
+    else:
+        ctx = rows
+        lap('group_ms')
+
+    columns = []
+    outputs = []
+    for expr, alias in select:
+        value = ctx.eval(expr)
+        ctx.aliases[alias.lower()] = value
+        columns.append(alias)
+        outputs.append(value)
+    keep = np.arange(ctx.n)
+    if plan['having'] is not None:
+        keep = np.flatnonzero(_truthy(ctx.eval(plan['having']), ctx.n))
+    lap('window_ms')
+
+    if plan['order_by']:
+        keys = []
+        for expr, desc in reversed(plan['order_by']):
+            keys.append(_sort_rank(_full(ctx.eval(expr), ctx.n).copy()[keep], desc))
+        keep = keep[np.lexsort(keys)]
+    total = len(keep)
+    start = plan['offset'] or 0
+    end = total if plan['limit'] is None else min(total, start + plan['limit'])
+    keep = keep[start:end]
+    shown = keep[:limit]
+    lap('sort_ms')
+
+    data = [_json_values(_full(value, ctx.n)[shown], len(shown)) for value in outputs]
+    result_rows = [list(row) for row in zip(*data)] if data else [[] for _ in shown]
+    lap('serialize_ms')
+    timings['total_ms'] = round(sum(timings.values()), 3)
+    return {
+        'columns': columns,
+        'rows': result_rows,
+        'row_count': len(keep),
+        'truncated': len(keep) > len(shown),
+        'scanned_rows': len(frame),
+        'matched_rows': len(frame) if index is None else len(index),
+        'timings': timings,
+        'notes': plan.get('notes', [])
+    }
+
+
+def _grouped(rows: _RowEvaluator, plan: Dict[str, Any], select: list, timings: dict, lap):
+    group_by = list(plan['group_by'])
+    if plan['distinct'] and not group_by:
+        group_by = [expr for expr, _ in select]
+    expressions = [expr for expr, _ in select] + [expr for expr, _ in plan['order_by']]
+    if plan['having'] is not None:
+        expressions.append(plan['having'])
+    aggregates = {}
+    for expr in expressions:
+        for node in _walk(expr):
+            if node[0] == 'agg':
+                aggregates[repr(node)] = node
+
+    # Time intelligence needs a calendar axis; add a month bucket when the grouping has none
+    for node in aggregates.values():
+        for op in node[5]:
+            column = rows.names.get(op[1].lower(), op[1])
+            if not any(_time_key_grain(key, column) for key in group_by):
+                key = ('func', 'DATE_TRUNC', [('lit', 'month'), ('col', column)])
+                group_by.append(key)
+                select.insert(0, (key, f'{column} (month)'))
+
+    key_values = [_full(rows.eval(key), rows.n) for key in group_by]
+    codes = [factorize(np.ascontiguousarray(values))[0] for values in key_values]
+    groups, size = combine_codes(codes, rows.n)
+    if not group_by:
+        size = 1
+    order = np.argsort(groups, kind='stable')
+    first = order[np.r_[0, np.flatnonzero(np.diff(groups[order])) + 1]] if rows.n else np.zeros(0, dtype=np.int64)
+    keys = {repr(key): values[first] for key, values in zip(group_by, key_values)}
+    lap('group_ms')
+
+    axes: Dict[str, _TimeAxis] = {}
+    results = {}
+    everything = np.ones(rows.n, dtype=bool)
+    for key, node in aggregates.items():
+        _, func, arg, distinct, condition, time_ops = node
+        keep = everything if condition is None else _truthy(rows.eval(condition), rows.n)
+        values = None if arg[0] == 'star' else _full(rows.eval(arg), rows.n)
+        out, counts = _aggregate(func, distinct, values, groups, size, keep)
+        for op in reversed(time_ops):
+            if distinct:
+                raise QueryError("Time intelligence over DISTINCTCOUNT is not supported")
+            axis = axes.get(op[1].lower()) or _time_axis(rows, op[1], group_by, key_values, codes, first)
+            axes[op[1].lower()] = axis
+            if op[0] == 'todate':
+                out = axis.to_date(out, counts, func, op[2])
+                counts = np.where(np.isnan(out), 0.0, 1.0)
+            else:
+                out = axis.shift(out, op[2], op[3])
+                counts = np.where(np.isnan(out), 0.0, 1.0) if out.dtype.kind == 'f' else counts
+        results[key] = out
+    lap('aggregate_ms')
+    return _GroupEvaluator(size, keys, results), select
+
+
+def _time_axis(rows: _RowEvaluator, column: str, group_by: list, key_values: list, codes: list,
+               first: np.ndarray) -> _TimeAxis:
+    column = rows.names.get(column.lower(), column)
+    grains = [(_time_key_grain(key, column), i) for i, key in enumerate(group_by)]
+    time_keys = [(grain, i) for grain, i in grains if grain]
+    found = {grain for grain, _ in time_keys}
+    if 'day' in found:
+        grain = 'day'
+    elif found & {'week', 'month'}:
+        grain = 'week' if 'week' in found else 'month'
+    elif 'quarter' in found:
+        grain = 'quarter'
+    else:
+        grain = 'year'
+    dates = rows.column(column)
+    if not _is_datetime(dates):
+        raise QueryError(f"Time intelligence needs a date column; {column} is not one")
+    buckets = floor_dates(dates, grain)[first]
+    others = [codes[i][first] for i in range(len(group_by)) if i not in {j for _, j in time_keys}]
+    partition = combine_codes(others, len(first))[0] if others else np.zeros(len(first), dtype=np.int64)
+    return _TimeAxis(column, grain, buckets, partition)
+
+
+def execute_query(frame: ColumnarFrame, query: str, language: Optional[str] = None,
+                  limit: int = DEFAULT_PREVIEW_ROWS) -> Dict[str, Any]:
+    """Parse and run a SQL or DAX query against the frame; returns a preview with stage timings"""
+    start = time.perf_counter()
+    language, plan = parse_query(query, language)
+    parse_ms = round((time.perf_counter() - start) * 1000, 3)
+    limit = max(1, min(int(limit), MAX_PREVIEW_ROWS))
+    result = execute_plan(frame, plan, limit)
+    result['timings'] = {'parse_ms': parse_ms, **result['timings']}
+    result['timings']['total_ms'] = round(result['timings']['total_ms'] + parse_ms, 3)
+    return {'success': True, 'language': language, **result}
+
+
+def generated_query_text(result: Any) -> Optional[str]:
+    """The query text inside a generator result (a string, or a dict with the code under a common key)"""
+    if isinstance(result, str):
+        return result
+    if isinstance(result, dict):
+        for key in ('sql', 'dax', 'query', 'code', 'formula', 'measure', 'result'):
+            value = result.get(key)
+            if isinstance(value, str) and value.strip():
+                return value
+            if isinstance(value, dict):
+                nested = generated_query_text(value)
+                if nested:
+                    return nested
+    return None
@@ -0,0 +1,127 @@
+"""
+Token-bucket rate limiting keyed by client
+
+Off unless RATE_LIMIT_ENABLED is set: with per-IP keys, every client behind one
+NAT or Power BI gateway would share a bucket. The app keys buckets on the
+X-Client-Id header or the Authorization credential and falls back to IP and
+User-Agent only for clients that send neither.
+
+Buckets live in a lock-striped map: each key hashes to one of a fixed number of
+stripes, each with its own lock and dict, so concurrent requests from
+different users rarely contend. Taking a token is O(1). Buckets that have been
+idle long enough to refill completely are evicted during periodic sweeps of a
+stripe, which keeps memory proportional to the number of active users.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Endpoint classes and their default limits (requests per minute, also the burst size)
+DEFAULT_LIMITS = {
+    'heavy': 20,
+    'standard': 60,
+    'light': 120
+}
+
+ENDPOINT_CLASSES = {
+    '/api/forecast': 'heavy',
+    '/api/detect-anomalies': 'heavy',
+    '/api/analyze-batch': 'heavy',
+    '/api/jobs': 'heavy',
+    '/api/datasets': 'standard',
+    '/api/execute-query': 'standard',
+    '/api/recommend-chart': 'standard',
+    '/api/generate-insights': 'standard',
+    '/api/generate-dax': 'light',
+    '/api/generate-sql': 'light'
+}
+
+SWEEP_INTERVAL = 60.0
+
+
+def classify_path(path: str, method: str = 'POST') -> Optional[str]:
+    """Map a request path to its endpoint class, or None if it is not limited"""
+    if path.startswith('/api/powerbi/'):
+        path = '/api/' + path[len('/api/powerbi/'):]
+    if path.startswith(('/api/jobs/', '/api/series/', '/api/datasets/')):
+        # Polling and cancelling jobs, and reading series or dataset state, is cheap
+        return 'light'
+    if path == '/api/jobs' and method != 'POST':
+        return None
+    return ENDPOINT_CLASSES.get(path.rstrip('/'))
+
+
+class _Stripe:
+    __slots__ = ('lock', 'buckets', 'last_sweep')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: Dict[Tuple[str, str], list] = {}  # key -> [tokens, updated_at]
+        self.last_sweep = time.monotonic()
+
+
+class RateLimiter:
+    """Per-user, per-endpoint-class token buckets in a lock-striped map"""
+
+    def __init__(self, limits: Dict[str, int] = None, stripes: int = 32, enabled: bool = True):
+        self.enabled = enabled
+        self.limits = dict(limits or DEFAULT_LIMITS)
+        self._stripes = [_Stripe() for _ in range(stripes)]
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def acquire(self, user_id: str, endpoint_class: str) -> Tuple[bool, float]:
+        """Take one token; returns (allowed, seconds until a token is available)"""
+        capacity = self.limits.get(endpoint_class)
+        if not self.enabled or not capacity:
+            return True, 0.0
+        rate = capacity / 60.0
+        key = (user_id, endpoint_class)
+        stripe = self._stripes[hash(key) % len(self._stripes)]
+        now = time.monotonic()
+
+        with stripe.lock:
+            bucket = stripe.buckets.get(key)
+            if bucket is None:
+                bucket = stripe.buckets[key] = [float(capacity), now]
+            else:
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if now - stripe.last_sweep > SWEEP_INTERVAL:
+                self._sweep(stripe, now)
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                self.allowed += 1
+                return True, 0.0
+            self.rejected += 1
+            return False, (1.0 - bucket[0]) / rate
+
+    def _sweep(self, stripe: _Stripe, now: float):
+        """Drop buckets idle long enough to be full again (they carry no state)"""
+        # Limits are per minute, so any bucket untouched for 60s has refilled completely
+        stale = [key for key, (_, updated_at) in stripe.buckets.items() if now - updated_at >= 60.0]
+        for key in stale:
+            del stripe.buckets[key]
+        self.evicted += len(stale)
+        stripe.last_sweep = now
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'enabled': self.enabled,
+            'limits_per_minute': self.limits,
+            'active_buckets': sum(len(stripe.buckets) for stripe in self._stripes),
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+            'evicted': self.evicted
+        }
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the limiter from RATE_LIMIT_* environment variables"""
+    limits = {name: int(os.getenv(f'RATE_LIMIT_{name.upper()}', default))
+              for name, default in DEFAULT_LIMITS.items()}
+    enabled = os.getenv('RATE_LIMIT_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    return RateLimiter(limits=limits, enabled=enabled)
@@ -0,0 +1,101 @@
+"""
+Lazy model registry
+
+The Enhanced* models (and pandas, which they import) are only needed by the
+routes that use them. The registry builds each one on first use, so booting
+the app and serving `/api/health` costs neither the imports nor the
+construction. Construction happens once per model under a per-name lock.
+Concurrent first requests wait for the same instance and do not build
+duplicates.
+
+`prewarm()` builds everything in a daemon thread. run.py calls it after the
+server socket is bound, so long-running servers still pay the cost before
+the first real request, while serverless cold starts skip it.
+"""
+
+import importlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+MODELS_MODULE = 'models.enhanced_ai_models'
+MODEL_CLASSES = {
+    'security_manager': 'SecurityManager',
+    'error_recovery': 'AutoErrorRecovery',
+    'dax_generator': 'EnhancedDAXGenerator',
+    'sql_generator': 'EnhancedSQLGenerator',
+    'chart_recommender': 'EnhancedChartRecommender',
+    'insight_generator': 'EnhancedInsightGenerator',
+    'anomaly_detector': 'EnhancedAnomalyDetector',
+    'forecasting_model': 'EnhancedForecastingModel'
+}
+
+
+def build_model(name: str) -> Any:
+    """Import the models module (first time only) and construct one model"""
+    module = importlib.import_module(MODELS_MODULE)
+    return getattr(module, MODEL_CLASSES[name])()
+
+
+class ModelRegistry:
+    """Builds model singletons on first use; `registry[name]` returns the instance"""
+
+    def __init__(self, classes: Optional[Dict[str, str]] = None):
+        self.classes = dict(classes or MODEL_CLASSES)
+        self._instances: Dict[str, Any] = {}
+        self._locks = {name: threading.Lock() for name in self.classes}
+        self.build_seconds: Dict[str, float] = {}
+        self._prewarm_thread: Optional[threading.Thread] = None
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self._locks:
+            raise KeyError(f"Unknown model: {name}")
+        with self._locks[name]:
+            instance = self._instances.get(name)
+            if instance is None:
+                start = time.perf_counter()
+                instance = build_model(name)
+                self.build_seconds[name] = round(time.perf_counter() - start, 4)
+                self._instances[name] = instance
+                logger.info(f"Built model {name} in {self.build_seconds[name]}s")
+        return instance
+
+    __getitem__ = get
+
+    def loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def prewarm(self, names: Optional[Iterable[str]] = None) -> threading.Thread:
+        """Build the given (default: all) models in a background thread"""
+        names = list(names or self.classes)
+
+        def warm():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    # The request that needs the model will raise (and recover) on its own
+                    logger.warning(f"Pre-warming {name} failed: {e}")
+
+        self._prewarm_thread = threading.Thread(target=warm, name='model-prewarm', daemon=True)
+        self._prewarm_thread.start()
+        return self._prewarm_thread
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'loaded': sorted(self._instances),
+            'pending': sorted(set(self.classes) - set(self._instances)),
+            'build_seconds': dict(self.build_seconds),
+            'prewarming': self._prewarm_thread is not None and self._prewarm_thread.is_alive()
+        }
+
+
+def prewarm_enabled() -> bool:
+    return os.getenv('MODEL_PREWARM', 'true').lower() in ('1', 'true', 'yes')
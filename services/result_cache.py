@@ -0,0 +1,129 @@
+"""
+Content-addressed result cache for the dataset analytics endpoints
+
+Results are keyed by a canonical hash of (endpoint, dataset content, parameters),
+so repeated Power BI refreshes of the same data are answered without running
+the model again. The dataset part is the exact request payload (JSON types, text
+and key order), since that is what the models receive; '01234', '1234' and 1234
+are three different datasets. Entries are evicted by LRU order, TTL and a memory budget.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from services.columnar import ingest_dataset
+
+
+def make_key(endpoint: str, dataset: Any, params: Optional[dict] = None) -> str:
+    """Build a canonical cache key for a model call (the dataset's payload fingerprint, see ColumnarFrame)"""
+    frame = ingest_dataset(dataset)
+    canonical = json.dumps(params or {}, sort_keys=True, default=str, separators=(',', ':'))
+    raw = f"{endpoint}|{frame.fingerprint()}|{canonical}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a JSON-serializable result in bytes"""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 1024
+
+
+class ResultCache:
+    """Thread-safe LRU cache with TTL expiry and a memory budget"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        """Return (found, value) for a key, dropping it if it has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def put(self, key: str, value: Any):
+        """Store a value, evicting the least recently used entries over budget"""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]):
+        """Return the cached result for key, or compute and cache it"""
+        found, value = self.get(key)
+        if found:
+            return value
+        return self.put_result(key, compute())
+
+    def put_result(self, key: str, value: Any):
+        """Cache a freshly computed result unless it reports failure; returns it"""
+        # Only successful results are worth serving again
+        if not (isinstance(value, dict) and value.get('success') is False):
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current usage for /api/system-status"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def create_result_cache() -> ResultCache:
+    """Build the cache from RESULT_CACHE_* environment variables"""
+    return ResultCache(
+        max_entries=int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 256)),
+        ttl_seconds=float(os.getenv('RESULT_CACHE_TTL', 600)),
+        max_bytes=int(float(os.getenv('RESULT_CACHE_MAX_MB', 64)) * 1024 * 1024)
+    )
@@ -0,0 +1,293 @@
+"""
+Time-bucket rollups ahead of the forecast and insight models
+
+The forecasting and insight models only need per-period totals for each
+series. This stage buckets transaction-level rows by a time column and
+aggregates them before the models run. Each bucket is an hour, day, ISO week,
+month, quarter or year, and rows are grouped by optional key columns.
+Measures are summed, averaged or counted. The output is a much smaller frame
+with the time, group and measure columns; any other column is dropped and
+listed as `dropped_columns` in the summary:
+
+- bucketing and grouping run in a single pass: group keys become dense codes
+  and every measure is one bincount over (series, period) codes
+- `auto` granularity starts at the data's own resolution. It coarsens until
+  series x periods fits within ROLLUP_MAX_POINTS.
+- `top_series` keeps the N series with the largest absolute total of the first
+  measure; the rest are dropped and counted
+- rolled frames are cached by source dataset hash and options, so repeated
+  refreshes and every model in a batch reuse one rollup
+
+The stage only runs when a request asks for it with `rollup=<granularity>` or
+`rollup=auto`; without it (or with `rollup=none`) models see the rows as sent.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from services.columnar import DATETIME, NUMERIC, Column, ColumnarFrame
+from services.query_engine import combine_codes, factorize, floor_dates
+from services.single_flight import SingleFlight
+
+MAX_POINTS = int(os.getenv('ROLLUP_MAX_POINTS', 20000))
+GRANULARITIES = ('hour', 'day', 'week', 'month', 'quarter', 'year')
+AGGREGATES = ('sum', 'mean', 'count')
+HOURS_PER = {'hour': 1, 'day': 24, 'week': 24 * 7, 'month': 24 * 30.44, 'quarter': 24 * 91.31, 'year': 24 * 365.25}
+
+
+class RollupError(ValueError):
+    """Raised for invalid rollup options or inputs that cannot be rolled up"""
+
+
+def parse_options(source: Mapping) -> Optional[Dict[str, Any]]:
+    """Rollup options from a JSON body or query string; None unless the request asks for a rollup"""
+    granularity = str(source.get('rollup') or '').strip().lower()
+    if granularity in ('', 'none', 'off', 'false', '0'):
+        return None
+    if granularity not in GRANULARITIES + ('auto',):
+        raise RollupError(f"rollup must be one of none, auto, {', '.join(GRANULARITIES)}")
+    group_by = source.get('rollup_by') or source.get('series_key') or []
+    if isinstance(group_by, str):
+        group_by = [name.strip() for name in group_by.split(',') if name.strip()]
+    measures = source.get('rollup_measures') or None
+    if isinstance(measures, str):
+        measures = [name.strip() for name in measures.split(',') if name.strip()]
+    aggregate = str(source.get('rollup_aggregate') or source.get('aggregate') or 'sum').lower()
+    if aggregate not in AGGREGATES:
+        raise RollupError(f"rollup_aggregate must be one of {', '.join(AGGREGATES)}")
+    top_series = source.get('top_series')
+    if top_series is not None and top_series != '':
+        try:
+            top_series = int(top_series)
+        except (TypeError, ValueError):
+            raise RollupError("top_series must be an integer")
+        if top_series < 1:
+            raise RollupError("top_series must be at least 1")
+    else:
+        top_series = None
+    return {
+        'granularity': granularity,
+        'time_column': source.get('time_column') or None,
+        'group_by': list(group_by),
+        'measures': measures,
+        'aggregate': aggregate,
+        'top_series': top_series
+    }
+
+
+def _floor(times: np.ndarray, granularity: str) -> np.ndarray:
+    if granularity == 'hour':
+        return times.astype('datetime64[h]').astype('datetime64[ms]')
+    return floor_dates(times, granularity).astype('datetime64[ms]')
+
+
+def _resolution(times: np.ndarray) -> str:
+    """Finest granularity worth keeping: the median spacing of the distinct timestamps"""
+    hours = np.unique(times.astype('datetime64[h]')).astype(np.int64)
+    if len(hours) < 2:
+        return 'day'
+    gap = float(np.median(np.diff(hours)))
+    for granularity in GRANULARITIES[::-1]:
+        if gap >= HOURS_PER[granularity] * 0.75:
+            return granularity
+    return 'hour'
+
+
+def choose_granularity(times: np.ndarray, series: int, max_points: int = MAX_POINTS) -> str:
+    """Coarsest needed granularity: start at the data's resolution, coarsen until series x periods fits"""
+    if not len(times):
+        return 'day'
+    span_hours = float((times.max() - times.min()).astype('timedelta64[h]').astype(np.int64)) + 1
+    start = GRANULARITIES.index(_resolution(times))
+    for granularity in GRANULARITIES[start:]:
+        if series * (span_hours / HOURS_PER[granularity] + 1) <= max_points:
+            return granularity
+    return 'year'
+
+
+def _key_codes(col: Column, keep: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Dense codes for a group column over the kept rows (nulls are their own group)"""
+    values = col.values[keep]
+    # Numeric nulls are NaN and datetime nulls NaT (the minimum int64), so each sorts into one group
+    if col.kind == DATETIME:
+        values = values.astype(np.int64)
+    return factorize(values)
+
+
+def rollup_frame(frame: ColumnarFrame, granularity: Optional[str] = 'auto', time_column: Optional[str] = None,
+                 group_by: Optional[List[str]] = None, measures: Optional[List[str]] = None,
+                 aggregate: str = 'sum', top_series: Optional[int] = None,
+                 max_points: int = MAX_POINTS) -> Tuple[ColumnarFrame, Dict[str, Any]]:
+    """Aggregate the frame to one row per (period, series); returns the rolled frame and a summary"""
+    start_time = time.perf_counter()
+    group_by = list(group_by or [])
+    if time_column is None:
+        time_column = next((name for name, col in frame.columns.items() if col.kind == DATETIME), None)
+        if time_column is None:
+            raise RollupError("Rollups need a date/time column")
+    elif time_column not in frame.columns or frame.column(time_column).kind != DATETIME:
+        raise RollupError(f"time_column must be a date/time column, got {time_column!r}")
+    unknown = [name for name in group_by + list(measures or []) if name not in frame.columns]
+    if unknown:
+        raise RollupError(f"Unknown rollup columns: {', '.join(unknown)}")
+    if measures is None:
+        measures = [name for name in frame.numeric_columns() if name not in group_by]
+    elif any(frame.column(name).kind != NUMERIC for name in measures):
+        raise RollupError("rollup_measures must be numeric columns")
+    if aggregate not in AGGREGATES:
+        raise RollupError(f"rollup_aggregate must be one of {', '.join(AGGREGATES)}")
+
+    time_col = frame.column(time_column)
+    keep = ~time_col.mask
+    times = time_col.values[keep].astype('datetime64[ms]')
+    n = len(times)
+
+    key_codes = [_key_codes(frame.column(name), keep)[0] for name in group_by]
+    series, n_series = combine_codes(key_codes, n)
+    if not group_by:
+        n_series = 1 if n else 0
+
+    # Top-N series by the absolute total of the first measure
+    pruned = 0
+    if top_series is not None and n_series > top_series and measures:
+        first = frame.column(measures[0]).values[keep]
+        totals = np.bincount(series, weights=np.abs(np.nan_to_num(first)), minlength=n_series)
+        kept_series = np.argsort(-totals, kind='stable')[:top_series]
+        selected = np.isin(series, kept_series)
+        pruned = n_series - top_series
+        rows = np.flatnonzero(keep)[selected]
+        keep = np.zeros(len(keep), dtype=bool)
+        keep[rows] = True
+        times = times[selected]
+        series = factorize(series[selected])[0]
+        n_series = top_series
+        n = len(times)
+
+    if granularity in (None, 'auto'):
+        granularity = choose_granularity(times, max(n_series, 1), max_points)
+    elif granularity not in GRANULARITIES:
+        raise RollupError(f"rollup must be one of auto, {', '.join(GRANULARITIES)}")
+    buckets = _floor(times, granularity)
+    period_codes, periods = factorize(buckets.astype(np.int64))
+    groups, size = combine_codes([series, period_codes], n)
+
+    # One representative row per output group, ordered by period then series
+    first_row = np.full(size, n, dtype=np.int64)
+    np.minimum.at(first_row, groups, np.arange(n))
+    order = np.lexsort((series[first_row], period_codes[first_row]))
+    source_rows = np.flatnonzero(keep)[first_row[order]]
+
+    columns = {time_column: Column(time_column, periods[period_codes[first_row[order]]].astype('datetime64[ms]'),
+                                   np.zeros(size, dtype=bool), DATETIME)}
+    for name in group_by:
+        col = frame.column(name)
+        columns[name] = Column(name, col.values[source_rows], col.mask[source_rows], col.kind)
+    for name in measures:
+        col = frame.column(name)
+        values = col.values[keep]
+        present = ~col.mask[keep]
+        counts = np.bincount(groups, weights=present.astype(np.float64), minlength=size)
+        if aggregate == 'count':
+            out = counts
+        else:
+            sums = np.bincount(groups, weights=np.where(present, values, 0.0), minlength=size)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out = sums if aggregate == 'sum' else sums / counts
+        missing = counts == 0 if aggregate != 'count' else np.zeros(size, dtype=bool)
+        out = np.where(missing, np.nan, out)[order]
+        columns[name] = Column(name, out, missing[order], NUMERIC)
+
+    rolled = ColumnarFrame(columns)
+    dropped = [name for name in frame.columns if name not in columns]
+    summary = {
+        'granularity': granularity,
+        'time_column': time_column,
+        'group_by': group_by,
+        'measures': measures,
+        'dropped_columns': dropped,
+        'aggregate': aggregate,
+        'input_rows': len(frame),
+        'output_rows': len(rolled),
+        'series': n_series,
+        'pruned_series': pruned,
+        'seconds': round(time.perf_counter() - start_time, 4)
+    }
+    return rolled, summary
+
+
+class RollupCache:
+    """LRU of rolled frames keyed by source dataset hash and rollup options"""
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()   # key -> (frame, summary, size)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_build(self, frame: ColumnarFrame,
+                     options: Optional[Dict[str, Any]]) -> Tuple[ColumnarFrame, Optional[Dict[str, Any]]]:
+        """Rolled frame and summary for the options, or (frame, None) when no rollup was requested"""
+        if options is None:
+            return frame, None
+        params = {**options, 'granularity': options.get('granularity') or 'auto'}
+        canonical = json.dumps(params, sort_keys=True, separators=(',', ':'))
+        key = hashlib.sha256(f"{frame.fingerprint()}|{canonical}".encode()).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], {**entry[1], 'cached': True}
+            self.misses += 1
+        rolled, summary = self._flight.do(key, lambda: self._build(key, frame, params))
+        return rolled, {**summary, 'cached': False}
+
+    def _build(self, key: str, frame: ColumnarFrame, params: Dict[str, Any]):
+        rolled, summary = rollup_frame(frame, **params)
+        # Models key their result cache by the input's content; the rollup key already identifies it
+        rolled._fingerprint = key
+        size = sum(col.values.nbytes + col.mask.nbytes for col in rolled.columns.values())
+        if size <= self.max_bytes:
+            with self._lock:
+                self._entries[key] = (rolled, summary, size)
+                self._bytes += size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    _, (_, _, evicted) = self._entries.popitem(last=False)
+                    self._bytes -= evicted
+                    self.evictions += 1
+        return rolled, summary
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'max_points': MAX_POINTS,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def create_rollup_cache() -> RollupCache:
+    """Build the cache from ROLLUP_CACHE_* environment variables"""
+    return RollupCache(
+        max_entries=int(os.getenv('ROLLUP_CACHE_MAX_ENTRIES', 64)),
+        max_bytes=int(float(os.getenv('ROLLUP_CACHE_MAX_MB', 256)) * 1024 * 1024)
+    )
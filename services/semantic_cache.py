@@ -0,0 +1,253 @@
+"""
+Semantic cache for DAX and SQL generation
+
+Requirements are normalized (case, punctuation, stop words, common synonyms
+such as "sum of" -> "total" and "per" -> "by", plural endings) and embedded as
+hashed word, word-bigram and character-trigram vectors. Each generator kind
+keeps its own index. A previous result is only reused for a requirement with
+exactly the same content words after normalization: one word decides the
+query ("excluding" vs "including", "not", a number or a column name), so
+similarity alone is never enough. Among those candidates the stored vectors
+are scored with one matrix-vector product and the best one is reused when
+the cosine similarity reaches the threshold, which rejects reorderings that
+change the meaning ("sales by region" vs "region by sales" scores lower).
+Entries are evicted in LRU order and persisted to a JSON file across restarts.
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = 1024
+
+STOP_WORDS = {
+    'a', 'an', 'the', 'of', 'for', 'me', 'please', 'show', 'give', 'get', 'calculate', 'compute',
+    'create', 'write', 'generate', 'measure', 'query', 'find', 'what', 'is', 'are', 'to', 'in',
+    'that', 'which', 'with', 'and', 'all', 'display', 'return', 'list'
+}
+PHRASE_SYNONYMS = [
+    (r'\bsum of\b', 'total'),
+    (r'\bsum\b', 'total'),
+    (r'\bnumber of\b', 'count'),
+    (r'\bcount of\b', 'count'),
+    (r'\baverage of\b', 'average'),
+    (r'\bavg\b', 'average'),
+    (r'\bmean\b', 'average'),
+    (r'\bper\b', 'by'),
+    (r'\beach\b', 'by'),
+    (r'\bgrouped by\b', 'by'),
+    (r'\byear over year\b', 'yoy'),
+    (r'\byear-over-year\b', 'yoy'),
+    (r'\bmonth over month\b', 'mom'),
+    (r'\bmonthly\b', 'by month'),
+    (r'\bdaily\b', 'by day'),
+    (r'\bweekly\b', 'by week'),
+    (r'\byearly\b', 'by year'),
+    (r'\bannual\b', 'by year')
+]
+_SYNONYM_PATTERNS = [(re.compile(pattern), replacement) for pattern, replacement in PHRASE_SYNONYMS]
+_TOKEN = re.compile(r'[a-z0-9_]+')
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+
+def normalize(requirement: str) -> List[str]:
+    """Canonical token list for a natural-language requirement"""
+    text = requirement.lower()
+    for pattern, replacement in _SYNONYM_PATTERNS:
+        text = pattern.sub(replacement, text)
+    tokens = []
+    for token in _TOKEN.findall(text):
+        if token in STOP_WORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _bucket(feature: str) -> int:
+    return zlib.crc32(feature.encode()) % DIMENSIONS
+
+
+def embed(tokens: List[str]) -> np.ndarray:
+    """L2-normalized hashed vector of words, word bigrams and character trigrams"""
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for token in tokens:
+        vector[_bucket('w:' + token)] += 2.0
+        padded = f'#{token}#'
+        for i in range(len(padded) - 2):
+            vector[_bucket('c:' + padded[i:i + 3])] += 0.5
+    for first, second in zip(tokens, tokens[1:]):
+        vector[_bucket(f'b:{first} {second}')] += 1.5
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticIndex:
+    """Nearest-neighbour index over previous requirements of one generator kind"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.vectors = np.zeros((max_entries, DIMENSIONS), dtype=np.float32)
+        self.entries: OrderedDict = OrderedDict()  # normalized text -> (slot, requirement, result)
+        self.slot_keys: List[Optional[str]] = [None] * max_entries
+        self.free_slots = list(range(max_entries - 1, -1, -1))
+        self.by_words: Dict[frozenset, Dict[str, int]] = {}  # content words -> {normalized text: slot}
+
+    def lookup(self, tokens: List[str], threshold: float) -> Optional[Tuple[float, str, Any]]:
+        key = ' '.join(tokens)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return 1.0, entry[1], entry[2]
+        # Only requirements with the same content words are candidates; numbers must also keep their order
+        candidates = [(stored_key, slot) for stored_key, slot in self.by_words.get(frozenset(tokens), {}).items()
+                      if _NUMBER.findall(stored_key) == _NUMBER.findall(key)]
+        if not candidates:
+            return None
+        scores = self.vectors[[slot for _, slot in candidates]] @ embed(tokens)
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < threshold:
+            return None
+        stored_key = candidates[best][0]
+        _, requirement, result = self.entries[stored_key]
+        self.entries.move_to_end(stored_key)
+        return score, requirement, result
+
+    def add(self, tokens: List[str], requirement: str, result: Any):
+        key = ' '.join(tokens)
+        if key in self.entries:
+            slot = self.entries.pop(key)[0]
+        else:
+            if not self.free_slots:
+                evicted_key, (evicted_slot, _, _) = self.entries.popitem(last=False)
+                self._forget_words(evicted_key)
+                self.vectors[evicted_slot] = 0
+                self.slot_keys[evicted_slot] = None
+                self.free_slots.append(evicted_slot)
+            slot = self.free_slots.pop()
+        self.vectors[slot] = embed(tokens)
+        self.slot_keys[slot] = key
+        self.entries[key] = (slot, requirement, result)
+        self.by_words.setdefault(frozenset(tokens), {})[key] = slot
+
+    def _forget_words(self, key: str):
+        words = frozenset(key.split(' '))
+        group = self.by_words.get(words, {})
+        group.pop(key, None)
+        if not group:
+            self.by_words.pop(words, None)
+
+
+class SemanticCache:
+    """Per-kind semantic indexes with hit/miss counters and JSON persistence"""
+
+    def __init__(self, threshold: float = 0.9, max_entries: int = 2000, path: Optional[str] = None,
+                 save_every: int = 20):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.save_every = save_every
+        self._indexes: Dict[str, SemanticIndex] = {}
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.load()
+
+    def _index(self, kind: str) -> SemanticIndex:
+        if kind not in self._indexes:
+            self._indexes[kind] = SemanticIndex(self.max_entries)
+        return self._indexes[kind]
+
+    def get_or_generate(self, kind: str, requirement: str, generate: Callable[[], Any]):
+        """Return a cached result for a close-enough requirement, or generate and store one"""
+        tokens = normalize(requirement)
+        if not tokens:
+            return generate()
+        with self._lock:
+            match = self._index(kind).lookup(tokens, self.threshold)
+            if match is not None:
+                score = match[0]
+                if score >= 0.9999:
+                    self.hits += 1
+                else:
+                    self.near_hits += 1
+                return match[2]
+            self.misses += 1
+
+        result = generate()
+        if isinstance(result, dict) and result.get('success') is False:
+            return result
+        with self._lock:
+            self._index(kind).add(tokens, requirement, result)
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+        return result
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            for kind, entries in stored.items():
+                index = self._index(kind)
+                for requirement, result in entries[-self.max_entries:]:
+                    index.add(normalize(requirement), requirement, result)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load semantic cache from {self.path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            snapshot = {kind: [[requirement, result] for _, requirement, result in index.entries.values()]
+                        for kind, index in self._indexes.items()}
+            self._unsaved = 0
+        try:
+            directory = os.path.dirname(self.path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, default=str)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save semantic cache to {self.path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'entries': {kind: len(index.entries) for kind, index in self._indexes.items()},
+                'threshold': self.threshold,
+                'exact_hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.near_hits) / lookups if lookups else 0.0,
+                'persistence_path': self.path
+            }
+
+
+def create_semantic_cache() -> SemanticCache:
+    """Build the cache from SEMANTIC_CACHE_* environment variables"""
+    default_path = os.path.join(tempfile.gettempdir(), 'powerbi-tools-semantic-cache.json')
+    return SemanticCache(
+        threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.9)),
+        max_entries=int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 2000)),
+        path=os.getenv('SEMANTIC_CACHE_PATH', default_path) or None
+    )
@@ -0,0 +1,366 @@
+"""
+Incremental (append-only) anomaly and forecast state
+
+A client registers a series id with its history once; later refreshes send
+only the new rows. Each numeric column keeps a few running numbers:
+
+- Welford moments (count, mean, M2) for z-scores of new values
+- Holt's linear exponential smoothing (level, trend) for forecasts, plus an
+  exponentially weighted variance of the one-step errors for intervals
+
+An update costs O(new rows + sorting them). New values are scored against the
+state from before their batch, then folded in. A series is ordered by the first
+datetime column of its first batch: every later batch must carry that column,
+its rows are folded in timestamp order, and rows with a null timestamp or one
+at or before the last seen timestamp are skipped (and counted). A series
+registered without a datetime column takes rows in the order they are sent. A
+batch identical to the previous one is a no-op, so the same refresh can be
+sent to several endpoints.
+
+Series are scoped to their owner (the client id), so two clients using the
+same series id do not share state. Idle series are evicted in LRU order and
+the store snapshots to a JSON file.
+"""
+
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from services.columnar import DATETIME, ColumnarFrame
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ALPHA = 0.3
+DEFAULT_BETA = 0.1
+DEFAULT_THRESHOLD = 3.0
+
+
+class SeriesStateError(ValueError):
+    """Raised for unknown series or invalid series parameters"""
+
+
+class ColumnState:
+    """Running moments and Holt smoothing state of one numeric column"""
+
+    __slots__ = ('count', 'mean', 'm2', 'level', 'trend', 'error_var', 'smoothed')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.level = None
+        self.trend = 0.0
+        self.error_var = 0.0
+        self.smoothed = 0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def update(self, values: np.ndarray, alpha: float, beta: float):
+        """Fold a batch of non-null values into the moments and the smoothing state"""
+        if not len(values):
+            return
+        # Chan et al. parallel merge of the batch moments into the running moments
+        n = len(values)
+        batch_mean = float(values.mean())
+        batch_m2 = float(((values - batch_mean) ** 2).sum())
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += batch_m2 + delta * delta * self.count * n / total
+        self.count = total
+
+        # Holt smoothing is inherently sequential, but only over the new values
+        level, trend, error_var, smoothed = self.level, self.trend, self.error_var, self.smoothed
+        for x in values.tolist():
+            if level is None:
+                level = x
+            else:
+                if smoothed == 1:
+                    trend = x - level
+                error = x - (level + trend)
+                error_var = (1 - alpha) * error_var + alpha * error * error
+                previous = level
+                level = alpha * x + (1 - alpha) * (level + trend)
+                trend = beta * (level - previous) + (1 - beta) * trend
+            smoothed += 1
+        self.level, self.trend, self.error_var, self.smoothed = level, trend, error_var, smoothed
+
+    def to_list(self) -> list:
+        return [self.count, self.mean, self.m2, self.level, self.trend, self.error_var, self.smoothed]
+
+    @classmethod
+    def from_list(cls, values: list) -> 'ColumnState':
+        state = cls()
+        state.count, state.mean, state.m2, state.level, state.trend, state.error_var, state.smoothed = values
+        return state
+
+
+class SeriesState:
+    """All column states of one registered series"""
+
+    def __init__(self, series_id: str, alpha: float = DEFAULT_ALPHA, beta: float = DEFAULT_BETA,
+                 threshold: float = DEFAULT_THRESHOLD, owner: str = ''):
+        self.series_id = series_id
+        self.owner = owner
+        self.alpha = alpha
+        self.beta = beta
+        self.threshold = threshold
+        self.columns: Dict[str, ColumnState] = {}
+        self.rows = 0
+        self.time_column: Optional[str] = None
+        self.watermark: Optional[str] = None
+        self.last_batch: Optional[str] = None
+        self.last_result: Optional[dict] = None
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+
+    def append(self, frame: ColumnarFrame) -> Dict[str, Any]:
+        """Score and fold in new rows; returns per-column anomalies for this batch"""
+        fingerprint = frame.fingerprint()
+        if fingerprint == self.last_batch and self.last_result is not None:
+            return {**self.last_result, 'duplicate_batch': True}
+
+        if self.rows == 0 and self.watermark is None:
+            self.time_column = next((name for name, col in frame.columns.items() if col.kind == DATETIME), None)
+        order = self._new_rows(frame)
+
+        anomalies = {}
+        new_rows = len(order)
+        for name in frame.numeric_columns():
+            col = frame.column(name)
+            rows = order[~col.mask[order]]
+            values = col.values[rows]
+            state = self.columns.setdefault(name, ColumnState())
+            std = state.std
+            if std > 0 and len(values):
+                scores = (values - state.mean) / std
+                flagged = np.flatnonzero(np.abs(scores) > self.threshold)
+                if len(flagged):
+                    anomalies[name] = [{'index': int(rows[i]), 'value': float(values[i]),
+                                        'score': round(float(scores[i]), 4)} for i in flagged]
+            state.update(values, self.alpha, self.beta)
+
+        self.rows += new_rows
+        self.updated_at = time.time()
+        self.last_batch = fingerprint
+        self.last_result = {
+            'series_id': self.series_id,
+            'new_rows': new_rows,
+            'skipped_rows': len(frame) - new_rows,
+            'total_rows': self.rows,
+            'threshold': self.threshold,
+            'anomalies': anomalies
+        }
+        return self.last_result
+
+    def _new_rows(self, frame: ColumnarFrame) -> np.ndarray:
+        """Indices of the rows to fold in, in timestamp order; advances the watermark"""
+        if self.time_column is None:
+            return np.arange(len(frame))
+        col = frame.columns.get(self.time_column)
+        if col is None or col.kind != DATETIME:
+            raise SeriesStateError(f"Series {self.series_id} is ordered by '{self.time_column}'; "
+                                   f"every batch must include it as a datetime column")
+        keep = ~col.mask
+        if self.watermark is not None:
+            keep &= col.values > np.datetime64(self.watermark)
+        rows = np.flatnonzero(keep)
+        rows = rows[np.argsort(col.values[rows], kind='stable')]
+        if len(rows):
+            self.watermark = str(col.values[rows[-1]])
+        return rows
+
+    def forecast(self, horizon: int) -> Dict[str, Any]:
+        if horizon < 1:
+            raise SeriesStateError("horizon must be at least 1")
+        steps = np.arange(1, horizon + 1)
+        forecasts = {}
+        for name, state in self.columns.items():
+            if state.level is None:
+                continue
+            point = state.level + steps * state.trend
+            # Interval widens with the horizon like a random walk on the one-step error
+            spread = 1.96 * np.sqrt(state.error_var * steps)
+            forecasts[name] = {
+                'forecast': point.tolist(),
+                'lower': (point - spread).tolist(),
+                'upper': (point + spread).tolist(),
+                'level': state.level,
+                'trend': state.trend
+            }
+        return {'series_id': self.series_id, 'horizon': horizon, 'total_rows': self.rows,
+                'method': 'holt_linear', 'forecasts': forecasts}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'series_id': self.series_id,
+            'rows': self.rows,
+            'time_column': self.time_column,
+            'watermark': self.watermark,
+            'updated_at': self.updated_at,
+            'columns': {name: {'count': state.count, 'mean': state.mean, 'std': state.std,
+                               'level': state.level, 'trend': state.trend}
+                        for name, state in self.columns.items()}
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'series_id': self.series_id,
+            'owner': self.owner,
+            'alpha': self.alpha,
+            'beta': self.beta,
+            'threshold': self.threshold,
+            'rows': self.rows,
+            'time_column': self.time_column,
+            'watermark': self.watermark,
+            'updated_at': self.updated_at,
+            'columns': {name: state.to_list() for name, state in self.columns.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, stored: Dict[str, Any]) -> 'SeriesState':
+        state = cls(stored['series_id'], stored['alpha'], stored['beta'], stored['threshold'], stored['owner'])
+        state.rows = stored['rows']
+        state.time_column = stored.get('time_column')
+        state.watermark = stored.get('watermark')
+        state.updated_at = stored.get('updated_at', time.time())
+        state.columns = {name: ColumnState.from_list(values) for name, values in stored['columns'].items()}
+        return state
+
+
+class SeriesStore:
+    """Registered series in LRU order, with idle expiry and JSON snapshots"""
+
+    def __init__(self, max_series: int = 10000, idle_ttl: float = 7 * 86400, path: Optional[str] = None,
+                 save_every: int = 50):
+        self.max_series = max_series
+        self.idle_ttl = idle_ttl
+        self.path = path
+        self.save_every = save_every
+        self._series: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.updates = 0
+        self.evicted = 0
+        self.load()
+
+    def _get_or_create(self, key: Tuple[str, str], options: Dict[str, Any], reset: bool) -> SeriesState:
+        with self._lock:
+            state = None if reset else self._series.get(key)
+            if state is None:
+                try:
+                    state = SeriesState(key[1],
+                                        alpha=float(options.get('alpha', DEFAULT_ALPHA)),
+                                        beta=float(options.get('beta', DEFAULT_BETA)),
+                                        threshold=float(options.get('threshold', DEFAULT_THRESHOLD)),
+                                        owner=key[0])
+                except (TypeError, ValueError):
+                    raise SeriesStateError("alpha, beta and threshold must be numbers")
+                if not (0 < state.alpha <= 1 and 0 <= state.beta <= 1):
+                    raise SeriesStateError("alpha must be in (0, 1] and beta in [0, 1]")
+                self._series[key] = state
+            self._series.move_to_end(key)
+            self._evict()
+            return state
+
+    def _evict(self):
+        cutoff = time.time() - self.idle_ttl
+        while self._series:
+            oldest_id, oldest = next(iter(self._series.items()))
+            if len(self._series) <= self.max_series and oldest.updated_at >= cutoff:
+                break
+            del self._series[oldest_id]
+            self.evicted += 1
+
+    def append(self, owner: str, series_id: str, frame: ColumnarFrame, options: Optional[Dict[str, Any]] = None,
+               reset: bool = False) -> Dict[str, Any]:
+        """Register the owner's series on first use, then fold in the new rows"""
+        state = self._get_or_create((owner, str(series_id)), options or {}, reset)
+        with state.lock:
+            result = state.append(frame)
+        with self._lock:
+            self.updates += 1
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+        return result
+
+    def get(self, owner: str, series_id: str) -> SeriesState:
+        with self._lock:
+            state = self._series.get((owner, str(series_id)))
+        if state is None:
+            raise SeriesStateError(f"Unknown series: {series_id}")
+        return state
+
+    def forecast(self, owner: str, series_id: str, horizon: int) -> Dict[str, Any]:
+        state = self.get(owner, series_id)
+        with state.lock:
+            return state.forecast(horizon)
+
+    def delete(self, owner: str, series_id: str) -> bool:
+        with self._lock:
+            return self._series.pop((owner, str(series_id)), None) is not None
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            for entry in stored:
+                state = SeriesState.from_dict(entry)
+                self._series[(state.owner, state.series_id)] = state
+            self._evict()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Could not load series state from {self.path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            series = list(self._series.items())
+            self._unsaved = 0
+        snapshot = []
+        for _, state in series:
+            with state.lock:
+                snapshot.append(state.to_dict())
+        try:
+            directory = os.path.dirname(self.path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save series state to {self.path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'series': len(self._series),
+                'max_series': self.max_series,
+                'updates': self.updates,
+                'evicted': self.evicted,
+                'persistence_path': self.path
+            }
+
+
+def create_series_store() -> SeriesStore:
+    """Build the store from SERIES_STATE_* environment variables"""
+    default_path = os.path.join(tempfile.gettempdir(), 'powerbi-tools-series-state.json')
+    return SeriesStore(
+        max_series=int(os.getenv('SERIES_STATE_MAX_SERIES', 10000)),
+        idle_ttl=float(os.getenv('SERIES_STATE_IDLE_TTL', 7 * 86400)),
+        path=os.getenv('SERIES_STATE_PATH', default_path) or None
+    )
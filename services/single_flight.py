@@ -0,0 +1,73 @@
+"""
+Request coalescing (single-flight)
+
+Concurrent calls with the same key share one computation: the first caller
+runs it, later callers wait for it and receive the same result (or the same
+exception). Counters report how many computations were saved.
+"""
+
+import threading
+from typing import Any, Callable, Dict
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates identical in-flight computations by key"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    def do(self, key: str, compute: Callable[[], Any]):
+        """Run compute once for all concurrent callers with the same key"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = compute()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.executed + self.coalesced
+            return {
+                'in_flight': len(self._calls),
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+                'saved_ratio': self.coalesced / total if total else 0.0,
+                'max_waiters': self.max_waiters
+            }
@@ -0,0 +1,335 @@
+"""
+Sketch-based dataset profiling
+
+Chart recommendation and insights only need cardinalities, distributions,
+correlations and frequent values. For large inputs they are estimated in one
+chunked pass with fixed memory, independent of the row count:
+
+- HyperLogLog distinct counts (standard error 1.04 / sqrt(registers))
+- merging t-digest quantiles (accurate at the tails, bounded centroids)
+- mergeable space-saving / Misra-Gries top-k (count error <= n / (k + 1))
+- reservoir sampling of rows, used for correlations and handed to the models
+
+Every sketch updates from a whole NumPy chunk at once. Counts, sums, means and
+min/max are exact; only the models' view of the rows is sampled. Exact
+profiling stays the default: clients opt in with `auto` (sketch above
+EXACT_MAX_ROWS rows) or `sketch`, and sampled responses say so.
+"""
+
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.columnar import BOOLEAN, DATETIME, NUMERIC, Column, ColumnarFrame
+
+EXACT_MAX_ROWS = int(os.getenv('PROFILE_EXACT_MAX_ROWS', 100000))
+SAMPLE_SIZE = int(os.getenv('PROFILE_SAMPLE_SIZE', 10000))
+CHUNK_ROWS = 65536
+PROFILE_MODES = ('auto', 'exact', 'sketch')
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+class ProfileModeError(ValueError):
+    """Raised for an unknown profile_mode"""
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: spreads any 64-bit input over all output bits"""
+    x = x.astype(np.uint64, copy=True)
+    with np.errstate(over='ignore'):
+        x ^= x >> np.uint64(30)
+        x *= np.uint64(0xBF58476D1CE4E5B9)
+        x ^= x >> np.uint64(27)
+        x *= np.uint64(0x94D049BB133111EB)
+        x ^= x >> np.uint64(31)
+    return x
+
+
+def hash_values(col: Column, values: np.ndarray) -> np.ndarray:
+    """64-bit hashes of non-null values of a column"""
+    if col.kind == NUMERIC:
+        # +0.0 and -0.0 are the same value
+        return _mix64((values + 0.0).view(np.uint64))
+    if col.kind == DATETIME:
+        return _mix64(values.view(np.int64).view(np.uint64))
+    if col.kind == BOOLEAN:
+        return _mix64(values.astype(np.uint64))
+    return _mix64(np.fromiter((hash(value) for value in values), dtype=np.int64, count=len(values)).view(np.uint64))
+
+
+class HyperLogLog:
+    """Distinct-count estimator with 2^precision registers"""
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = np.zeros(self.size, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        if not len(hashes):
+            return
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        rest = (hashes << p) & _MASK64
+        # Rank = leading zeros of the remaining bits + 1; frexp is exact on the top 53 bits
+        top = (rest >> np.uint64(11)).astype(np.float64)
+        _, exponent = np.frexp(top)
+        rank = np.where(top > 0, 54 - exponent, 64 - self.precision + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self) -> float:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int((self.registers == 0).sum())
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction: linear counting
+            return m * math.log(m / zeros)
+        return float(raw)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.size)
+
+
+class TDigest:
+    """Merging t-digest: centroids sized by the arcsine scale function"""
+
+    def __init__(self, compression: int = 200):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values: np.ndarray):
+        if not len(values):
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        means = np.concatenate([self.means, values.astype(np.float64)])
+        weights = np.concatenate([self.weights, np.ones(len(values))])
+        self._compress(means, weights)
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # Quantile at each point's midpoint, mapped to k-scale; points sharing an integer k merge
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = np.floor(self.compression / math.pi * (np.arcsin(2 * np.clip(q, 0, 1) - 1) + math.pi / 2)).astype(np.int64)
+        _, group = np.unique(k, return_inverse=True)
+        merged_weights = np.bincount(group, weights=weights)
+        self.means = np.bincount(group, weights=means * weights) / merged_weights
+        self.weights = merged_weights
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not len(self.weights):
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        centers = (np.cumsum(self.weights) - self.weights / 2) / self.count
+        points = np.concatenate([[0.0], centers, [1.0]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q, points, values))
+
+
+class TopK:
+    """Mergeable frequent-items summary (Misra-Gries / space-saving)"""
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.counts: Dict[Any, int] = {}
+        self.total = 0
+        self.max_error = 0
+
+    def add_counts(self, uniques: np.ndarray, counts: np.ndarray):
+        """Merge the distinct values of a chunk and their counts"""
+        if not len(counts):
+            return
+        self.total += int(counts.sum())
+        if len(counts) > self.capacity:
+            # Reduce the chunk to its own summary first so the merge below stays small
+            cut = int(np.partition(counts, len(counts) - self.capacity - 1)[len(counts) - self.capacity - 1])
+            keep = counts > cut
+            uniques, counts = uniques[keep], counts[keep] - cut
+            self.max_error += cut
+        merged = dict(self.counts)
+        for value, count in zip(uniques.tolist(), counts.tolist()):
+            merged[value] = merged.get(value, 0) + count
+        if len(merged) > self.capacity:
+            # Subtract the (capacity+1)-th largest count and drop what falls to zero
+            cut = sorted(merged.values(), reverse=True)[self.capacity]
+            self.max_error += cut
+            merged = {value: count - cut for value, count in merged.items() if count > cut}
+        self.counts = merged
+
+    def top(self, k: int = 5) -> List[Tuple[Any, int]]:
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class Reservoir:
+    """Uniform sample of row indices (algorithm R, one chunk at a time)"""
+
+    def __init__(self, size: int, seed: int = 0):
+        self.size = size
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+
+    def add_range(self, start: int, stop: int):
+        positions = np.arange(start, stop)
+        free = max(0, self.size - len(self.indices))
+        if free:
+            self.indices = np.concatenate([self.indices, positions[:free]])
+            positions = positions[free:]
+        if len(positions):
+            # Row i replaces a random slot with probability size / (i + 1)
+            accept = self._rng.random(len(positions)) < self.size / (positions + 1)
+            chosen = positions[accept]
+            self.indices[self._rng.integers(0, self.size, len(chosen))] = chosen
+        self.seen = stop
+
+
+class ColumnSketch:
+    """All sketches of one column"""
+
+    def __init__(self, col: Column):
+        self.col = col
+        self.count = 0
+        self.nulls = 0
+        self.hll = HyperLogLog()
+        self.digest = TDigest() if col.kind == NUMERIC else None
+        self.top = TopK() if col.kind != NUMERIC else None
+        self.sum = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.true_count = 0
+        self.min = None
+        self.max = None
+
+    def update(self, start: int, stop: int):
+        mask = self.col.mask[start:stop]
+        values = self.col.values[start:stop][~mask]
+        self.nulls += int(mask.sum())
+        n = len(values)
+        if not n:
+            return
+        kind = self.col.kind
+        if kind == NUMERIC:
+            self.hll.add_hashes(hash_values(self.col, values))
+            self.digest.add(values)
+            chunk_mean = float(values.mean())
+            delta = chunk_mean - self.mean
+            total = self.count + n
+            self.mean += delta * n / total
+            self.m2 += float(((values - chunk_mean) ** 2).sum()) + delta * delta * self.count * n / total
+            self.sum += float(values.sum())
+        elif kind == DATETIME:
+            low, high = values.min(), values.max()
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+        elif kind == BOOLEAN:
+            self.true_count += int(values.sum())
+        if kind != NUMERIC:
+            # Distinct values of the chunk feed both sketches, so each one is hashed only once
+            uniques, counts = np.unique(values if kind in (DATETIME, BOOLEAN) else values.astype(str),
+                                        return_counts=True)
+            self.hll.add_hashes(hash_values(self.col, uniques))
+            labels = np.datetime_as_string(uniques, unit='auto') if kind == DATETIME else uniques
+            self.top.add_counts(labels, counts)
+        self.count += n
+
+    def summary(self) -> Dict[str, Any]:
+        stats = {'kind': self.col.kind, 'count': self.count, 'nulls': self.nulls}
+        if not self.count:
+            return stats
+        stats['distinct'] = int(round(min(self.hll.estimate(), self.count)))
+        stats['distinct_relative_error'] = round(self.hll.relative_error, 4)
+        if self.col.kind == NUMERIC:
+            stats.update({
+                'min': self.digest.min,
+                'max': self.digest.max,
+                'mean': self.mean,
+                'std': math.sqrt(self.m2 / self.count),
+                'sum': self.sum,
+                'quantiles': {str(q): self.digest.quantile(q) for q in (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)},
+                'quantile_centroids': len(self.digest.weights)
+            })
+        elif self.col.kind == DATETIME:
+            stats.update({'min': str(self.min), 'max': str(self.max)})
+        elif self.col.kind == BOOLEAN:
+            stats['true_count'] = self.true_count
+        if self.top is not None:
+            stats['top_values'] = [{'value': str(value), 'count': count} for value, count in self.top.top(5)]
+            stats['top_count_max_error'] = self.top.max_error
+        return stats
+
+
+def _correlations(sample: ColumnarFrame, limit: int = 20) -> List[Dict[str, Any]]:
+    """Strongest Pearson correlations between numeric columns of the sample"""
+    names = sample.numeric_columns()
+    if len(names) < 2 or len(sample) < 3:
+        return []
+    matrix = np.column_stack([np.where(sample.column(name).mask, np.nan, sample.column(name).values)
+                              for name in names])
+    complete = ~np.isnan(matrix).any(axis=1)
+    matrix = matrix[complete]
+    n = len(matrix)
+    if n < 3:
+        return []
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.corrcoef(matrix, rowvar=False)
+    pairs = []
+    for i, j in zip(*np.triu_indices(len(names), k=1)):
+        r = corr[i, j]
+        if np.isfinite(r):
+            pairs.append({'columns': [names[i], names[j]], 'r': round(float(r), 4),
+                          'standard_error': round(float((1 - r * r) / math.sqrt(n - 1)), 4)})
+    pairs.sort(key=lambda pair: abs(pair['r']), reverse=True)
+    return pairs[:limit]
+
+
+def choose_profile_mode(requested: Optional[str], rows: int) -> str:
+    """Resolve auto/exact/sketch (default exact); auto keeps exact profiling for small inputs"""
+    requested = (requested or 'exact').lower()
+    if requested not in PROFILE_MODES:
+        raise ProfileModeError(f"profile_mode must be one of {', '.join(PROFILE_MODES)}")
+    if requested == 'auto':
+        return 'exact' if rows <= EXACT_MAX_ROWS else 'sketch'
+    return requested
+
+
+def sketch_profile(frame: ColumnarFrame, sample_size: int = SAMPLE_SIZE, chunk_rows: int = CHUNK_ROWS,
+                   column_profile: Optional[Dict[str, Dict[str, Any]]] = None) -> Tuple[Dict[str, Any], ColumnarFrame]:
+    """One chunked pass over the frame; returns the sketch profile and a row sample
+
+    An exact `column_profile` (ColumnarFrame.profile()) that the caller already has
+    replaces the column sketches; only the row sample is drawn then.
+    """
+    sketches = {} if column_profile is not None else {name: ColumnSketch(col) for name, col in frame.columns.items()}
+    reservoir = Reservoir(sample_size)
+    n = len(frame)
+    for start in range(0, n, chunk_rows):
+        stop = min(start + chunk_rows, n)
+        for sketch in sketches.values():
+            sketch.update(start, stop)
+        reservoir.add_range(start, stop)
+    sample = frame.take(np.sort(reservoir.indices))
+    profile = {
+        'rows': n,
+        'sample_rows': len(sample),
+        'columns': column_profile if column_profile is not None else
+                   {name: sketch.summary() for name, sketch in sketches.items()},
+        'correlations': _correlations(sample)
+    }
+    return profile, sample
@@ -0,0 +1,214 @@
+"""
+Streaming dataset ingestion for large uploads
+
+Clients can POST newline-delimited JSON (application/x-ndjson) or CSV (text/csv)
+bodies instead of one JSON document. The body is read in fixed-size byte
+chunks, rows are parsed incrementally and buffered per column for at most
+`chunk_rows` rows before being packed into typed NumPy chunks. Peak memory is
+the typed columns plus one chunk of Python values, instead of the whole body
+plus a list of row dicts.
+
+A streamed frame has no payload, so it stays columnar: the vectorized anomaly
+engine, ensemble forecasts, sketch profiling, rollups and /api/execute-query read
+its columns directly. The row-based models need one dict per row, so above
+STREAM_RECORDS_MAX rows those paths are refused with a StreamingError (400)
+instead of silently materialising the whole upload as Python objects.
+"""
+
+import codecs
+import csv
+import json
+import os
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from services.columnar import BOOLEAN, DATETIME, NUMERIC, STRING, Column, ColumnarFrame, infer_column
+
+NDJSON_TYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-seq'}
+CSV_TYPES = {'text/csv', 'application/csv'}
+
+DEFAULT_CHUNK_ROWS = int(os.getenv('STREAM_CHUNK_ROWS', 8192))
+DEFAULT_MAX_ROWS = int(os.getenv('STREAM_MAX_ROWS', 10_000_000))
+DEFAULT_RECORDS_MAX = int(os.getenv('STREAM_RECORDS_MAX', 100_000))
+READ_SIZE = 64 * 1024
+
+
+class StreamingError(ValueError):
+    """Raised when a streamed upload is malformed or too large"""
+
+
+def is_streaming_upload(mimetype: Optional[str]) -> bool:
+    return (mimetype or '').lower() in NDJSON_TYPES | CSV_TYPES
+
+
+def _null_column(name: str, length: int, kind: str) -> Column:
+    mask = np.ones(length, dtype=bool)
+    if kind == NUMERIC:
+        values = np.full(length, np.nan)
+    elif kind == BOOLEAN:
+        values = np.zeros(length, dtype=bool)
+    elif kind == DATETIME:
+        values = np.full(length, np.datetime64('NaT'), dtype='datetime64[ms]')
+    else:
+        values = np.full(length, None, dtype=object)
+    return Column(name, values, mask, kind)
+
+
+def _number_text(value: float) -> str:
+    return str(int(value)) if value.is_integer() and abs(value) < 2 ** 53 else repr(value)
+
+
+def _as_text(chunk: Column) -> np.ndarray:
+    """One chunk's values as strings (None for nulls), the way infer_column renders a mixed column"""
+    if chunk.kind == STRING:
+        return chunk.values
+    if chunk.kind == DATETIME:
+        text = np.datetime_as_string(chunk.values, unit='auto').tolist()
+    elif chunk.kind == NUMERIC:
+        text = [_number_text(v) for v in chunk.values.tolist()]
+    else:
+        text = [str(v) for v in chunk.values.tolist()]
+    values = np.empty(len(chunk), dtype=object)
+    values[:] = text
+    values[chunk.mask] = None
+    return values
+
+
+def _concat(name: str, chunks: List[Column]) -> Column:
+    # All-null chunks carry no type information; adopt the type of the others
+    kinds = {chunk.kind for chunk in chunks if not chunk.mask.all()}
+    if len(kinds) > 1:
+        # Chunks disagree on the type (e.g. a text value late in a numeric column). A mixed column is
+        # text, so each chunk is converted on its own instead of re-inferring the column from Python values
+        chunks = [Column(name, _as_text(chunk), chunk.mask, STRING) for chunk in chunks]
+        kinds = {STRING}
+    kind = kinds.pop() if kinds else chunks[0].kind
+    chunks = [chunk if chunk.kind == kind else _null_column(name, len(chunk), kind) for chunk in chunks]
+    values = np.concatenate([chunk.values for chunk in chunks])
+    mask = np.concatenate([chunk.mask for chunk in chunks])
+    return Column(name, values, mask, kind)
+
+
+class ColumnBuffer:
+    """Accumulates one column as a list of typed chunks"""
+
+    def __init__(self, name: str, leading_nulls: int = 0, parse_text: bool = False):
+        self.name = name
+        self.leading_nulls = leading_nulls
+        self.parse_text = parse_text
+        self.pending: List = []
+        self.chunks: List[Column] = []
+
+    def flush(self):
+        if self.pending:
+            self.chunks.append(infer_column(self.name, self.pending, parse_text=self.parse_text))
+            self.pending = []
+
+    def finish(self) -> Column:
+        self.flush()
+        chunks = self.chunks
+        if not chunks:
+            return _null_column(self.name, self.leading_nulls, STRING)
+        if self.leading_nulls:
+            chunks = [_null_column(self.name, self.leading_nulls, chunks[0].kind)] + chunks
+        return _concat(self.name, chunks)
+
+
+class StreamingFrameBuilder:
+    """Builds a ColumnarFrame from rows delivered one at a time"""
+
+    def __init__(self, chunk_rows: int = DEFAULT_CHUNK_ROWS, max_rows: int = DEFAULT_MAX_ROWS,
+                 parse_text: bool = False, records_max: int = DEFAULT_RECORDS_MAX):
+        self.chunk_rows = chunk_rows
+        self.max_rows = max_rows
+        self.records_max = records_max
+        self.parse_text = parse_text    # CSV cells are untyped text; numbers are parsed from it
+        self.buffers: Dict[str, ColumnBuffer] = {}
+        self.n_rows = 0
+        self._in_chunk = 0
+
+    def add_row(self, row: dict):
+        if not isinstance(row, dict):
+            raise StreamingError(f"Row {self.n_rows + 1} is not a JSON object")
+        if self.n_rows >= self.max_rows:
+            raise StreamingError(f"Upload exceeds the limit of {self.max_rows} rows")
+        for key in row:
+            if key not in self.buffers:
+                # Column first seen mid-stream: earlier rows are null
+                buffer = ColumnBuffer(key, leading_nulls=self.n_rows - self._in_chunk, parse_text=self.parse_text)
+                buffer.pending = [None] * self._in_chunk
+                self.buffers[key] = buffer
+        for name, buffer in self.buffers.items():
+            buffer.pending.append(row.get(name))
+        self.n_rows += 1
+        self._in_chunk += 1
+        if self._in_chunk >= self.chunk_rows:
+            for buffer in self.buffers.values():
+                buffer.flush()
+            self._in_chunk = 0
+
+    def build(self) -> ColumnarFrame:
+        columns = {name: buffer.finish() for name, buffer in self.buffers.items()}
+        frame = ColumnarFrame(columns)
+        frame.records_limit = self.records_max
+        return frame
+
+
+def iter_lines(stream, encoding: str = 'utf-8') -> Iterator[str]:
+    """Yield decoded lines (with line endings) from a binary stream read in chunks"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    tail = ''
+    while True:
+        block = stream.read(READ_SIZE)
+        if not block:
+            break
+        lines = (tail + decoder.decode(block)).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_ndjson_rows(stream) -> Iterator[dict]:
+    for number, line in enumerate(iter_lines(stream), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise StreamingError(f"Invalid JSON on line {number}: {e.msg}")
+
+
+def iter_csv_rows(stream) -> Iterator[dict]:
+    reader = csv.reader(iter_lines(stream))
+    header = next(reader, None)
+    if not header:
+        return
+    width = len(header)
+    for values in reader:
+        if not values:
+            continue
+        if len(values) < width:
+            values = values + [''] * (width - len(values))
+        yield dict(zip(header, values))
+
+
+def read_streaming_dataset(stream, mimetype: str, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                           max_rows: int = DEFAULT_MAX_ROWS) -> ColumnarFrame:
+    """Parse an NDJSON or CSV request body into a ColumnarFrame incrementally"""
+    mimetype = (mimetype or '').lower()
+    if mimetype in NDJSON_TYPES:
+        rows = iter_ndjson_rows(stream)
+    elif mimetype in CSV_TYPES:
+        rows = iter_csv_rows(stream)
+    else:
+        raise StreamingError(f"Unsupported streaming content type: {mimetype}")
+
+    builder = StreamingFrameBuilder(chunk_rows=chunk_rows, max_rows=max_rows, parse_text=mimetype in CSV_TYPES)
+    for row in rows:
+        builder.add_row(row)
+    return builder.build()
@@ -0,0 +1,270 @@
+"""
+Binary wire formats for dataset requests and responses
+
+Besides JSON, the analytics endpoints accept and return:
+
+- Arrow IPC streams (application/vnd.apache.arrow.stream). Request tables are
+  turned into ColumnarFrame columns directly from the Arrow buffers.
+  Null-free float64 and timestamp[ms] columns are zero-copy views. Request
+  parameters come from the query string or a JSON `params` entry in the
+  schema metadata.
+- MessagePack (application/msgpack): the same document as the JSON body.
+
+A response uses the Accept header, or the request's own format when Accept
+does not name one. An Arrow response is a long table (path, position, value)
+holding every numeric array of the result, such as forecasts, bounds and
+anomaly scores. The rest of the result is JSON in the schema metadata under
+`result`. pyarrow and msgpack (requirements.txt) are only imported when one of
+these formats is used. On a server without them, format_available() is False:
+negotiate() skips the format and the app answers 415 to such a body and 406 to
+an Accept header that names no format the server can produce.
+"""
+
+import importlib
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.columnar import BOOLEAN, DATETIME, NUMERIC, STRING, Column, ColumnarFrame
+from services.streaming import StreamingError
+
+ARROW_TYPES = {'application/vnd.apache.arrow.stream', 'application/vnd.apache.arrow.file',
+               'application/x-apache-arrow-stream'}
+MSGPACK_TYPES = {'application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack'}
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+MSGPACK_MIMETYPE = 'application/msgpack'
+PACKAGES = {'arrow': 'pyarrow', 'msgpack': 'msgpack'}
+
+
+class WireFormatError(StreamingError):
+    """Raised when a binary body cannot be decoded (or its library is not installed)"""
+
+
+def wire_format(mimetype: Optional[str]) -> Optional[str]:
+    mimetype = (mimetype or '').lower()
+    if mimetype in ARROW_TYPES:
+        return 'arrow'
+    if mimetype in MSGPACK_TYPES:
+        return 'msgpack'
+    return None
+
+
+@lru_cache(maxsize=None)
+def format_available(fmt: str) -> bool:
+    """Whether the library for a wire format is installed (json always is)"""
+    if fmt not in PACKAGES:
+        return True
+    try:
+        importlib.import_module(PACKAGES[fmt])
+        return True
+    except ImportError:
+        return False
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        return pyarrow
+    except ImportError:
+        raise WireFormatError("Arrow IPC needs the pyarrow package on the server")
+
+
+def _msgpack():
+    try:
+        import msgpack
+        return msgpack
+    except ImportError:
+        raise WireFormatError("MessagePack needs the msgpack package on the server")
+
+
+def _arrow_column(pa, name: str, array) -> Column:
+    if isinstance(array, pa.ChunkedArray):
+        array = array.chunk(0) if array.num_chunks == 1 else array.combine_chunks()
+    if pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    n = len(array)
+    nulls = array.null_count
+    mask = array.is_null().to_numpy(zero_copy_only=False) if nulls else np.zeros(n, dtype=bool)
+    kind = array.type
+
+    if pa.types.is_floating(kind) or pa.types.is_integer(kind) or pa.types.is_decimal(kind):
+        if kind != pa.float64():
+            array = array.cast(pa.float64())
+        # Null-free float64 buffers are viewed in place; nulls need NaN written into a copy
+        values = array.to_numpy(zero_copy_only=not nulls)
+        return Column(name, values, mask, NUMERIC)
+    if pa.types.is_timestamp(kind) or pa.types.is_date(kind):
+        if kind != pa.timestamp('ms'):
+            array = array.cast(pa.timestamp('ms'), safe=False)
+        if nulls:
+            values = array.fill_null(0).to_numpy(zero_copy_only=False).astype('datetime64[ms]')
+            values[mask] = np.datetime64('NaT')
+        else:
+            values = array.to_numpy(zero_copy_only=True).view('datetime64[ms]')
+        return Column(name, values, mask, DATETIME)
+    if pa.types.is_boolean(kind):
+        values = array.fill_null(False).to_numpy(zero_copy_only=False)
+        return Column(name, values, mask, BOOLEAN)
+    values = np.empty(n, dtype=object)
+    if pa.types.is_string(kind) or pa.types.is_large_string(kind):
+        values[:] = array.to_pylist()
+    else:
+        values[:] = [None if value is None else str(value) for value in array.to_pylist()]
+    return Column(name, values, mask, STRING)
+
+
+def read_arrow(body: bytes) -> Tuple[ColumnarFrame, Dict[str, Any]]:
+    """Arrow IPC stream (or file) -> frame and the params from the schema metadata"""
+    pa = _pyarrow()
+    try:
+        buffer = pa.py_buffer(body)
+        try:
+            table = pa.ipc.open_stream(buffer).read_all()
+        except pa.ArrowInvalid:
+            table = pa.ipc.open_file(buffer).read_all()
+    except pa.ArrowException as e:
+        raise WireFormatError(f"Invalid Arrow IPC body: {e}")
+    columns = {name: _arrow_column(pa, name, table.column(name)) for name in table.column_names}
+    params = {}
+    metadata = table.schema.metadata or {}
+    if b'params' in metadata:
+        try:
+            params = json.loads(metadata[b'params'])
+        except ValueError:
+            raise WireFormatError("Arrow schema metadata 'params' must be a JSON object")
+    return ColumnarFrame(columns), params if isinstance(params, dict) else {}
+
+
+def read_binary_payload(body: bytes, mimetype: str) -> Dict[str, Any]:
+    """Decode an Arrow or MessagePack request body into the same dict as a JSON body"""
+    if wire_format(mimetype) == 'arrow':
+        frame, params = read_arrow(body)
+        return {**params, 'dataset': frame}
+    msgpack = _msgpack()
+    try:
+        data = msgpack.unpackb(body, raw=False, strict_map_key=False)
+    except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+        raise WireFormatError(f"Invalid MessagePack body: {e}")
+    if not isinstance(data, dict):
+        raise WireFormatError("MessagePack body must be a map")
+    return data
+
+
+def _accepted(accept: str) -> List[Tuple[str, float]]:
+    """(media range, quality) pairs of an Accept header"""
+    parts = []
+    for part in (accept or '').split(','):
+        fields = part.strip().split(';')
+        quality = 1.0
+        for field in fields[1:]:
+            key, _, value = field.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        parts.append((fields[0].strip().lower(), quality))
+    return parts
+
+
+def negotiate(accept: str, request_mimetype: Optional[str] = None) -> Optional[str]:
+    """Response format from the Accept header, falling back to the request format (installed formats only)"""
+    best, best_quality = None, 0.0
+    for media_range, quality in _accepted(accept):
+        fmt = wire_format(media_range)
+        if fmt is None:
+            if media_range in ('application/json', 'text/json'):
+                fmt = 'json'
+            else:
+                continue
+        if quality > best_quality and format_available(fmt):
+            best, best_quality = fmt, quality
+    if best is None:
+        best = wire_format(request_mimetype)
+        if best is not None and not format_available(best):
+            best = None
+    return None if best == 'json' else best
+
+
+def unacceptable(accept: str) -> Optional[str]:
+    """The binary format an Accept header insists on when this server cannot produce it (406), else None"""
+    wanted = None
+    for media_range, quality in _accepted(accept):
+        if quality <= 0:
+            continue
+        fmt = wire_format(media_range)
+        if fmt is None:
+            if media_range in ('application/json', 'text/json', 'application/*', '*/*'):
+                return None
+            continue
+        if format_available(fmt):
+            return None
+        wanted = fmt
+    return wanted
+
+
+def _plain(value: Any) -> Any:
+    """msgpack fallback for NumPy values and anything else non-native"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _is_number(value: Any) -> bool:
+    return value is None or (isinstance(value, (int, float, np.number)) and not isinstance(value, bool))
+
+
+def _split_arrays(value: Any, path: str, leaves: List[Tuple[str, np.ndarray]]) -> Any:
+    """Move numeric arrays (and numeric fields of record lists) into leaves; return the rest"""
+    if isinstance(value, dict):
+        return {key: _split_arrays(item, f'{path}.{key}' if path else str(key), leaves)
+                for key, item in value.items()}
+    if isinstance(value, list) and value:
+        if all(_is_number(item) for item in value):
+            leaves.append((path, np.array([np.nan if item is None else item for item in value], dtype=np.float64)))
+            return None
+        if all(isinstance(item, dict) for item in value):
+            numeric_keys = [key for key in value[0]
+                            if all(_is_number(item.get(key)) for item in value)]
+            for key in numeric_keys:
+                leaves.append((f'{path}.{key}', np.array(
+                    [np.nan if item.get(key) is None else item[key] for item in value], dtype=np.float64)))
+            rest = [{key: item for key, item in record.items() if key not in numeric_keys} for record in value]
+            if any(rest):
+                return [_split_arrays(record, f'{path}.{i}', leaves) for i, record in enumerate(rest)]
+            return None
+        return [_split_arrays(item, f'{path}.{i}', leaves) for i, item in enumerate(value)]
+    return value
+
+
+def encode_arrow(payload: Any) -> bytes:
+    pa = _pyarrow()
+    leaves: List[Tuple[str, np.ndarray]] = []
+    rest = _split_arrays(payload, '', leaves)
+    lengths = np.array([len(values) for _, values in leaves], dtype=np.int64)
+    indices = np.repeat(np.arange(len(leaves), dtype=np.int32), lengths)
+    positions = np.concatenate([np.arange(n, dtype=np.int32) for n in lengths]) if len(leaves) else \
+        np.zeros(0, dtype=np.int32)
+    values = np.concatenate([values for _, values in leaves]) if leaves else np.zeros(0)
+    table = pa.table({
+        'path': pa.DictionaryArray.from_arrays(pa.array(indices), pa.array([path for path, _ in leaves], pa.string())),
+        'position': pa.array(positions),
+        'value': pa.array(values)
+    })
+    table = table.replace_schema_metadata({'result': json.dumps(rest, default=_plain)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_payload(payload: Any, fmt: str) -> Tuple[bytes, str]:
+    """Serialize a response payload as Arrow IPC or MessagePack"""
+    if fmt == 'arrow':
+        return encode_arrow(payload), ARROW_MIMETYPE
+    return _msgpack().packb(payload, default=_plain, use_bin_type=True), MSGPACK_MIMETYPE
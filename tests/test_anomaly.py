@@ -0,0 +1,57 @@
+import math
+
+import numpy as np
+import pytest
+
+from services.anomaly import DEFAULT_WINDOW, _rolling, detect_anomalies
+from services.columnar import ingest_dataset
+
+
+def naive_rolling(values, window):
+    """Residual of each value against the sample mean/std of up to `window` previous non-null values"""
+    min_periods = max(3, window // 2)
+    scores = []
+    for i, value in enumerate(values):
+        previous = [v for v in values[max(0, i - window):i] if v is not None]
+        if value is None or len(previous) < min_periods:
+            scores.append(math.nan)
+            continue
+        mean = sum(previous) / len(previous)
+        std = math.sqrt(sum((v - mean) ** 2 for v in previous) / (len(previous) - 1))
+        scores.append(math.nan if std < 1e-12 else (value - mean) / std)
+    return scores
+
+
+def series(n, nulls=False):
+    rng = np.random.default_rng(n)
+    values = (np.sin(np.arange(n) / 3) * 10 + rng.normal(0, 1, n)).tolist()
+    if n > 5:
+        values[n // 2] += 25
+    if nulls:
+        for i in range(1, n, 7):
+            values[i] = None
+    return values
+
+
+def rolling_scores(values, window):
+    block = np.array([[math.nan if v is None else v] for v in values], dtype=np.float64, order='F')
+    nulls = bool(np.isnan(block).any())
+    mean, std = np.nanmean(block, axis=0), np.nanstd(block, axis=0)
+    return _rolling(block, mean, std, window, nulls)[:, 0]
+
+
+@pytest.mark.parametrize('nulls', [False, True])
+@pytest.mark.parametrize('n', [10, 15, 20, 29, 30, 31, 75])
+def test_rolling_matches_naive_loop(n, nulls):
+    # n < window/2, window/2 <= n < window, n == window and n > window for the default window of 30
+    values = series(n, nulls)
+    np.testing.assert_allclose(rolling_scores(values, DEFAULT_WINDOW), naive_rolling(values, DEFAULT_WINDOW),
+                               rtol=1e-7, atol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize('n', [1, 2, 10, 20, 30, 45])
+def test_detect_anomalies_for_any_length(n):
+    result = detect_anomalies(ingest_dataset({'x': series(n)}), window=DEFAULT_WINDOW)
+    rolling = result['columns']['x']['methods']['rolling']
+    expected = sum(1 for score in naive_rolling(series(n), DEFAULT_WINDOW) if abs(score) > 3.0)
+    assert rolling['anomaly_count'] == expected
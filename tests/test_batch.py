@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from services.anomaly import detect_anomalies
+from services.batch import run_batch
+from services.columnar import ingest_dataset
+from services.forecast import forecast_ensemble
+
+
+def frame():
+    rng = np.random.default_rng(0)
+    values = (np.sin(np.arange(60) / 4) * 10 + rng.normal(0, 1, 60)).tolist()
+    values[30] += 40
+    values[7] = None
+    return ingest_dataset([{'day': f'2024-01-{i % 28 + 1:02d}T{i // 28:02d}:00', 'sales': v, 'units': i}
+                           for i, v in enumerate(values)])
+
+
+@pytest.mark.parametrize('analyses', [{'forecast': True}, 3, ['forecast', 1], 'forecast'])
+def test_analyses_must_be_a_list_of_names(analyses):
+    with pytest.raises(ValueError, match='analyses must be a list'):
+        run_batch(frame(), analyses, {'forecast': lambda f, p: None})
+
+
+def test_runners_get_the_profile_computed_once():
+    data = frame()
+    seen = []
+    result = run_batch(data, ['a', 'b', 'a'], {'a': lambda f, p: seen.append(p), 'b': lambda f, p: seen.append(p)})
+    assert result['success'] and len(seen) == 2
+    assert all(profile is result['profile'] for profile in seen)
+
+
+def test_profiled_engines_match_unprofiled_ones():
+    data = frame()
+    profile = data.profile()
+    plain, reused = detect_anomalies(data), detect_anomalies(data, profile=profile)
+    assert plain['columns'] == reused['columns'] and plain['combined'] == reused['combined']
+
+    options = {'horizon': 5, 'frequency': 'day', 'members': ['linear_trend', 'seasonal_naive']}
+    plain, reused = forecast_ensemble(data, **options), forecast_ensemble(data, profile=profile, **options)
+    assert plain['series'] == reused['series']
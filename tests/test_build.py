@@ -0,0 +1,48 @@
+from pathlib import Path
+
+from build import build_assets, css_refs, html_refs
+
+
+def write(root, rel, text):
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(text if isinstance(text, bytes) else text.encode())
+
+
+def site(tmp_path):
+    src = tmp_path / 'src'
+    write(src, 'static/img/a.png', b'a-image')
+    write(src, 'static/img/b.png', b'b-image')
+    write(src, 'static/css/a.css', 'body {\n  background: url("../img/a.png");\n}\n')
+    write(src, 'static/css/b.css', 'p { background: url(/static/img/b.png) }\n')
+    write(src, 'templates/index.html', '<html><head><link href="/static/css/a.css"></head><body>x</body></html>')
+    return src
+
+
+def build(tmp_path, src):
+    return build_assets(src, tmp_path / 'dist', tmp_path / 'cache' / 'manifest.json', jobs=1)
+
+
+def test_references_are_resolved_per_file():
+    assert css_refs('a { background: url("../img/a.png") } b { background: url(data:x) }', 'css/a.css') == \
+        {'img/a.png'}
+    assert html_refs('<link href="/static/css/a.css"><img src="{{ url_for(\'static\', filename=\'i.png\') }}">') \
+        == {'css/a.css', 'i.png'}
+
+
+def test_changing_an_asset_rebuilds_only_files_that_reference_it(tmp_path):
+    src = site(tmp_path)
+    assert build(tmp_path, src)['processed'] == 5
+    write(src, 'static/img/b.png', b'b-image, edited')
+    counts = build(tmp_path, src)
+    # b.png and b.css (its reference changed); a.png, a.css and index.html are untouched
+    assert (counts['processed'], counts['unchanged']) == (2, 3)
+
+
+def test_savings_never_count_reference_rewriting(tmp_path):
+    src = tmp_path / 'src'
+    # Already minimal, so minification saves nothing while the fingerprinted names grow the file
+    write(src, 'static/css/a.css', 'a{background:url(/static/img/a.png)}')
+    write(src, 'static/img/a.png', b'a-image')
+    counts = build(tmp_path, src)
+    assert counts['saved'] == 0
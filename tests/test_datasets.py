@@ -0,0 +1,50 @@
+import os
+
+from services.columnar import ColumnarFrame, ingest_dataset
+from services.datasets import PAYLOAD_FILE, DatasetStore, load_frame
+
+
+ROWS = [
+    {'zip': '01234', 'qty': 1, 'price': 2.5, 'flag': True, 'when': '2024-01-02', 'mixed': 'n/a'},
+    {'zip': '98765', 'qty': 2, 'price': None, 'flag': False, 'when': '2024-01-03T10:00:00', 'mixed': 7},
+]
+
+
+def test_stored_dataset_gives_models_the_payload_as_sent(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    stored = store.put(ingest_dataset(ROWS))
+    frame = store.acquire(stored['dataset_id'])
+    try:
+        assert frame.to_records() == ROWS
+        assert [type(row['qty']) for row in frame.to_records()] == [int, int]
+    finally:
+        store.release(stored['dataset_id'])
+    # Process backend workers open the directory themselves
+    assert load_frame(str(tmp_path / stored['dataset_id'])).to_records() == ROWS
+
+
+def test_ids_distinguish_original_types_and_text(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    ids = {store.put(ingest_dataset([{'v': value}]))['dataset_id'] for value in (1, 1.0, '1', True)}
+    assert len(ids) == 4
+    again = store.put(ingest_dataset([{'v': 1}]))
+    assert again['created'] is False and again['dataset_id'] in ids
+
+
+def test_payload_counts_towards_the_stored_bytes(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    stored = store.put(ingest_dataset(ROWS))
+    directory = tmp_path / stored['dataset_id']
+    assert os.path.exists(directory / PAYLOAD_FILE)
+    assert stored['bytes'] == sum(os.path.getsize(directory / name) for name in os.listdir(directory)
+                                  if name != 'meta.json')
+
+
+def test_columnar_frames_are_stored_without_a_payload(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    columns = ingest_dataset({'x': [1.0, 2.0]}).columns
+    stored = store.put(ColumnarFrame(columns))
+    assert not os.path.exists(tmp_path / stored['dataset_id'] / PAYLOAD_FILE)
+    frame = store.acquire(stored['dataset_id'])
+    assert not frame.has_payload and frame.to_records() == [{'x': 1.0}, {'x': 2.0}]
+    store.release(stored['dataset_id'])
@@ -0,0 +1,65 @@
+import pytest
+
+from services.columnar import canonical_payload, ingest_dataset
+from services.executor import ProcessModelBackend, _rebuild_error, attach_frame, share_frame
+
+
+@pytest.fixture
+def backend():
+    backend = ProcessModelBackend(workers=1, timeout=5)
+    yield backend
+    backend.shutdown()
+
+
+@pytest.mark.parametrize('payload', [[1, 2, 3], {'a': 1}])
+def test_rejected_payloads_do_not_leak_workers(backend, payload):
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            backend.call('chart_recommender', 'analyze', payload)
+    assert backend.stats()['idle_workers'] == 1
+
+
+def test_worker_errors_keep_their_builtin_base():
+    error = _rebuild_error('StreamingError', 'ValueError', 'bad row')
+    assert isinstance(error, ValueError) and str(error) == 'StreamingError: bad row'
+    assert isinstance(_rebuild_error('KeyError', 'KeyError', 'x'), KeyError)
+    assert isinstance(_rebuild_error('UnicodeDecodeError', 'UnicodeDecodeError', 'x'), ValueError)
+    assert type(_rebuild_error('Custom', 'NoSuchBuiltin', 'x')) is RuntimeError
+
+
+def round_trip(payload):
+    shm, layout = share_frame(ingest_dataset(payload))
+    try:
+        rebuilt = attach_frame(shm, layout).payload()
+        return layout, canonical_payload(rebuilt)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_typed_columns_travel_as_buffers_and_rebuild_the_payload():
+    payload = [{'id': i, 'amount': i * 1.5, 'name': f'n{i}', 'flag': i % 2 == 0, 'note': None if i % 3 else 'x'}
+               for i in range(50)]
+    layout, rebuilt = round_trip(payload)
+    assert rebuilt == canonical_payload(payload)
+    assert not any('json' in entry for entry in layout['columns'])
+    assert 'payload' not in layout
+
+
+def test_columns_the_arrays_would_change_travel_as_raw_values():
+    payload = [{'date': '2024-01-0%d' % (i + 1), 'mixed': [1, '1', 1.0, True][i], 'blank': ['', None, 'a', 'b'][i],
+                'v': i} for i in range(4)]
+    layout, rebuilt = round_trip(payload)
+    assert rebuilt == canonical_payload(payload)
+    raw = {entry['name'] for entry in layout['columns'] if 'json' in entry}
+    assert raw == {'date', 'mixed', 'blank'}
+
+
+def test_column_payloads_and_ragged_rows_round_trip():
+    columns = {'a': [1, 2, None], 'b': ['x', 'y', 'z']}
+    layout, rebuilt = round_trip(columns)
+    assert rebuilt == canonical_payload(columns) and layout['shape'] == 'columns'
+
+    ragged = [{'a': 1, 'b': 2}, {'a': 3}]
+    layout, rebuilt = round_trip(ragged)
+    assert rebuilt == canonical_payload(ragged) and 'payload' in layout
@@ -0,0 +1,34 @@
+import numpy as np
+
+import services.forecast as forecast
+from services.columnar import ingest_dataset
+from services.forecast import forecast_ensemble, resample
+
+
+def grouped_rows():
+    rows = []
+    for day in range(1, 29):
+        rows.append({'date': f'2024-02-{day:02d}', 'region': 'early', 'sales': 100.0 + day})
+        if day >= 15:
+            rows.append({'date': f'2024-02-{day:02d}', 'region': 'late', 'sales': 50.0 + day})
+    # A day without sales inside the late series' range
+    return [row for row in rows if not (row['region'] == 'late' and row['date'] == '2024-02-20')]
+
+
+def test_summed_series_are_not_zero_filled_outside_their_history():
+    series = resample(ingest_dataset(grouped_rows()), 'sales', 'region', frequency='day')
+    late = series.values[series.keys.index('late')]
+    assert np.all(late[:14] == 65.0)             # before its first row: its first value
+    assert late[19] == 0.0                       # empty day inside its range: nothing sold
+    assert late[14] == 65.0 and late[-1] == 78.0
+
+
+def test_members_in_worker_processes_match_the_inline_run(monkeypatch):
+    rows = [{'date': f'2024-01-{day:02d}', 'region': region, 'sales': float(day * (i + 1) % 17)}
+            for day in range(1, 32) for i, region in enumerate('abcd')]
+    options = {'horizon': 7, 'series_key': 'region', 'frequency': 'day'}
+    inline = forecast_ensemble(ingest_dataset(rows), **options)
+    monkeypatch.setattr(forecast, 'PARALLEL_MIN_CELLS', 0)
+    monkeypatch.setattr(forecast, 'FORECAST_WORKERS', 2)
+    pooled = forecast_ensemble(ingest_dataset(rows), **options)
+    assert pooled['series'] == inline['series']
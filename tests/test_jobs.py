@@ -0,0 +1,53 @@
+import threading
+import time
+
+from services.jobs import CANCELLED, SUCCEEDED, JobManager
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_stage_reported_while_running_and_final_after():
+    manager = JobManager(workers=1)
+    seen = []
+    gate = threading.Event()
+
+    def run(cancel_event, set_stage):
+        set_stage('model')
+        seen.append(manager.get(job.id).stage)
+        gate.wait(5)
+        return 42
+
+    job = manager.submit('forecast', run)
+    gate.set()
+    wait_until(lambda: job.status == SUCCEEDED)
+    assert seen == ['model']
+    assert job.stage == SUCCEEDED
+    assert 'progress' not in job.to_dict()
+
+
+def test_on_finish_runs_once_after_success_and_failure():
+    manager = JobManager(workers=1)
+    released = []
+    ok = manager.submit('forecast', lambda c, s: 1, on_finish=lambda: released.append('ok'))
+    bad = manager.submit('forecast', lambda c, s: 1 / 0, on_finish=lambda: released.append('bad'))
+    wait_until(lambda: len(released) == 2)
+    assert sorted(released) == ['bad', 'ok']
+
+
+def test_on_finish_runs_when_cancelled_while_queued():
+    manager = JobManager(workers=1)
+    gate = threading.Event()
+    released = []
+    blocker = manager.submit('forecast', lambda c, s: gate.wait(5))
+    queued = manager.submit('forecast', lambda c, s: 1, on_finish=lambda: released.append('queued'))
+    manager.cancel(queued.id)
+    assert queued.status == CANCELLED
+    assert released == ['queued']
+    gate.set()
+    wait_until(lambda: blocker.status == SUCCEEDED)
+    assert released == ['queued']
@@ -0,0 +1,182 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.llm_client import CircuitBreaker, CircuitOpenError, ClientBusyError, UpstreamGuard
+
+
+class StubUpstream:
+    """Local completions server answering with a configurable status and delay"""
+
+    def __init__(self):
+        self.status = 200
+        self.delay = 0.0
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with stub._lock:
+                    stub.requests += 1
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                time.sleep(stub.delay)
+                with stub._lock:
+                    stub.active -= 1
+                body = json.dumps({'choices': [{'message': {'content': 'EVALUATE T'}}]}).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/chat/completions'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def generate(self):
+        """A generator call as the models make it: raises on upstream errors"""
+        request = urllib.request.Request(self.url, data=b'{}', method='POST')
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return {'success': True, 'dax': json.load(response)['choices'][0]['message']['content']}
+
+
+@pytest.fixture
+def stub():
+    upstream = StubUpstream()
+    yield upstream
+    upstream.server.shutdown()
+    upstream.server.server_close()
+
+
+def test_breaker_opens_on_upstream_errors_and_recovers(stub):
+    guard = UpstreamGuard(breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2), max_retries=0)
+    stub.status = 503
+    for _ in range(2):
+        with pytest.raises(urllib.error.HTTPError):
+            guard.call(stub.generate)
+    assert guard.breaker.state == CircuitBreaker.OPEN
+
+    # Open: answered by the fallback without reaching the upstream
+    assert guard.call(stub.generate, fallback=lambda e: {'recovered': True}) == {'recovered': True}
+    with pytest.raises(CircuitOpenError):
+        guard.call(stub.generate)
+    assert stub.requests == 2
+
+    stub.status = 200
+    time.sleep(0.25)
+    assert guard.call(stub.generate)['dax'] == 'EVALUATE T'
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+    assert guard.stats()['failures'] == 2
+
+
+def test_unsuccessful_generator_results_do_not_trip_the_breaker(stub):
+    guard = UpstreamGuard(breaker=CircuitBreaker(failure_threshold=1))
+
+    def generate():
+        stub.generate()
+        return {'success': False, 'error': "Could not understand the requirement"}
+
+    for _ in range(3):
+        assert guard.call(generate)['success'] is False
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+    assert stub.requests == 3
+
+
+def test_concurrency_is_capped_and_excess_callers_time_out(stub):
+    guard = UpstreamGuard(max_concurrency=2, queue_timeout=0.05)
+    stub.delay = 0.3
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(guard.call(stub.generate)['success'])
+        except ClientBusyError:
+            outcomes.append('busy')
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stub.max_active == 2
+    assert sorted(outcomes, key=str) == [True, True, 'busy', 'busy']
+    assert guard.stats()['busy_rejections'] == 2
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retryable_errors_are_retried_as_one_breaker_call(stub):
+    guard = UpstreamGuard(breaker=CircuitBreaker(failure_threshold=1), max_retries=2,
+                          backoff_base=0.01, backoff_max=0.02)
+    stub.status = 503
+    with pytest.raises(urllib.error.HTTPError):
+        guard.call(stub.generate)
+    assert stub.requests == 3
+    assert guard.stats()['retries'] == 2
+
+    # One failed call, one breaker failure however many attempts it took
+    assert guard.breaker.failures == 1
+
+
+def test_retry_succeeds_after_transient_errors(stub):
+    guard = UpstreamGuard(max_retries=3, backoff_base=0.01, backoff_max=0.02)
+    stub.status = 429
+
+    def generate():
+        if stub.requests == 2:
+            stub.status = 200
+        return stub.generate()
+
+    assert guard.call(generate)['dax'] == 'EVALUATE T'
+    assert stub.requests == 3
+    assert guard.breaker.failures == 0
+
+
+def test_client_errors_are_not_retried(stub):
+    guard = UpstreamGuard(max_retries=3, backoff_base=0.01)
+    stub.status = 400
+    with pytest.raises(urllib.error.HTTPError):
+        guard.call(stub.generate)
+    assert stub.requests == 1
+
+
+def test_backoff_is_capped_and_jittered():
+    guard = UpstreamGuard(backoff_base=0.5, backoff_max=2.0)
+    delays = [guard._backoff(10) for _ in range(200)]
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_slow_call_is_hedged_and_first_answer_wins():
+    guard = UpstreamGuard(hedge_after=0.05)
+    calls = []
+
+    def generate():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return {'success': True, 'attempt': 'first'}
+        return {'success': True, 'attempt': 'hedge'}
+
+    started = time.monotonic()
+    assert guard.call(generate)['attempt'] == 'hedge'
+    assert time.monotonic() - started < 0.4
+    stats = guard.stats()
+    assert stats['hedges'] == 1 and stats['hedge_wins'] == 1
+
+
+def test_fast_call_is_not_hedged():
+    guard = UpstreamGuard(hedge_after=0.5)
+    assert guard.call(lambda: {'success': True})['success'] is True
+    assert guard.stats()['hedges'] == 0
@@ -0,0 +1,98 @@
+import pytest
+
+from minify import MinifyError, minify_css, minify_html, minify_js
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('var s = "a // b /* c */";', 'var s="a // b /* c */";'),
+    ("a = '\\'' + \"\\\"\"", "a='\\''+\"\\\"\""),
+    ('s = "x  y"', 's="x  y"'),
+])
+def test_js_strings_are_kept_verbatim(source, expected):
+    assert minify_js(source) == expected
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('x = a / b / c;', 'x=a/b/c;'),
+    ('r = /[/]\\/ *x/g.test(s)', 'r=/[/]\\/ *x/g.test(s)'),
+    ('if (a) /re/.test(b)', 'if(a)/re/.test(b)'),
+    ('return /a b/.source', 'return/a b/.source'),
+    # After an identifier on the next line, `/` is division, not a regex
+    ('x = y\n/z/g.exec(w)', 'x=y/z/g.exec(w)'),
+])
+def test_js_regexes_and_division(source, expected):
+    assert minify_js(source) == expected
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('t = `a ${ `b ${c} d` } e // f`;', 't=`a ${`b ${c} d`} e // f`;'),
+    ('a = `x ${ "}" } y`', 'a=`x ${"}"} y`'),
+    ('f = `${ {a: 1}.a }  ${ (() => { return 2 })() }`', 'f=`${{a:1}.a}  ${(()=>{return 2})()}`'),
+])
+def test_js_template_nesting(source, expected):
+    assert minify_js(source) == expected
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('return\nx', 'return\nx'),
+    ('throw\nnew Error()', 'throw\nnew Error()'),
+    ('a = b\n++c', 'a=b\n++c'),
+    ('x = a++\n+b', 'x=a++\n+b'),
+    ('let x = 1\nlet y = 2', 'let x=1\nlet y=2'),
+    # No semicolon is inserted before `(`, so this really is a call
+    ('a = b\n(c)', 'a=b(c)'),
+    ('a = b +\n  c', 'a=b+c'),
+])
+def test_js_line_breaks_kept_where_asi_depends_on_them(source, expected):
+    assert minify_js(source) == expected
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('a - -b', 'a- -b'),
+    ('a + +b', 'a+ +b'),
+    ('1 .toString()', '1 .toString()'),
+    ('typeof x in y', 'typeof x in y'),
+])
+def test_js_tokens_never_merge(source, expected):
+    assert minify_js(source) == expected
+
+
+@pytest.mark.parametrize('source', ['"abc', '/abc', '/* x', '`abc', '`abc ${ x'])
+def test_js_unterminated_input_raises(source):
+    with pytest.raises(MinifyError):
+        minify_js(source)
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('a { content: "/* not */ a , b" ; color: red ; }', 'a{content:"/* not */ a , b";color:red}'),
+    ('@media (max-width: 10px) { a { width: calc(100% - 2px) } }', '@media (max-width:10px){a{width:calc(100% - 2px)}}'),
+    ('a { background: url( "x y.png" ) }', 'a{background:url("x y.png")}'),
+    ('/*! keep */a{}/* drop */', '/*! keep */a{}'),
+])
+def test_css(source, expected):
+    assert minify_css(source) == expected
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('<p>Hello <!-- x --> world</p>', '<p>Hello world</p>'),
+    ('<p>a<!-- x -->b</p>', '<p>ab</p>'),
+    ('<div>\n  <p> Hi </p>\n</div>', '<div><p>Hi</p></div>'),
+    ('<div> <span>a</span> b </div>', '<div><span>a</span> b</div>'),
+    ('<p>x <b>bold</b>  y</p>', '<p>x <b>bold</b> y</p>'),
+    # Inline and replaced elements keep the space beside them
+    ('<label>Pick <select><option>A</option></select> now</label>',
+     '<label>Pick <select><option>A</option></select> now</label>'),
+    ('line<br> next', 'line<br> next'),
+    ('Watch <video src="v.mp4"></video> here', 'Watch <video src="v.mp4"></video> here'),
+    # Text is only trimmed against a directly adjacent block tag
+    ('<p>a <em>b</em> </p>', '<p>a <em>b</em></p>'),
+    ('<p>a { b }  c</p>', '<p>a { b } c</p>'),
+    ('<p>{{ name }}  and {% if x %} y {% endif %}</p>', '<p>{{ name }} and {% if x %} y {% endif %}</p>'),
+    ('<pre>  keep\n  this </pre>', '<pre>  keep\n  this </pre>'),
+    ('<textarea> a  b </textarea> c', '<textarea> a  b </textarea> c'),
+    ('<!--[if IE]><p>x</p><![endif]-->', '<!--[if IE]><p>x</p><![endif]-->'),
+    ('<script>\n  var a = 1 ;\n</script>', '<script>var a=1;</script>'),
+])
+def test_html_whitespace(source, expected):
+    assert minify_html(source) == expected
+    assert minify_html(expected) == expected
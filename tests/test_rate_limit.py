@@ -0,0 +1,14 @@
+from services.rate_limit import RateLimiter, create_rate_limiter
+
+
+def test_rate_limiting_is_off_unless_enabled(monkeypatch):
+    monkeypatch.delenv('RATE_LIMIT_ENABLED', raising=False)
+    assert not create_rate_limiter().enabled
+    monkeypatch.setenv('RATE_LIMIT_ENABLED', 'true')
+    assert create_rate_limiter().enabled
+
+
+def test_each_client_key_has_its_own_bucket():
+    limiter = RateLimiter(limits={'light': 2})
+    assert [limiter.acquire('client:a', 'light')[0] for _ in range(3)] == [True, True, False]
+    assert limiter.acquire('client:b', 'light')[0]
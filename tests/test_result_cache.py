@@ -0,0 +1,31 @@
+import pytest
+
+from services.result_cache import ResultCache, make_key
+
+
+@pytest.mark.parametrize('first, second', [
+    ([{'zip': '01234'}], [{'zip': '1234'}]),
+    ([{'zip': '1234'}], [{'zip': 1234}]),
+    ([{'zip': 1234}], [{'zip': 1234.0}]),
+    ([{'d': '2024-01-01'}], [{'d': '2024-01-01T00:00:00.000'}]),
+    ([{'a': 1, 'b': 2}], [{'b': 2, 'a': 1}]),
+    ([{'flag': True}], [{'flag': 1}]),
+    ([{'s': ''}], [{'s': None}]),
+    ({'zip': ['01234']}, {'zip': [1234]}),
+])
+def test_payloads_models_see_differently_get_different_keys(first, second):
+    assert make_key('forecast', first) != make_key('forecast', second)
+
+
+def test_identical_payloads_share_a_key():
+    rows = [{'date': '2024-01-01', 'sales': 10, 'region': 'N'}]
+    assert make_key('forecast', rows, {'horizon': 3}) == make_key('forecast', [dict(r) for r in rows], {'horizon': 3})
+    assert make_key('forecast', rows, {'horizon': 3}) != make_key('forecast', rows, {'horizon': 4})
+    assert make_key('forecast', rows) != make_key('generate-insights', rows)
+
+
+def test_cached_result_is_not_served_for_another_payload():
+    cache = ResultCache()
+    cache.put(make_key('insights', [{'zip': '01234'}]), {'success': True, 'zip': '01234'})
+    assert cache.get(make_key('insights', [{'zip': 1234}])) == (False, None)
+    assert cache.get(make_key('insights', [{'zip': '01234'}]))[0]
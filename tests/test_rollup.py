@@ -0,0 +1,31 @@
+import pytest
+
+from services.columnar import ingest_dataset
+from services.rollup import RollupCache, RollupError, parse_options, rollup_frame
+
+
+def sales(n):
+    return ingest_dataset([{'date': f'2024-01-{i % 28 + 1:02d}', 'store': 'AB'[i % 2], 'note': f'n{i}',
+                            'units': float(i), 'price': 2.0} for i in range(n)])
+
+
+@pytest.mark.parametrize('source', [{}, {'rollup': ''}, {'rollup': 'none'}, {'rollup': 'off'},
+                                    {'rollup_by': 'store', 'top_series': 5}])
+def test_no_rollup_unless_requested(source):
+    assert parse_options(source) is None
+
+
+def test_large_inputs_are_not_rolled_up_implicitly():
+    frame = sales(500)
+    assert RollupCache().get_or_build(frame, parse_options({})) == (frame, None)
+
+
+def test_requested_rollup_reports_dropped_columns():
+    rolled, summary = rollup_frame(sales(100), 'day', group_by=['store'], measures=['units'])
+    assert set(rolled.columns) == {'date', 'store', 'units'}
+    assert summary['dropped_columns'] == ['note', 'price']
+
+
+def test_unknown_granularity_is_rejected():
+    with pytest.raises(RollupError):
+        parse_options({'rollup': 'fortnight'})
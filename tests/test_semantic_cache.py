@@ -0,0 +1,45 @@
+import pytest
+
+from services.semantic_cache import SemanticCache
+
+
+def cached(cache, requirement):
+    calls = []
+    result = cache.get_or_generate('dax', requirement, lambda: calls.append(requirement) or {'dax': requirement})
+    return result, bool(calls)
+
+
+@pytest.mark.parametrize('first, second', [
+    ("total sales excluding returns", "total sales including returns"),
+    ("count orders where status is not cancelled", "count orders where status is cancelled"),
+    ("top 5 products by revenue", "top 10 products by revenue"),
+    ("average price by region", "average cost by region"),
+    ("total sales by region", "region by total sales"),
+])
+def test_near_misses_are_generated_again(first, second):
+    cache = SemanticCache()
+    cached(cache, first)
+    result, generated = cached(cache, second)
+    assert generated
+    assert result == {'dax': second}
+
+
+@pytest.mark.parametrize('first, second', [
+    ("Show me the sum of sales per region", "total sales by region"),
+    ("Average order values by month", "avg order value monthly"),
+    ("total sales by region by month", "total sales by month by region"),
+])
+def test_rephrasings_reuse_the_cached_result(first, second):
+    cache = SemanticCache()
+    cached(cache, first)
+    result, generated = cached(cache, second)
+    assert not generated
+    assert result == {'dax': first}
+
+
+def test_evicted_entries_are_no_longer_candidates():
+    cache = SemanticCache(max_entries=1)
+    cached(cache, "total sales by region by month")
+    cached(cache, "count orders by store")
+    _, generated = cached(cache, "total sales by month by region")
+    assert generated
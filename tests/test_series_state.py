@@ -0,0 +1,64 @@
+import pytest
+
+from services.columnar import ingest_dataset
+from services.series_state import SeriesStateError, SeriesStore
+
+
+def batch(*rows):
+    return ingest_dataset([{'date': date, 'Sales': sales} for date, sales in rows])
+
+
+def test_batches_are_folded_in_timestamp_order():
+    shuffled, ordered = SeriesStore(), SeriesStore()
+    rows = [(f'2024-01-{day:02d}', float(day * day)) for day in range(1, 11)]
+    shuffled.append('u', 's', batch(*reversed(rows)))
+    ordered.append('u', 's', batch(*rows))
+    assert shuffled.get('u', 's').columns['Sales'].to_list() == pytest.approx(
+        ordered.get('u', 's').columns['Sales'].to_list())
+    assert shuffled.get('u', 's').watermark.startswith('2024-01-10')
+
+
+def test_rows_not_newer_than_the_watermark_are_skipped():
+    store = SeriesStore()
+    store.append('u', 's', batch(('2024-01-01', 1.0), ('2024-01-02', 2.0), ('2024-01-03', 3.0)))
+    update = store.append('u', 's', batch(('2024-01-03', 30.0), ('2024-01-02', 20.0), ('2024-01-04', 4.0)))
+    assert update['new_rows'] == 1
+    assert update['skipped_rows'] == 2
+    assert store.get('u', 's').columns['Sales'].count == 4
+
+
+def test_null_timestamps_are_skipped_in_every_batch():
+    store = SeriesStore()
+    first = store.append('u', 's', batch(('2024-01-01', 1.0), (None, 9.0), ('2024-01-02', 2.0)))
+    later = store.append('u', 's', batch((None, 9.0), ('2024-01-03', 3.0)))
+    assert (first['new_rows'], first['skipped_rows']) == (2, 1)
+    assert (later['new_rows'], later['skipped_rows']) == (1, 1)
+
+
+def test_later_batches_must_carry_the_time_column():
+    store = SeriesStore()
+    store.append('u', 's', batch(('2024-01-01', 1.0)))
+    with pytest.raises(SeriesStateError):
+        store.append('u', 's', ingest_dataset([{'Sales': 2.0}]))
+
+
+def test_series_are_scoped_to_their_owner():
+    store = SeriesStore()
+    store.append('alice', 's', batch(('2024-01-01', 1.0), ('2024-01-02', 2.0)))
+    with pytest.raises(SeriesStateError):
+        store.get('bob', 's')
+    assert not store.delete('bob', 's')
+    store.append('bob', 's', batch(('2024-01-01', 100.0)))
+    assert store.get('alice', 's').rows == 2
+    assert store.get('bob', 's').rows == 1
+
+
+def test_snapshot_round_trip_keeps_owner_and_order(tmp_path):
+    path = str(tmp_path / 'series.json')
+    store = SeriesStore(path=path)
+    store.append('alice', 's', batch(('2024-01-02', 2.0), ('2024-01-01', 1.0)))
+    store.save()
+    restored = SeriesStore(path=path)
+    state = restored.get('alice', 's')
+    assert (state.time_column, state.rows) == ('date', 2)
+    assert restored.append('alice', 's', batch(('2024-01-02', 5.0)))['new_rows'] == 0
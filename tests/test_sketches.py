@@ -0,0 +1,28 @@
+import pytest
+
+from services.columnar import ingest_dataset
+from services.sketches import EXACT_MAX_ROWS, ProfileModeError, choose_profile_mode, sketch_profile
+
+
+def test_exact_profiling_is_the_default_even_for_large_inputs():
+    assert choose_profile_mode(None, EXACT_MAX_ROWS * 10) == 'exact'
+    assert choose_profile_mode('', EXACT_MAX_ROWS * 10) == 'exact'
+
+
+def test_sampling_is_opt_in():
+    assert choose_profile_mode('auto', EXACT_MAX_ROWS) == 'exact'
+    assert choose_profile_mode('auto', EXACT_MAX_ROWS + 1) == 'sketch'
+    assert choose_profile_mode('SKETCH', 10) == 'sketch'
+    with pytest.raises(ProfileModeError):
+        choose_profile_mode('sampled', 10)
+
+
+def test_sketch_totals_cover_every_row_not_the_sample():
+    values = [float(i) for i in range(5000)]
+    profile, sample = sketch_profile(ingest_dataset({'x': values}), sample_size=100, chunk_rows=512)
+    stats = profile['columns']['x']
+    assert len(sample) == profile['sample_rows'] == 100
+    assert profile['rows'] == stats['count'] == 5000
+    assert stats['sum'] == sum(values)
+    assert (stats['min'], stats['max']) == (0.0, 4999.0)
+    assert stats['mean'] == pytest.approx(sum(values) / len(values))
@@ -0,0 +1,27 @@
+import pytest
+
+import services.wire as wire
+from services.wire import negotiate, unacceptable
+
+ARROW = 'application/vnd.apache.arrow.stream'
+
+
+@pytest.fixture
+def no_pyarrow(monkeypatch):
+    monkeypatch.setattr(wire, 'format_available', lambda fmt: fmt != 'arrow')
+
+
+def test_negotiate_prefers_the_highest_quality_format():
+    assert negotiate(f'{ARROW}, application/json;q=0.5') == 'arrow'
+    assert negotiate('application/json', 'application/msgpack') is None
+    assert negotiate('text/html', 'application/msgpack') == 'msgpack'
+    assert unacceptable(ARROW) is None
+
+
+def test_missing_libraries_fall_back_to_json_or_refuse(no_pyarrow):
+    assert negotiate(f'{ARROW}, application/json;q=0.5') is None
+    assert negotiate(f'{ARROW}, application/msgpack;q=0.5') == 'msgpack'
+    assert negotiate('', ARROW) is None
+    assert unacceptable(ARROW) == 'arrow'
+    assert unacceptable(f'{ARROW}, */*;q=0.1') is None
+    assert unacceptable('text/html') is None